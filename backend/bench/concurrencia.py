@@ -0,0 +1,131 @@
+# ------------------------------------------------------------------------------
+# Benchmark de concurrencia: threadpool (DB_ASYNC=false) contra asyncpg (DB_ASYNC=true).
+# Lanza ráfagas de peticiones concurrentes contra un servidor ya levantado y
+# mide peticiones por segundo y latencias. Con el threadpool el rendimiento deja
+# de crecer cerca de 40 peticiones en vuelo (el límite por defecto de AnyIO),
+# porque cada petición ocupa un hilo mientras espera a la base; con asyncpg sigue
+# creciendo hasta que se agota el pool de conexiones o la base.
+#
+# Uso (dos corridas, una por modo):
+#   DB_ASYNC=false uvicorn main:app --port 8000 &
+#   python bench/concurrencia.py --url http://localhost:8000 --salida threadpool.json
+#   DB_ASYNC=true  uvicorn main:app --port 8000 &
+#   python bench/concurrencia.py --url http://localhost:8000 --salida asyncpg.json
+#
+# Con --recomendar la ráfaga es de POST /api/recomendar (respuestas al azar de
+# /factors-values, casi sin aciertos de cache), que es CPU y corre en el
+# threadpool. Con --tras-escritura, antes de cada nivel se vuelve a guardar una
+# regla sin cambios (PUT /reglas/{id}): la ráfaga llega a una instantánea nueva
+# sin motor de puntaje y todas sus peticiones esperan la misma construcción.
+# Con más peticiones en vuelo que hilos (40) las que no tienen hilo deben
+# esperar en el event loop, no ocupar uno cada una (usar una base de PRUEBAS):
+#   python bench/concurrencia.py --recomendar --tras-escritura --concurrencias 20 40 200 400
+# ------------------------------------------------------------------------------
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+try:
+    import httpx
+except ImportError:  # solo lo necesita el benchmark, no la aplicación
+    httpx = None
+
+
+async def rafaga(cliente, pedir, concurrencia: int, peticiones: int) -> dict:
+    latencias, errores = [], 0
+    pendientes = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for _ in pendientes:
+            inicio = time.perf_counter()
+            try:
+                respuesta = await pedir(cliente)
+                if respuesta.status_code >= 400:
+                    errores += 1
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    total = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "concurrencia": concurrencia,
+        "peticiones": peticiones,
+        "errores": errores,
+        "por_segundo": round(peticiones / total, 1),
+        "p50_ms": round(statistics.median(latencias), 2),
+        "p95_ms": round(latencias[int(len(latencias) * 0.95) - 1], 2),
+    }
+
+
+async def pedido_recomendar(cliente, semilla: int):
+    """POST /api/recomendar con respuestas al azar entre los valores de las reglas."""
+    factores = (await cliente.get("/factors-values")).json()
+    azar = random.Random(semilla)
+
+    async def pedir(c):
+        respuestas = {f["nombre"]: azar.choice(f["valores"]) for f in factores if f["valores"] and azar.random() < 0.7}
+        return await c.post("/api/recomendar", json=respuestas)
+
+    return pedir
+
+
+async def escribir(cliente) -> None:
+    """Vuelve a guardar la primera regla tal cual: publica una versión nueva sin cambiar datos."""
+    reglas = (await cliente.get("/reglas/", params={"limit": 1})).json()
+    if not reglas:
+        raise SystemExit("--tras-escritura necesita al menos una regla")
+    regla = reglas[0]
+    campos = {k: regla[k] for k in ("factor_id", "hecho_id", "operador", "valor")}
+    (await cliente.put(f"/reglas/{regla['id']}", json=campos)).raise_for_status()
+
+
+async def main(args) -> list:
+    limites = httpx.Limits(max_connections=max(args.concurrencias), max_keepalive_connections=max(args.concurrencias))
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as cliente:
+        if args.recomendar:
+            pedir = await pedido_recomendar(cliente, args.semilla)
+        else:
+            async def pedir(c):
+                return await c.get(args.ruta)
+        await pedir(cliente)  # calentamiento
+        resultados = []
+        for concurrencia in args.concurrencias:
+            if args.tras_escritura:
+                await escribir(cliente)
+            resultado = await rafaga(cliente, pedir, concurrencia, max(args.peticiones, concurrencia))
+            print(
+                f"⚡ {concurrencia:>4} en vuelo: {resultado['por_segundo']:>8} req/s  "
+                f"p50 {resultado['p50_ms']} ms  p95 {resultado['p95_ms']} ms  errores {resultado['errores']}"
+            )
+            resultados.append(resultado)
+        return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--ruta", default="/reglas/?limit=50", help="endpoint que consulta la base en cada petición")
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=[10, 40, 80, 160, 320])
+    parser.add_argument("--peticiones", type=int, default=2000, help="peticiones por nivel de concurrencia")
+    parser.add_argument("--recomendar", action="store_true", help="ráfagas de POST /api/recomendar en lugar de --ruta")
+    parser.add_argument("--tras-escritura", action="store_true", help="publica una versión nueva antes de cada nivel")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    args = parser.parse_args()
+    if httpx is None:
+        raise SystemExit("El benchmark necesita httpx: pip install httpx")
+
+    resultados = asyncio.run(main(args))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            ruta = "/api/recomendar" if args.recomendar else args.ruta
+            json.dump(
+                {"url": args.url, "ruta": ruta, "tras_escritura": args.tras_escritura, "resultados": resultados}, f, indent=2
+            )
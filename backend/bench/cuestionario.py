@@ -0,0 +1,166 @@
+# ------------------------------------------------------------------------------
+# Driver de carga del cuestionario guiado.
+# Cada usuario virtual repite sesiones completas como las hace
+# frontend/static/recomendaciones.js: POST /api/pregunta-siguiente paso a paso
+# (con el token ?sesion= de la respuesta anterior), elige una opción al azar de
+# cada pregunta, a veces vuelve atrás, y al final POST /api/recomendar con todas
+# las respuestas. Con --usuarios se fija la concurrencia (lazo cerrado: cada
+# usuario espera su respuesta antes de seguir) y --pensar agrega una pausa
+# exponencial entre pasos, como una persona leyendo.
+# Reporta peticiones por segundo y latencias p50/p95/p99 por paso.
+#
+# Uso (contra un servidor levantado, p. ej. con una base de bench/sintetico.py):
+#   python -m bench.cuestionario --url http://localhost:8000 --usuarios 50 --duracion 60
+# ------------------------------------------------------------------------------
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+try:
+    import httpx
+except ImportError:  # solo lo necesita el benchmark, no la aplicación
+    httpx = None
+
+MAX_PASOS = 20  # corta sesiones que nunca terminan (no debería pasar)
+
+
+def orden_paso(paso: str) -> tuple:
+    """pregunta-siguiente #1, #2, ..., #10 y al final recomendar."""
+    _, _, numero = paso.partition("#")
+    return (0, int(numero)) if numero else (1, 0)
+
+
+class Metricas:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.sesiones = 0
+
+    def registrar(self, paso: str, segundos: float, ok: bool) -> None:
+        self.latencias[paso].append(segundos * 1000)
+        if not ok:
+            self.errores[paso] += 1
+
+    def resumen(self, duracion: float) -> dict:
+        def percentil(valores, p):
+            return round(valores[min(int(len(valores) * p), len(valores) - 1)], 2)
+
+        pasos = {}
+        for paso, valores in sorted(self.latencias.items(), key=lambda kv: orden_paso(kv[0])):
+            valores = sorted(valores)
+            pasos[paso] = {
+                "peticiones": len(valores),
+                "errores": self.errores[paso],
+                "por_segundo": round(len(valores) / duracion, 1),
+                "p50_ms": percentil(valores, 0.50),
+                "p95_ms": percentil(valores, 0.95),
+                "p99_ms": percentil(valores, 0.99),
+            }
+        total = sum(len(v) for v in self.latencias.values())
+        return {
+            "duracion_s": round(duracion, 1),
+            "sesiones": self.sesiones,
+            "sesiones_por_segundo": round(self.sesiones / duracion, 2),
+            "peticiones_por_segundo": round(total / duracion, 1),
+            "pasos": pasos,
+        }
+
+
+async def llamar(cliente, metricas: Metricas, paso: str, ruta: str, cuerpo: dict):
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.post(ruta, json=cuerpo)
+        ok = respuesta.status_code < 400
+    except httpx.HTTPError:
+        respuesta, ok = None, False
+    metricas.registrar(paso, time.perf_counter() - inicio, ok)
+    return respuesta.json() if ok else None
+
+
+async def sesion(cliente, rnd: random.Random, metricas: Metricas, args) -> None:
+    respuestas, historial, token = {}, [], None
+    for numero in range(1, MAX_PASOS + 1):
+        ruta = "/api/pregunta-siguiente" + (f"?sesion={token}" if token else "")
+        datos = await llamar(cliente, metricas, f"pregunta-siguiente #{numero}", ruta, respuestas)
+        if datos is None:
+            return
+        token = datos.get("sesion")
+        pregunta = datos.get("pregunta")
+        if not pregunta or not pregunta.get("options"):
+            break
+        if args.pensar:
+            await asyncio.sleep(rnd.expovariate(1 / args.pensar))
+        if historial and rnd.random() < args.atras:
+            respuestas.pop(historial.pop(), None)  # botón "Atrás"
+            continue
+        respuestas[pregunta["id"]] = rnd.choice(pregunta["options"])["v"]
+        historial.append(pregunta["id"])
+    if await llamar(cliente, metricas, "recomendar", "/api/recomendar", respuestas) is not None:
+        metricas.sesiones += 1
+
+
+async def usuario(cliente, rnd: random.Random, metricas: Metricas, args, fin: float, restantes: list) -> None:
+    while time.perf_counter() < fin and restantes[0] != 0:
+        restantes[0] -= 1
+        await sesion(cliente, rnd, metricas, args)
+
+
+async def esperar_listo(cliente, espera_max: float) -> None:
+    """Espera a que /ready dé 200 (caches calientes) para no medir el arranque."""
+    fin = time.perf_counter() + espera_max
+    while time.perf_counter() < fin:
+        respuesta = await cliente.get("/ready")
+        if respuesta.status_code in (200, 404):  # 404: servidor sin /ready
+            return
+        await asyncio.sleep(0.5)
+    print("⚠️ El servidor no quedó listo; se mide igual")
+
+
+async def main(args) -> dict:
+    metricas = Metricas()
+    limites = httpx.Limits(max_connections=args.usuarios, max_keepalive_connections=args.usuarios)
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as cliente:
+        await esperar_listo(cliente, args.esperar_listo)
+        await cliente.post("/api/pregunta-siguiente", json={})  # calentamiento
+        restantes = [args.sesiones or -1]  # -1: sin límite, solo --duracion
+        inicio = time.perf_counter()
+        await asyncio.gather(
+            *(
+                usuario(cliente, random.Random(f"{args.semilla}-{i}"), metricas, args, inicio + args.duracion, restantes)
+                for i in range(args.usuarios)
+            )
+        )
+        return metricas.resumen(time.perf_counter() - inicio)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga con sesiones completas del cuestionario")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--usuarios", type=int, default=50, help="sesiones en paralelo (concurrencia objetivo)")
+    parser.add_argument("--duracion", type=float, default=60, help="segundos de carga")
+    parser.add_argument("--sesiones", type=int, default=0, help="cortar tras N sesiones (0 = solo por duración)")
+    parser.add_argument("--pensar", type=float, default=0, help="pausa media entre pasos, en segundos")
+    parser.add_argument("--atras", type=float, default=0.1, help="probabilidad de volver atrás en cada paso")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--esperar-listo", type=float, default=120, help="segundos máximos esperando /ready")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    args = parser.parse_args()
+    if httpx is None:
+        raise SystemExit("El driver necesita httpx: pip install httpx")
+
+    resultado = asyncio.run(main(args))
+    print(
+        f"⚡ {resultado['sesiones']} sesiones en {resultado['duracion_s']}s "
+        f"({resultado['sesiones_por_segundo']}/s, {resultado['peticiones_por_segundo']} req/s)"
+    )
+    for paso, r in resultado["pasos"].items():
+        print(
+            f"   {paso:<24} {r['por_segundo']:>8} req/s  p50 {r['p50_ms']:>8} ms  "
+            f"p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  errores {r['errores']}"
+        )
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"url": args.url, "usuarios": args.usuarios, **resultado}, f, indent=2, ensure_ascii=False)
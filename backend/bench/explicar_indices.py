@@ -0,0 +1,134 @@
+# ------------------------------------------------------------------------------
+# Verificación de índices con EXPLAIN.
+# Carga una base de reglas sintética grande, corre EXPLAIN ANALYZE sobre las
+# consultas calientes de factorhecho y revisa que cada una use su índice
+# (migración 2 de db/migraciones.py) y no un Seq Scan de la tabla.
+# Todo ocurre dentro de una transacción que se deshace al final: los datos
+# sintéticos nunca quedan en la base, aunque se corra contra una con datos.
+#
+# Uso (con las migraciones aplicadas):
+#   python -m bench.explicar_indices --reglas 200000
+# Sale con código 1 si alguna consulta no usa el índice esperado.
+# ------------------------------------------------------------------------------
+import argparse
+import json
+import sys
+
+from sqlalchemy import exists, select, text
+
+from db.models.factor_hecho import FactorHecho
+from db.models.hecho import Hecho
+
+_SQL_SINTETICOS = [
+    """INSERT INTO factor (nombre, categoria)
+       SELECT 'factor-' || i, 'cat-' || (i % 10) FROM generate_series(1, :factores) i""",
+    """INSERT INTO hecho (descripcion)
+       SELECT 'cultivo-' || i FROM generate_series(1, :hechos) i""",
+    """INSERT INTO factorhecho (factor_id, hecho_id, operador, valor)
+       SELECT f.min_id + (i % :factores), h.min_id + ((i * 7919) % :hechos),
+              (ARRAY['=', '>=', '<=', '='])[1 + i % 4], 'Valor-' || ((i * 31) % 5000)
+       FROM generate_series(1, :reglas) i,
+            (SELECT min(id) AS min_id FROM factor WHERE nombre LIKE 'factor-%') f,
+            (SELECT min(id) AS min_id FROM hecho WHERE descripcion LIKE 'cultivo-%') h""",
+    "ANALYZE factor",
+    "ANALYZE hecho",
+    "ANALYZE factorhecho",
+]
+
+
+def consultas(factor_id: int, hecho_id: int) -> list:
+    """(nombre, prefijo del índice esperado, consulta) con las mismas formas que los endpoints.
+
+    Con solo factor_id el planificador puede elegir cualquiera de los dos índices
+    compuestos que empiezan por factor_id; ambos sirven.
+    """
+    from main import filtrar_reglas  # los filtros reales de /reglas/
+
+    columnas = (FactorHecho.id, FactorHecho.factor_id, FactorHecho.hecho_id, FactorHecho.operador, FactorHecho.valor)
+
+    def reglas(**filtros):
+        filtros = {"factor_id": None, "hecho_id": None, "operador": None, "valor": None, **filtros}
+        return filtrar_reglas(select(*columnas), **filtros).order_by(FactorHecho.id).limit(51)
+
+    return [
+        ("reglas de un factor y un hecho", "ix_factorhecho_factor_hecho", reglas(factor_id=factor_id, hecho_id=hecho_id)),
+        ("reglas por prefijo de valor", "ix_factorhecho_valor_lower", reglas(valor="valor-123")),
+        ("reglas de un hecho", "ix_factorhecho_hecho", reglas(hecho_id=hecho_id)),
+        (
+            "hechos con reglas del factor",
+            "ix_factorhecho_factor_",
+            select(Hecho.id, Hecho.descripcion).where(
+                exists().where(FactorHecho.hecho_id == Hecho.id, FactorHecho.factor_id == factor_id)
+            ),
+        ),
+        (
+            "valores distintos de un factor",
+            "ix_factorhecho_factor_",
+            select(FactorHecho.valor).where(FactorHecho.factor_id == factor_id).distinct(),
+        ),
+        (
+            "regla duplicada (carga masiva)",
+            "ix_factorhecho_factor_",
+            select(FactorHecho.id).where(
+                FactorHecho.factor_id == factor_id,
+                FactorHecho.hecho_id == hecho_id,
+                FactorHecho.operador == "=",
+                FactorHecho.valor == "Valor-0",
+            ),
+        ),
+    ]
+
+
+def nodos(plan: dict):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from nodos(hijo)
+
+
+def explicar(conn, consulta) -> dict:
+    compilada = consulta.compile(conn)
+    fila = conn.exec_driver_sql("EXPLAIN (ANALYZE, FORMAT JSON) " + str(compilada), compilada.params).scalar()
+    plan = (json.loads(fila) if isinstance(fila, str) else fila)[0]
+    pasos = list(nodos(plan["Plan"]))
+    return {
+        # los Bitmap Index Scan no traen "Relation Name": se filtra por el nombre del índice
+        "indices": sorted({n["Index Name"] for n in pasos if n.get("Index Name", "").startswith("ix_factorhecho")}),
+        "seq_scan": any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "factorhecho" for n in pasos),
+        "ms": round(plan["Execution Time"], 3),
+    }
+
+
+def main(args) -> bool:
+    from core.session import engine
+
+    ok = True
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            parametros = {"factores": args.factores, "hechos": args.hechos, "reglas": args.reglas}
+            for sentencia in _SQL_SINTETICOS:
+                conn.execute(text(sentencia), parametros)
+            factor_id = conn.execute(text("SELECT min(id) FROM factor WHERE nombre LIKE 'factor-%'")).scalar()
+            hecho_id = conn.execute(text("SELECT min(id) FROM hecho WHERE descripcion LIKE 'cultivo-%'")).scalar()
+            print(f"📦 Datos sintéticos: {args.factores} factores, {args.hechos} hechos, {args.reglas} reglas")
+
+            for nombre, esperado, consulta in consultas(factor_id, hecho_id):
+                resultado = explicar(conn, consulta)
+                usa = any(i.startswith(esperado) for i in resultado["indices"]) and not resultado["seq_scan"]
+                ok = ok and usa
+                print(
+                    f"{'✅' if usa else '❌'} {nombre:<32} {resultado['ms']:>9} ms  "
+                    f"{', '.join(resultado['indices']) or 'Seq Scan'}"
+                )
+        finally:
+            trans.rollback()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica con EXPLAIN que las consultas de reglas usen índices")
+    parser.add_argument("--factores", type=int, default=200)
+    parser.add_argument("--hechos", type=int, default=5000)
+    parser.add_argument("--reglas", type=int, default=200000)
+    args = parser.parse_args()
+    sys.exit(0 if main(args) else 1)
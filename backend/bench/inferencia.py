@@ -0,0 +1,214 @@
+# ------------------------------------------------------------------------------
+# Benchmark reproducible del motor de inferencia.
+# Para cada escenario (cantidad de hechos x cantidad de factores) arma una base
+# de reglas sintética (bench/sintetico.py) con semilla fija en una base de datos local de pruebas y
+# mide cada punto de entrada:
+#   cargar_base          lectura de las tablas a la instantánea (en frío)
+#   preparar             índices de puntaje y flujo de preguntas sobre la instantánea
+#   evaluar_condicion    una condición contra una respuesta (por llamada)
+#   /api/preguntas, /api/recomendar, /api/pregunta-siguiente   extremo a extremo, en caliente
+# con latencias (media, p50, p95) y consultas SQL por llamada. El resultado va a
+# un JSON; --comparar marca las regresiones contra una corrida anterior.
+#
+# ¡Borra factor, hecho y factorhecho de la base indicada! Usar una base de pruebas:
+#   python -m bench.inferencia --url postgresql://localhost/bench --salida actual.json
+#   python -m bench.inferencia --url ... --salida nuevo.json --comparar actual.json
+# ------------------------------------------------------------------------------
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from fastapi.testclient import TestClient
+except (ImportError, RuntimeError):  # TestClient necesita httpx, que la aplicación no usa
+    TestClient = None
+
+from bench.sintetico import Distribucion, generar_reglas, generar_respuestas
+from core.config import settings
+from core.deps import BDHilos, get_bd
+from db.carga_reglas import cargar
+from db.migraciones import migrar
+from motor.base_reglas import cargar_base, invalidar_base, obtener_base
+from motor.condiciones import evaluar_condicion
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias que el engine manda a la base."""
+
+    def __init__(self, engine):
+        self.total = 0
+        event.listen(engine, "before_cursor_execute", self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+
+def resumen(tiempos: list, consultas: int) -> dict:
+    tiempos = sorted(tiempos)
+    return {
+        "n": len(tiempos),
+        "media_ms": round(statistics.fmean(tiempos), 4),
+        "p50_ms": round(statistics.median(tiempos), 4),
+        "p95_ms": round(tiempos[min(int(len(tiempos) * 0.95), len(tiempos) - 1)], 4),
+        "consultas": round(consultas / len(tiempos), 2),
+    }
+
+
+def medir(fn, argumentos: list, contador: ContadorConsultas) -> dict:
+    tiempos = []
+    antes = contador.total
+    for arg in argumentos:
+        inicio = time.perf_counter()
+        fn(arg)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumen(tiempos, contador.total - antes)
+
+
+def escenario(args, engine, Sesion, contador, cliente, hechos: int, factores: int) -> dict:
+    rnd = random.Random(f"{args.semilla}-{hechos}-{factores}")
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE factorhecho, hecho, factor RESTART IDENTITY CASCADE"))
+    db = Sesion()
+    try:
+        inicio = time.perf_counter()
+        distribucion = Distribucion(hechos=hechos, factores=factores)
+        cargados = cargar(db, generar_reglas(rnd, distribucion))
+        print(f"📦 {hechos} hechos x {factores} factores: {cargados['reglas']} reglas ({time.perf_counter() - inicio:.1f}s)")
+        respuestas = generar_respuestas(rnd, distribucion, args.repeticiones)
+        resultados = {}
+
+        def en_frio(_):
+            invalidar_base()
+            obtener_base(db)
+
+        resultados["cargar_base"] = medir(en_frio, range(args.repeticiones_carga), contador)
+        bases = [cargar_base(db) for _ in range(args.repeticiones_carga)]
+        resultados["preparar"] = medir(lambda base: base.preparar(), bases, contador)
+
+        condiciones = list(bases[0].condiciones.values())
+        pares = [
+            (c.operador, c.valor, r.get(c.factor_nombre, ""))
+            for c, r in zip(rnd.choices(condiciones, k=args.repeticiones * 50), respuestas * 50)
+        ]
+        inicio = time.perf_counter()
+        for operador, valor, respuesta in pares:
+            evaluar_condicion(operador, valor, respuesta)
+        por_llamada = (time.perf_counter() - inicio) * 1000 / len(pares)
+        resultados["evaluar_condicion"] = {"n": len(pares), "media_ms": round(por_llamada, 6), "consultas": 0}
+    finally:
+        db.close()
+
+    # extremo a extremo, con la instantánea ya cargada y preparada
+    invalidar_base()
+    cliente.get("/api/preguntas")
+    resultados["/api/preguntas"] = medir(lambda _: cliente.get("/api/preguntas"), range(args.repeticiones), contador)
+    resultados["/api/recomendar"] = medir(lambda r: cliente.post("/api/recomendar", json=r), respuestas, contador)
+    resultados["/api/pregunta-siguiente"] = medir(
+        lambda r: cliente.post("/api/pregunta-siguiente", json={k: v for k, v in r.items() if k in ("altitud", "clima", "suelo")}),
+        respuestas,
+        contador,
+    )
+    for nombre, r in resultados.items():
+        print(f"   {nombre:<26} media {r['media_ms']:>10} ms  p50 {r.get('p50_ms', '-'):>9}  consultas {r['consultas']}")
+    return {"hechos": hechos, "factores": factores, "reglas": cargados["reglas"], "resultados": resultados}
+
+
+def comparar(actual: dict, anterior: dict, umbral: float) -> list:
+    """Puntos de entrada cuya media empeoró más que el umbral (o que hacen más consultas)."""
+    previos = {(e["hechos"], e["factores"]): e["resultados"] for e in anterior["escenarios"]}
+    regresiones = []
+    for e in actual["escenarios"]:
+        for nombre, r in e["resultados"].items():
+            antes = previos.get((e["hechos"], e["factores"]), {}).get(nombre)
+            if not antes:
+                continue
+            razon = r["media_ms"] / antes["media_ms"] if antes["media_ms"] else 1.0
+            peor = razon > umbral or r["consultas"] > antes["consultas"]
+            print(
+                f"{'❌' if peor else '✅'} {e['hechos']:>6}x{e['factores']:<3} {nombre:<26} "
+                f"{antes['media_ms']:>10} -> {r['media_ms']:>10} ms (x{razon:.2f}), "
+                f"consultas {antes['consultas']} -> {r['consultas']}"
+            )
+            if peor:
+                regresiones.append((e["hechos"], e["factores"], nombre))
+    return regresiones
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(args) -> dict:
+    from main import app
+
+    engine = create_engine(args.url)
+    Sesion = sessionmaker(bind=engine, autoflush=False)
+    contador = ContadorConsultas(engine)
+    migrar(engine)
+
+    def bd_bench():
+        db = Sesion()
+        try:
+            yield BDHilos(db)
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_bd] = bd_bench
+    cliente = TestClient(app)  # sin "with": no corre el arranque (lifespan) contra la base configurada
+    escenarios = []
+    try:
+        for hechos in args.hechos:
+            for factores in args.factores:
+                escenarios.append(escenario(args, engine, Sesion, contador, cliente, hechos, factores))
+    finally:
+        app.dependency_overrides.pop(get_bd, None)
+        invalidar_base()
+        engine.dispose()
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit_actual(),
+            "python": platform.python_version(),
+            "motor": settings.MOTOR_RECOMENDACION,
+            "semilla": args.semilla,
+            "repeticiones": args.repeticiones,
+        },
+        "escenarios": escenarios,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del motor de inferencia con bases sintéticas")
+    parser.add_argument("--url", required=True, help="base de datos de PRUEBAS (se vacían las tablas de reglas)")
+    parser.add_argument("--hechos", type=int, nargs="+", default=[50, 1000, 20000])
+    parser.add_argument("--factores", type=int, nargs="+", default=[3, 30])
+    parser.add_argument("--repeticiones", type=int, default=200, help="llamadas por endpoint")
+    parser.add_argument("--repeticiones-carga", type=int, default=3, help="cargas en frío de la instantánea")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--umbral", type=float, default=1.2, help="razón de la media que cuenta como regresión")
+    args = parser.parse_args()
+    if TestClient is None:
+        raise SystemExit("El benchmark necesita httpx: pip install httpx")
+
+    resultado = main(args)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(resultado, json.load(f), args.umbral)
+        sys.exit(1 if regresiones else 0)
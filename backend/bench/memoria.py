@@ -0,0 +1,161 @@
+# ------------------------------------------------------------------------------
+# Benchmark de memoria de la base de reglas.
+# Para cada escenario (hechos x factores, bases de bench/sintetico.py) mide con
+# tracemalloc los bytes por regla que quedan retenidos en:
+#   orm                  Factor, Hecho y FactorHecho como instancias del ORM en
+#                        una sesión abierta (lo que hacía el motor antes de la
+#                        instantánea: identity map, estado y textos por fila)
+#   instantanea          BaseReglas (tuplas con textos compartidos y predicados
+#                        compilados), lo que usan los endpoints de inferencia
+#   indices_numericos    IndiceNumerico de cada factor (arreglos de cotas e ids)
+#   puntaje              matriz de NumPy o índice de bits según MOTOR_RECOMENDACION
+#   flujo                flujo de preguntas precalculado (solo con --flujo: es lento)
+# y el pico de memoria durante cargar_base.
+#
+# Por defecto usa una SQLite en memoria; con --url, una base de PRUEBAS (se
+# vacían factor, hecho y factorhecho):
+#   python -m bench.memoria --hechos 1000 20000 --factores 3 10 --salida memoria.json
+# ------------------------------------------------------------------------------
+import argparse
+import gc
+import json
+import platform
+import random
+import tracemalloc
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from bench.inferencia import commit_actual
+from bench.sintetico import Distribucion, generar_reglas
+from core.base_class import Base
+from core.config import settings
+from db.models.factor import Factor
+from db.models.hecho import Hecho
+from db.models.factor_hecho import FactorHecho
+from motor.base_reglas import cargar_base
+
+
+def llenar(engine, filas: list) -> int:
+    """Inserta las filas de generar_reglas en factor, hecho y factorhecho (cualquier motor)."""
+    factores, hechos = {}, {}
+    for _, nombre, categoria, hecho, _, _ in filas:
+        factores.setdefault(nombre, (len(factores) + 1, categoria))
+        hechos.setdefault(hecho, len(hechos) + 1)
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("TRUNCATE factorhecho, hecho, factor RESTART IDENTITY CASCADE"))
+        else:
+            for tabla in ("factorhecho", "hecho", "factor"):
+                conn.execute(text(f"DELETE FROM {tabla}"))
+        conn.execute(
+            insert(Factor),
+            [{"id": i, "nombre": n, "categoria": c} for n, (i, c) in factores.items()],
+        )
+        conn.execute(insert(Hecho), [{"id": i, "descripcion": d} for d, i in hechos.items()])
+        conn.execute(
+            insert(FactorHecho),
+            [
+                {"id": linea, "factor_id": factores[nombre][0], "hecho_id": hechos[hecho], "operador": op, "valor": valor}
+                for linea, nombre, _, hecho, op, valor in filas
+            ],
+        )
+        if engine.dialect.name == "postgresql":
+            for tabla in ("factor", "hecho", "factorhecho"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), (SELECT max(id) FROM {tabla}))"))
+    return len(filas)
+
+
+def retenido(fn):
+    """(resultado de fn(), bytes que siguen reservados mientras se conserva el resultado, pico)."""
+    gc.collect()
+    tracemalloc.reset_peak()
+    antes = tracemalloc.get_traced_memory()[0]
+    resultado = fn()
+    gc.collect()
+    actual, pico = tracemalloc.get_traced_memory()
+    return resultado, actual - antes, pico - antes
+
+
+def escenario(args, engine, Sesion, hechos: int, factores: int) -> dict:
+    distribucion = Distribucion(hechos=hechos, factores=factores, alternativas=(1, args.alternativas))
+    reglas = llenar(engine, generar_reglas(random.Random(f"{args.semilla}-{hechos}-{factores}"), distribucion))
+    por_regla = {}
+
+    with Sesion() as db:
+        _, bytes_orm, _ = retenido(
+            lambda: (db.query(Factor).all(), db.query(Hecho).all(), db.query(FactorHecho).all())
+        )
+    por_regla["orm"] = bytes_orm / reglas
+
+    with Sesion() as db:
+        base, bytes_base, pico = retenido(lambda: cargar_base(db))
+    por_regla["instantanea"] = bytes_base / reglas
+    numericos = {c.factor_nombre for c in base.condiciones.values() if c.predicado.tipo != "igualdad" and c.factor_nombre}
+    _, bytes_indices, _ = retenido(lambda: [base.indice_de_nombre(n) for n in numericos])
+    por_regla["indices_numericos"] = bytes_indices / reglas
+    _, bytes_puntaje, _ = retenido(lambda: base.puntaje)
+    por_regla["puntaje"] = bytes_puntaje / reglas
+    if args.flujo:
+        _, bytes_flujo, _ = retenido(lambda: base.flujo)
+        por_regla["flujo"] = bytes_flujo / reglas
+
+    por_regla = {k: round(v, 1) for k, v in por_regla.items()}
+    print(f"📦 {hechos} hechos x {factores} factores: {reglas} reglas")
+    for nombre, valor in por_regla.items():
+        print(f"   {nombre:<20} {valor:>10} B/regla")
+    print(f"   {'pico cargar_base':<20} {pico / reglas:>10.1f} B/regla")
+    return {
+        "hechos": hechos,
+        "factores": factores,
+        "reglas": reglas,
+        "bytes_por_regla": por_regla,
+        "pico_cargar_base": round(pico / reglas, 1),
+    }
+
+
+def main(args) -> dict:
+    engine = create_engine(args.url)
+    if engine.dialect.name == "postgresql":
+        from db.migraciones import migrar
+
+        migrar(engine)
+    else:
+        Base.metadata.create_all(engine)
+    Sesion = sessionmaker(bind=engine, autoflush=False)
+    tracemalloc.start()
+    try:
+        escenarios = [
+            escenario(args, engine, Sesion, hechos, factores) for hechos in args.hechos for factores in args.factores
+        ]
+    finally:
+        tracemalloc.stop()
+        engine.dispose()
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit_actual(),
+            "python": platform.python_version(),
+            "motor": settings.MOTOR_RECOMENDACION,
+            "semilla": args.semilla,
+        },
+        "escenarios": escenarios,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memoria por regla de la base de reglas en el ORM y en la instantánea")
+    parser.add_argument("--url", default="sqlite://", help="base de PRUEBAS (por defecto SQLite en memoria)")
+    parser.add_argument("--hechos", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--factores", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--alternativas", type=int, default=2, help="máximo de reglas por hecho y factor")
+    parser.add_argument("--flujo", action="store_true", help="mide también el flujo de preguntas (lento)")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    resultado = main(args)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
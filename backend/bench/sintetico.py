@@ -0,0 +1,148 @@
+# ------------------------------------------------------------------------------
+# Generador de bases de conocimiento sintéticas.
+# Llena factor, hecho y factorhecho con reglas parecidas a las reales, con
+# distribuciones configurables:
+#   - Altitud (numérico): mezcla de operadores con pesos (=, >=, <=, ...); con "="
+#     el valor es un rango "min-max" de ancho aleatorio, con el resto un número.
+#   - Clima, Suelo y los factores extra (categóricos): N valores por factor,
+#     uniformes o con sesgo tipo Zipf (pocos valores muy comunes, como en la
+#     base real).
+#   - cobertura (qué tan seguido un hecho tiene regla sobre un factor),
+#     alternativas por hecho y factor, y una fracción de reglas con valor vacío.
+# La semilla fija hace que la misma configuración genere siempre la misma base.
+# La carga usa db.carga_reglas.cargar (COPY), así que 100k reglas tardan segundos.
+#
+# Uso:
+#   python -m bench.sintetico --url postgresql://localhost/bench --limpiar \
+#       --hechos 5000 --factores 8 --operadores "=:6,>=:2,<=:2" --sesgo 1.1
+# ------------------------------------------------------------------------------
+import argparse
+import random
+from typing import Dict, List, NamedTuple, Tuple
+
+FACTORES_FLUJO = ("Altitud", "Clima", "Suelo")  # los que pregunta /api/pregunta-siguiente
+
+
+class Distribucion(NamedTuple):
+    hechos: int = 1000
+    factores: int = 3                          # los primeros son Altitud, Clima y Suelo
+    cobertura: float = 0.8                     # probabilidad de regla por hecho y factor
+    alternativas: Tuple[int, int] = (1, 1)     # reglas por hecho y factor (mín, máx)
+    operadores: Dict[str, float] = {"=": 6, ">=": 2, "<=": 2}  # pesos para la altitud
+    altitud: Tuple[int, int] = (0, 4000)
+    ancho_rango: Tuple[int, int] = (200, 1500)
+    valores_por_factor: int = 8
+    sesgo: float = 0.0                         # 0 = uniforme; >0 = exponente Zipf
+    vacios: float = 0.0                        # fracción de reglas con valor vacío
+
+    def nombres(self) -> List[str]:
+        extra = [f"Factor {i}" for i in range(len(FACTORES_FLUJO) + 1, self.factores + 1)]
+        return list(FACTORES_FLUJO[: self.factores]) + extra
+
+    def pesos_valores(self) -> List[float]:
+        return [1 / (i + 1) ** self.sesgo for i in range(self.valores_por_factor)]
+
+
+def valor_categorico(nombre: str, indice: int) -> str:
+    return f"{nombre.lower()} {indice}"
+
+
+def valor_altitud(rnd: random.Random, d: Distribucion, operador: str) -> str:
+    paso = 50
+    base = rnd.randrange(d.altitud[0], d.altitud[1], paso)
+    if operador == "=":
+        return f"{base}-{base + rnd.randrange(d.ancho_rango[0], d.ancho_rango[1] + paso, paso)}"
+    return str(base)
+
+
+def generar_reglas(rnd: random.Random, d: Distribucion) -> List[tuple]:
+    """Filas (linea, factor, categoria, hecho, operador, valor) para db.carga_reglas.cargar."""
+    operadores, pesos_operadores = zip(*d.operadores.items())
+    valores = range(d.valores_por_factor)
+    pesos_valores = d.pesos_valores()
+    filas = []
+    for h in range(1, d.hechos + 1):
+        hecho = f"Cultivo {h}"
+        for nombre in d.nombres():
+            if rnd.random() >= d.cobertura:
+                continue
+            for _ in range(rnd.randint(*d.alternativas)):
+                if nombre == "Altitud":
+                    operador = rnd.choices(operadores, pesos_operadores)[0]
+                    valor = valor_altitud(rnd, d, operador)
+                else:
+                    operador = "="
+                    valor = valor_categorico(nombre, rnd.choices(valores, pesos_valores)[0])
+                if rnd.random() < d.vacios:
+                    valor = ""
+                categoria = "numerico" if nombre == "Altitud" else "categorico"
+                filas.append((len(filas) + 1, nombre, categoria, hecho, operador, valor))
+    return filas
+
+
+def generar_respuestas(rnd: random.Random, d: Distribucion, cantidad: int, probabilidad: float = 0.7) -> List[dict]:
+    """Respuestas completas (como las que llegan a /api/recomendar), con las mismas distribuciones."""
+    valores = range(d.valores_por_factor)
+    pesos_valores = d.pesos_valores()
+    respuestas = []
+    for _ in range(cantidad):
+        r = {}
+        for nombre in d.nombres():
+            if rnd.random() >= probabilidad:
+                continue
+            if nombre == "Altitud":
+                r["altitud"] = str(rnd.randrange(d.altitud[0], d.altitud[1], 50))
+            else:
+                r[nombre.lower()] = valor_categorico(nombre, rnd.choices(valores, pesos_valores)[0])
+        respuestas.append(r)
+    return respuestas
+
+
+def pesos(texto: str) -> Dict[str, float]:
+    """"=:6,>=:2,<=:2" -> {"=": 6.0, ">=": 2.0, "<=": 2.0}"""
+    resultado = {}
+    for parte in texto.split(","):
+        operador, _, peso = parte.rpartition(":")
+        resultado[operador.strip()] = float(peso)
+    return resultado
+
+
+def par(texto: str) -> Tuple[int, int]:
+    minimo, _, maximo = texto.partition("-")
+    return int(minimo), int(maximo or minimo)
+
+
+if __name__ == "__main__":
+    defecto = Distribucion()
+    parser = argparse.ArgumentParser(description="Llena la base con reglas sintéticas")
+    parser.add_argument("--url", required=True, help="base de datos de PRUEBAS")
+    parser.add_argument("--limpiar", action="store_true", help="vacía factor, hecho y factorhecho antes de cargar")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--hechos", type=int, default=defecto.hechos)
+    parser.add_argument("--factores", type=int, default=defecto.factores)
+    parser.add_argument("--cobertura", type=float, default=defecto.cobertura)
+    parser.add_argument("--alternativas", type=par, default=defecto.alternativas, help="mín-máx, ej. 1-2")
+    parser.add_argument("--operadores", type=pesos, default=defecto.operadores, help='ej. "=:6,>=:2,<=:2"')
+    parser.add_argument("--altitud", type=par, default=defecto.altitud, help="mín-máx, ej. 0-4000")
+    parser.add_argument("--ancho-rango", type=par, default=defecto.ancho_rango, help="mín-máx, ej. 200-1500")
+    parser.add_argument("--valores-por-factor", type=int, default=defecto.valores_por_factor)
+    parser.add_argument("--sesgo", type=float, default=defecto.sesgo, help="0 = uniforme, 1.1 = Zipf")
+    parser.add_argument("--vacios", type=float, default=defecto.vacios)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+
+    from db.carga_reglas import cargar
+    from db.migraciones import migrar
+
+    distribucion = Distribucion(**{campo: getattr(args, campo) for campo in Distribucion._fields})
+    engine = create_engine(args.url)
+    migrar(engine)
+    if args.limpiar:
+        with engine.begin() as conn:
+            conn.execute(text("TRUNCATE factorhecho, hecho, factor RESTART IDENTITY CASCADE"))
+    filas = generar_reglas(random.Random(args.semilla), distribucion)
+    with Session(engine) as db:
+        resultado = cargar(db, filas)
+    print(f"✅ {resultado['factores']} factores, {resultado['hechos']} hechos, {resultado['reglas']} reglas")
@@ -0,0 +1,97 @@
+# ------------------------------------------------------------------------------
+# Hash y verificación de contraseñas.
+# bcrypt es CPU puro (cientos de ms por hash): corre en un pool de procesos
+# propio y acotado (HASH_PROCESOS procesos, hasta HASH_COLA tareas esperando),
+# así una ráfaga de logins no ocupa el threadpool ni el event loop. Si la cola
+# está llena se rechaza con 503 en vez de acumular peticiones.
+# El costo (BCRYPT_ROUNDS) es configurable; verificar() usa verify_and_update,
+# que devuelve un hash nuevo cuando el guardado tiene otro costo o un esquema
+# obsoleto, para rehashear en el login.
+# ------------------------------------------------------------------------------
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from core.config import settings
+
+# min = max = default: cualquier hash con otro costo "necesita actualización"
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+try:
+    _ = pwd_context.hash("probe")
+except Exception as e:
+    print("⚠️ bcrypt falló, usando sha256_crypt:", repr(e))
+    pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain: str, hashed: str) -> bool:
+    try:
+        return pwd_context.verify(plain, hashed)
+    except Exception:
+        return False
+
+def verificar_y_actualizar(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(válida, hash nuevo o None si el guardado sigue vigente)."""
+    try:
+        return pwd_context.verify_and_update(plain, hashed)
+    except Exception:
+        return False, None
+
+
+class PoolClaves:
+    def __init__(self, procesos: int, cola: int):
+        self.procesos = procesos
+        self._cupos = threading.BoundedSemaphore(procesos + cola)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # se crea con el primer uso; "spawn" evita hacer fork de un proceso con hilos
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    async def _ejecutar(self, fn, *args):
+        if not self._cupos.acquire(blocking=False):
+            raise HTTPException(
+                status_code=503,
+                detail="Demasiadas solicitudes de autenticación, intenta de nuevo en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            futuro = self._pool().submit(fn, *args)
+        except BaseException:
+            self._cupos.release()
+            raise
+        futuro.add_done_callback(lambda _: self._cupos.release())
+        return await asyncio.wrap_future(futuro)
+
+    async def hash(self, password: str) -> str:
+        return await self._ejecutar(get_password_hash, password)
+
+    async def verificar(self, plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self._ejecutar(verificar_y_actualizar, plain, hashed)
+
+    def cerrar(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+claves = PoolClaves(settings.HASH_PROCESOS, settings.HASH_COLA)
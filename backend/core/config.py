@@ -16,5 +16,68 @@ class Settings:
     POSTGRES_PORT : str = os.getenv("POSTGRES_PORT",5432) # default postgres port is 5432
     POSTGRES_DB : str = os.getenv("POSTGRES_DB","tdd")
     DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}?sslmode=require&channel_binding=require"
+    # misma base con el driver asyncpg (el SSL se pide en connect_args, ver core/session.py)
+    ASYNC_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+    # pool de conexiones (por proceso/worker, se aplica a los motores sync y async).
+    # Neon suspende las conexiones inactivas: pre_ping descarta las muertas antes
+    # de usarlas y recycle las renueva antes de que el servidor las corte.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 300))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "si")
+
+    # contraseñas: costo de bcrypt (los hashes con otro costo se rehashean al iniciar sesión)
+    # y pool de procesos que los calcula: procesos y tareas que pueden esperar en cola
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    HASH_PROCESOS: int = int(os.getenv("HASH_PROCESOS", 2))
+    HASH_COLA: int = int(os.getenv("HASH_COLA", 64))
+
+    # arranque: aplicar las migraciones pendientes (db/migraciones.py) al iniciar
+    # (desactivar si se corren aparte en el deploy) y espera máxima (segundos)
+    # entre reintentos del calentamiento si la base no responde
+    MIGRAR_AL_ARRANCAR: bool = os.getenv("MIGRAR_AL_ARRANCAR", "true").lower() in ("1", "true", "si")
+    ARRANQUE_REINTENTO_MAX: float = float(os.getenv("ARRANQUE_REINTENTO_MAX", 30))
+
+    # traza SQL: consultas por petición antes de registrarla y marcarla con la
+    # cabecera X-Presupuesto-SQL, y umbral (ms) para registrar una consulta lenta
+    CONSULTAS_PRESUPUESTO: int = int(os.getenv("CONSULTAS_PRESUPUESTO", 10))
+    CONSULTA_LENTA_MS: float = float(os.getenv("CONSULTA_LENTA_MS", 200))
+
+    # endpoints async: "true" consulta con AsyncSession (asyncpg, sin hilos);
+    # si no, las consultas síncronas corren en el threadpool
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "si")
+
+    # motor de puntaje de /api/recomendar: "numpy" (vectorizado) o "bits" (índice invertido)
+    MOTOR_RECOMENDACION: str = os.getenv("MOTOR_RECOMENDACION", "numpy")
+
+    # sesiones del cuestionario guiado: máximo en memoria y vencimiento (segundos)
+    SESIONES_MAX: int = int(os.getenv("SESIONES_MAX", 10000))
+    SESIONES_TTL: int = int(os.getenv("SESIONES_TTL", 1800))
+
+    # cache de resultados de /api/recomendar: máximo de entradas (0 = sin cache) y vencimiento (segundos)
+    RECOMENDAR_CACHE_MAX: int = int(os.getenv("RECOMENDAR_CACHE_MAX", 5000))
+    RECOMENDAR_CACHE_TTL: int = int(os.getenv("RECOMENDAR_CACHE_TTL", 600))
+
+    # invalidación entre workers (LISTEN/NOTIFY, ver core/invalidacion.py). La
+    # escucha necesita una conexión de sesión: con Neon, la URL directa (sin -pooler).
+    INVALIDACION_ESCUCHAR: bool = os.getenv("INVALIDACION_ESCUCHAR", "true").lower() in ("1", "true", "si")
+    INVALIDACION_URL: str = os.getenv("INVALIDACION_URL", "")  # vacía = DATABASE_URL
+    INVALIDACION_SONDEO: float = float(os.getenv("INVALIDACION_SONDEO", 5))  # segundos entre sondeos de la versión
+    INVALIDACION_RECARGAR: bool = os.getenv("INVALIDACION_RECARGAR", "true").lower() in ("1", "true", "si")
+
+    # directorio de la instantánea binaria de la base de reglas compartida entre
+    # workers (motor/instantanea.py); vacío = cada worker carga desde la base
+    INSTANTANEA_DIR: str = os.getenv("INSTANTANEA_DIR", "")
+    # segundos que un worker espera el archivo que está escribiendo otro antes de
+    # cargar él mismo de la base (y edad a partir de la cual una reserva se da por abandonada)
+    INSTANTANEA_ESPERA: float = float(os.getenv("INSTANTANEA_ESPERA", 60))
+
+    # máximo de nodos del flujo de preguntas precalculado por versión de la base
+    FLUJO_MAX_NODOS: int = int(os.getenv("FLUJO_MAX_NODOS", 50000))
+
+    # tamaño máximo de página (?limit=) de los listados /reglas/, /hechos/ y /factores/
+    PAGINA_MAX: int = int(os.getenv("PAGINA_MAX", 500))
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,120 @@
+# ------------------------------------------------------------------------------
+# Traza de consultas SQL por petición.
+# trazar(engine) engancha before/after_cursor_execute del engine: cada sentencia
+# suma a la petición en curso (cantidad y tiempo en la base) y las que pasan de
+# CONSULTA_LENTA_MS se registran con sus parámetros (los hashes de contraseña
+# se ocultan). La petición en curso vive en un ContextVar que pone el
+# middleware PresupuestoConsultas; el threadpool, asyncio.to_thread y run_sync
+# copian el contexto, así que las consultas hechas ahí también cuentan.
+# Las peticiones que pasan de CONSULTAS_PRESUPUESTO se registran y llevan la
+# cabecera X-Presupuesto-SQL: así un N+1 nuevo aparece en staging.
+# ------------------------------------------------------------------------------
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from core.config import settings
+
+LARGO_SQL = 500          # caracteres de la sentencia en el registro de consultas lentas
+LARGO_PARAMETROS = 300
+
+
+class ConsultasPeticion:
+    __slots__ = ("total", "segundos")
+
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+
+
+_actual: ContextVar[Optional[ConsultasPeticion]] = ContextVar("consultas_peticion", default=None)
+
+# acumulados por (método, ruta) para /metrics
+consultas_por_ruta: Dict[Tuple[str, str], int] = defaultdict(int)
+segundos_por_ruta: Dict[Tuple[str, str], float] = defaultdict(float)
+excedidas_por_ruta: Dict[Tuple[str, str], int] = defaultdict(int)
+
+
+def _ocultar(valor):
+    if isinstance(valor, str) and valor.startswith(("$2a$", "$2b$", "$2y$", "$5$")):
+        return "***"
+    return valor
+
+
+def _parametros(parametros) -> str:
+    if isinstance(parametros, dict):
+        parametros = {k: "***" if "password" in k else _ocultar(v) for k, v in parametros.items()}
+    elif isinstance(parametros, (list, tuple)):
+        parametros = [_ocultar(v) for v in parametros]
+    texto = repr(parametros)
+    return texto if len(texto) <= LARGO_PARAMETROS else texto[:LARGO_PARAMETROS] + "…"
+
+
+def trazar(engine) -> None:
+    """Cuenta y cronometra las sentencias del engine (sync, o el sync_engine de uno async)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+        conn.info.setdefault("inicios_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+        segundos = time.perf_counter() - conn.info["inicios_consulta"].pop()
+        peticion = _actual.get()
+        if peticion is not None:
+            peticion.total += 1
+            peticion.segundos += segundos
+        if segundos * 1000 >= settings.CONSULTA_LENTA_MS:
+            sql = " ".join(sentencia.split())
+            print(
+                f"🐢 Consulta lenta ({segundos * 1000:.1f} ms): {sql[:LARGO_SQL]}"
+                f" | parámetros: {_parametros(parametros)}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        # si la sentencia falla no hay after_cursor_execute: se descarta su inicio
+        conexion = contexto.connection
+        if conexion is not None and conexion.info.get("inicios_consulta"):
+            conexion.info["inicios_consulta"].pop()
+
+
+class PresupuestoConsultas:
+    """Middleware ASGI: abre la cuenta de consultas de cada petición y la revisa al final."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        peticion = ConsultasPeticion()
+        token = _actual.set(peticion)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and peticion.total > settings.CONSULTAS_PRESUPUESTO:
+                cabeceras = MutableHeaders(scope=mensaje)
+                cabeceras["X-Presupuesto-SQL"] = (
+                    f"excedido; consultas={peticion.total}; ms={peticion.segundos * 1000:.1f}"
+                )
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            if peticion.total:
+                # el router deja la ruta resuelta en el scope (plantilla, no la URL concreta)
+                clave = (scope["method"], getattr(scope.get("route"), "path", "sin_ruta"))
+                consultas_por_ruta[clave] += peticion.total
+                segundos_por_ruta[clave] += peticion.segundos
+                if peticion.total > settings.CONSULTAS_PRESUPUESTO:
+                    excedidas_por_ruta[clave] += 1
+                    print(
+                        f"⚠️ {scope['method']} {scope['path']} hizo {peticion.total} consultas "
+                        f"({peticion.segundos * 1000:.1f} ms en la base), presupuesto {settings.CONSULTAS_PRESUPUESTO}"
+                    )
@@ -4,12 +4,72 @@
 # usando SQLAlchemy. Gracias a Depends(get_db), FastAPI inyecta automáticamente
 # esta sesión en los endpoints que la necesiten y se encarga de cerrarla al final.
 # Esto asegura un manejo limpio de las conexiones y evita fugas o bloqueos.
+#
+# get_bd() es lo que usan los endpoints async: el código de consultas sigue
+# siendo el mismo (síncrono, con Session) y BD.ejecutar() lo corre con
+# AsyncSession.run_sync (asyncpg) cuando settings.DB_ASYNC está activo, o en
+# el threadpool si no.
 # ------------------------------------------------------------------------------
-from core.session import SessionLocal
+from abc import ABC, abstractmethod
+
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.session import AsyncSessionLocal, SessionLocal
+from motor.base_reglas import BaseReglas, accesos, base_vigente, obtener_base, obtener_base_async
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+class BD(ABC):
+    """Acceso a la base para endpoints async."""
+
+    @abstractmethod
+    async def ejecutar(self, fn, *args):
+        """Devuelve fn(session, *args) sin bloquear el event loop mientras espera a la base."""
+
+    @abstractmethod
+    async def base(self) -> BaseReglas:
+        """Instantánea vigente de la base de reglas, cargándola si hace falta."""
+
+
+class BDHilos(BD):
+    def __init__(self, db):
+        self.db = db
+
+    async def ejecutar(self, fn, *args):
+        return await run_in_threadpool(fn, self.db, *args)
+
+    async def base(self) -> BaseReglas:
+        base = base_vigente()
+        if base is not None:
+            return accesos.acierto(base)
+        return await run_in_threadpool(obtener_base, self.db)
+
+
+class BDAsincrona(BD):
+    def __init__(self, db):
+        self.db = db
+
+    async def ejecutar(self, fn, *args):
+        return await self.db.run_sync(fn, *args)
+
+    async def base(self) -> BaseReglas:
+        return await obtener_base_async(self.db)
+
+
+async def get_bd():
+    if settings.DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield BDAsincrona(db)
+    else:
+        db = SessionLocal()
+        try:
+            yield BDHilos(db)
+        finally:
+            await run_in_threadpool(db.close)
@@ -0,0 +1,128 @@
+# ------------------------------------------------------------------------------
+# Invalidación entre workers de la instantánea de la base de reglas.
+# Cada escritura sobre factor, hecho o factorhecho sube base_reglas_version y
+# publica NOTIFY base_reglas (trigger de la migración 3). Cada worker tiene un
+# hilo con una conexión propia haciendo LISTEN: cuando llega un aviso de otro
+# proceso descarta su instantánea (y con ella el cache de /api/recomendar) y,
+# si INVALIDACION_RECARGAR está activo, la vuelve a cargar enseguida para que
+# la próxima petición no pague la carga.
+# Los avisos de las conexiones de este mismo proceso (mismo application_name,
+# ver core/session.py) se ignoran: ese worker ya aplicó el cambio en memoria.
+# Si la conexión se cae se pierden los avisos de mientras tanto, así que cada
+# INVALIDACION_SONDEO segundos, y al reconectar, se compara la versión guardada
+# en la base con la última vista.
+# ------------------------------------------------------------------------------
+import json
+import select
+import threading
+import time
+from typing import Callable, Optional
+
+import psycopg2
+
+from core.config import settings
+from motor.base_reglas import anotar_version_bd, invalidar_base
+
+CANAL = "base_reglas"
+
+
+class EscuchaBaseReglas:
+    def __init__(self, sondeo: float):
+        self.sondeo = sondeo
+        self.visto: Optional[int] = None  # última versión de la base de datos vista
+        self.conectada = False
+        self.avisos = 0
+        self.invalidaciones = {"aviso": 0, "sondeo": 0}
+        self._dsn = ""
+        self._origen = ""
+        self._recargar: Optional[Callable[[], None]] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self, dsn: str, origen: str, recargar: Optional[Callable[[], None]] = None) -> None:
+        self._dsn, self._origen, self._recargar = dsn, origen, recargar
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._correr, name="escucha-base-reglas", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def _correr(self) -> None:
+        espera = 1.0
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn, application_name=f"{self._origen}-escucha")
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANAL}")
+                self.conectada = True
+                espera = 1.0
+                self._comprobar(conn)  # lo que cambió mientras no se escuchaba
+                self._escuchar(conn)
+            except (psycopg2.Error, OSError) as e:
+                print(f"⚠️ Escucha de la base de reglas: {e!r}, reintento en {espera:.0f}s")
+                self._detener.wait(espera)
+                espera = min(espera * 2, settings.ARRANQUE_REINTENTO_MAX)
+            finally:
+                self.conectada = False
+                if conn is not None:
+                    conn.close()
+
+    def _escuchar(self, conn) -> None:
+        ultimo_sondeo = time.monotonic()
+        while not self._detener.is_set():
+            # espera corta para notar detener() sin depender de que llegue un aviso
+            if select.select([conn], [], [], min(self.sondeo, 1.0))[0]:
+                conn.poll()
+                avisos = list(conn.notifies)
+                del conn.notifies[:]
+                self._atender(avisos)
+            if time.monotonic() - ultimo_sondeo >= self.sondeo:
+                self._comprobar(conn)
+                ultimo_sondeo = time.monotonic()
+
+    def _atender(self, avisos) -> None:
+        self.avisos += len(avisos)
+        ajena = None
+        for aviso in avisos:
+            try:
+                datos = json.loads(aviso.payload)
+            except ValueError:
+                continue
+            self.visto = max(self.visto or 0, datos["version"])
+            if datos.get("origen") != self._origen:
+                ajena = datos["version"]
+        desactualizada = anotar_version_bd(self.visto) if self.visto is not None else False
+        if ajena is not None or desactualizada:
+            self._invalidar("aviso", self.visto)
+
+    def _comprobar(self, conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM base_reglas_version WHERE id = 1")
+            fila = cur.fetchone()
+        version = fila[0] if fila else 0
+        # en la primera lectura solo se descarta la instantánea si vino de otra
+        # versión (un archivo compartido viejo, ver motor/instantanea.py)
+        cambio = self.visto is not None and version != self.visto
+        self.visto = version
+        if anotar_version_bd(version) or cambio:
+            self._invalidar("sondeo", version)
+
+    def _invalidar(self, motivo: str, version: int) -> None:
+        invalidar_base()
+        anotar_version_bd(version)  # la recarga puede abrir el archivo de esa versión
+        self.invalidaciones[motivo] += 1
+        print(f"🔔 La base de reglas cambió (versión {version}, por {motivo}): instantánea descartada")
+        if self._recargar is not None:
+            try:
+                self._recargar()
+            except Exception as e:
+                # la próxima petición la carga igual
+                print("⚠️ No se pudo recargar la base de reglas:", repr(e))
+
+
+escucha = EscuchaBaseReglas(settings.INVALIDACION_SONDEO)
@@ -0,0 +1,260 @@
+# ------------------------------------------------------------------------------
+# Métricas HTTP en formato de texto de Prometheus (GET /metrics).
+# Por ruta (la plantilla, p. ej. /reglas/{regla_id}, no la URL concreta) y
+# método se llevan un histograma de latencia, las peticiones en vuelo y los
+# códigos de estado. Junto a ellas van las consultas SQL por ruta
+# (core/consultas.py), los aciertos/fallos de la instantánea de la base de
+# reglas y del cache de /api/recomendar (motor/resultados.py), las
+# invalidaciones llegadas de otros workers (core/invalidacion.py), las
+# preparaciones de la base y el trie del flujo de preguntas (motor/flujo.py) y
+# el estado del pool de conexiones (core/pool.py).
+#
+# instrumentar() envuelve la app ASGI de cada ruta en vez de poner un
+# middleware delante del router: un middleware no conoce la ruta hasta que el
+# router la resuelve, y volver a buscarla cuesta ~50 µs por petición. Las
+# observaciones ocurren todas en el hilo del event loop, así que no hay locks.
+# Las métricas son por proceso: con varios workers, cada uno expone las suyas.
+# ------------------------------------------------------------------------------
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
+from starlette.routing import Mount, Route
+
+from core.consultas import consultas_por_ruta, excedidas_por_ruta, segundos_por_ruta
+from core.invalidacion import escucha
+from core.pool import estado_pools
+from motor.base_reglas import accesos, preparador
+from motor.flujo import construcciones_flujo
+from motor.resultados import cache_resultados
+
+# límites de los buckets de latencia, en segundos
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIN_RUTA = "sin_ruta"  # 404: ninguna ruta coincide (no se usa la URL para no crear series sin límite)
+TIPO_CONTENIDO = "text/plain; version=0.0.4"  # Starlette agrega "; charset=utf-8"
+
+
+class Histograma:
+    __slots__ = ("conteos", "suma", "total")
+
+    def __init__(self):
+        self.conteos = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, segundos: float) -> None:
+        self.conteos[bisect_left(BUCKETS, segundos)] += 1
+        self.suma += segundos
+        self.total += 1
+
+
+class MetricasHTTP:
+    def __init__(self):
+        self.latencias: Dict[Tuple[str, str], Histograma] = defaultdict(Histograma)
+        self.estados: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.en_vuelo: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def envolver(self, app, ruta: str):
+        """App ASGI que mide cada petición de `ruta` antes de pasarla a `app`."""
+        metricas = self
+
+        async def medida(scope, receive, send):
+            if scope["type"] != "http":
+                return await app(scope, receive, send)
+            clave = (scope["method"], ruta)
+            estado = 500  # si la app falla antes de responder
+
+            async def enviar(mensaje):
+                nonlocal estado
+                if mensaje["type"] == "http.response.start":
+                    estado = mensaje["status"]
+                await send(mensaje)
+
+            metricas.en_vuelo[clave] += 1
+            inicio = time.perf_counter()
+            try:
+                await app(scope, receive, enviar)
+            except HTTPException as e:
+                # la respuesta la arma el manejador de excepciones, fuera de la ruta
+                estado = e.status_code
+                raise
+            except RequestValidationError:
+                estado = 422
+                raise
+            finally:
+                metricas.latencias[clave].observar(time.perf_counter() - inicio)
+                metricas.estados[clave + (estado,)] += 1
+                metricas.en_vuelo[clave] -= 1
+
+        return medida
+
+
+metricas_http = MetricasHTTP()
+
+
+def instrumentar(app) -> None:
+    """Mide todas las rutas ya registradas en la app (llamar después de declararlas)."""
+    for ruta in app.router.routes:
+        if isinstance(ruta, (Route, Mount)) and not getattr(ruta.app, "_medida", False):
+            ruta.app = metricas_http.envolver(ruta.app, ruta.path)
+            ruta.app._medida = True
+    app.router.default = metricas_http.envolver(app.router.default, SIN_RUTA)
+
+
+# ---------- exposición ----------
+def _etiquetas(**etiquetas) -> str:
+    def escapar(valor) -> str:
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in etiquetas.items()) + "}"
+
+
+def _metrica(nombre: str, tipo: str, ayuda: str, muestras: Iterable[Tuple[str, dict, float]]) -> List[str]:
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+    for sufijo, etiquetas, valor in muestras:
+        lineas.append(f"{nombre}{sufijo}{_etiquetas(**etiquetas) if etiquetas else ''} {valor}")
+    return lineas
+
+
+def _histogramas() -> Iterable[Tuple[str, dict, float]]:
+    for (metodo, ruta), h in sorted(metricas_http.latencias.items()):
+        acumulado = 0
+        for limite, conteo in zip(BUCKETS + ("+Inf",), h.conteos):
+            acumulado += conteo
+            yield "_bucket", {"metodo": metodo, "ruta": ruta, "le": limite}, acumulado
+        yield "_sum", {"metodo": metodo, "ruta": ruta}, round(h.suma, 6)
+        yield "_count", {"metodo": metodo, "ruta": ruta}, h.total
+
+
+def _resumen_espera(pool: str, estado: dict) -> Iterable[Tuple[str, dict, float]]:
+    espera = estado["espera_ms"]
+    for cuantil, clave in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+        yield "", {"pool": pool, "quantile": cuantil}, espera[clave] / 1000
+    esperas = estado["checkouts"] + estado["timeouts"]
+    yield "_sum", {"pool": pool}, round(espera["promedio"] * esperas / 1000, 6)
+    yield "_count", {"pool": pool}, esperas
+
+
+def exponer() -> str:
+    """Todas las métricas de este proceso en formato de texto de Prometheus."""
+    lineas = []
+    lineas += _metrica(
+        "http_peticion_duracion_segundos", "histogram", "Latencia de las peticiones por ruta y método.", _histogramas()
+    )
+    lineas += _metrica(
+        "http_peticiones_total",
+        "counter",
+        "Peticiones terminadas por ruta, método y código de estado.",
+        (("", {"metodo": m, "ruta": r, "codigo": c}, n) for (m, r, c), n in sorted(metricas_http.estados.items())),
+    )
+    lineas += _metrica(
+        "http_peticiones_en_vuelo",
+        "gauge",
+        "Peticiones en curso por ruta y método.",
+        (("", {"metodo": m, "ruta": r}, n) for (m, r), n in sorted(metricas_http.en_vuelo.items())),
+    )
+    for nombre, tipo, ayuda, valores in (
+        ("db_consultas_total", "counter", "Sentencias SQL por ruta y método.", consultas_por_ruta),
+        ("db_consultas_segundos_total", "counter", "Tiempo en la base por ruta y método.", segundos_por_ruta),
+        (
+            "db_consultas_presupuesto_excedido_total",
+            "counter",
+            "Peticiones con más consultas que CONSULTAS_PRESUPUESTO.",
+            excedidas_por_ruta,
+        ),
+    ):
+        lineas += _metrica(
+            nombre, tipo, ayuda, (("", {"metodo": m, "ruta": r}, round(v, 6)) for (m, r), v in sorted(valores.items()))
+        )
+    lineas += _metrica(
+        "base_reglas_accesos_total",
+        "counter",
+        "Accesos a la instantánea de la base de reglas: acierto (en memoria) o fallo (carga desde la base).",
+        [("", {"resultado": "acierto"}, accesos.aciertos), ("", {"resultado": "fallo"}, accesos.fallos)],
+    )
+    lineas += _metrica(
+        "base_reglas_invalidaciones_total",
+        "counter",
+        "Instantáneas descartadas por cambios de otro worker: por aviso (NOTIFY) o por sondeo de la versión.",
+        (("", {"motivo": motivo}, n) for motivo, n in escucha.invalidaciones.items()),
+    )
+    lineas += _metrica(
+        "base_reglas_escucha_conectada", "gauge", "1 si la escucha de avisos está conectada.", [("", {}, int(escucha.conectada))]
+    )
+    lineas += _metrica(
+        "base_reglas_preparaciones_total",
+        "counter",
+        "Instantáneas preparadas en segundo plano (índices, puntaje y flujo de preguntas).",
+        [("", {}, preparador.construcciones)],
+    )
+    ultimo = construcciones_flujo.ultimo or {}
+    for nombre, tipo, ayuda, valor in (
+        ("flujo_construcciones_total", "counter", "Tries del flujo de preguntas armados.", construcciones_flujo.total),
+        (
+            "flujo_construccion_segundos_total",
+            "counter",
+            "Tiempo total armando tries del flujo de preguntas.",
+            round(construcciones_flujo.segundos, 6),
+        ),
+        ("flujo_nodos", "gauge", "Nodos del último trie armado.", ultimo.get("nodos", 0)),
+        (
+            "flujo_ultima_construccion_segundos",
+            "gauge",
+            "Tiempo en armar el último trie.",
+            round(ultimo.get("ms", 0) / 1000, 6),
+        ),
+        (
+            "flujo_completo",
+            "gauge",
+            "1 si el último trie cubre todos los caminos (no llegó a FLUJO_MAX_NODOS).",
+            int(ultimo.get("completo", False)),
+        ),
+    ):
+        lineas += _metrica(nombre, tipo, ayuda, [("", {}, valor)])
+    lineas += _metrica(
+        "recomendar_cache_accesos_total",
+        "counter",
+        "Consultas al cache de resultados de /api/recomendar: acierto o fallo.",
+        [
+            ("", {"resultado": "acierto"}, cache_resultados.aciertos),
+            ("", {"resultado": "fallo"}, cache_resultados.fallos),
+        ],
+    )
+    lineas += _metrica(
+        "recomendar_cache_desalojos_total",
+        "counter",
+        "Entradas descartadas del cache de /api/recomendar por tamaño (LRU), vencimiento o cambio de versión.",
+        (("", {"motivo": motivo}, n) for motivo, n in cache_resultados.desalojos.items()),
+    )
+    lineas += _metrica(
+        "recomendar_cache_entradas", "gauge", "Entradas en el cache de /api/recomendar.", [("", {}, len(cache_resultados))]
+    )
+
+    pools = estado_pools()
+    for nombre, tipo, ayuda, valor in (
+        ("db_pool_tamano", "gauge", "Conexiones fijas del pool.", lambda p: p["tamano"]),
+        ("db_pool_en_uso", "gauge", "Conexiones prestadas.", lambda p: p["en_uso"]),
+        ("db_pool_libres", "gauge", "Conexiones libres en el pool.", lambda p: p["libres"]),
+        ("db_pool_overflow", "gauge", "Conexiones por encima del tamaño fijo.", lambda p: p["overflow"]),
+        ("db_pool_checkouts_total", "counter", "Conexiones entregadas.", lambda p: p["checkouts"]),
+        ("db_pool_timeouts_total", "counter", "Esperas por conexión que vencieron.", lambda p: p["timeouts"]),
+        ("db_pool_conexiones_abiertas_total", "counter", "Conexiones abiertas.", lambda p: p["conexiones"]["abiertas"]),
+        ("db_pool_conexiones_cerradas_total", "counter", "Conexiones cerradas.", lambda p: p["conexiones"]["cerradas"]),
+        (
+            "db_pool_conexiones_invalidadas_total",
+            "counter",
+            "Conexiones invalidadas.",
+            lambda p: p["conexiones"]["invalidadas"],
+        ),
+    ):
+        lineas += _metrica(nombre, tipo, ayuda, (("", {"pool": n}, valor(p)) for n, p in pools.items()))
+    lineas += _metrica(
+        "db_pool_espera_segundos",
+        "summary",
+        "Espera por una conexión (muestras recientes).",
+        (muestra for n, p in pools.items() for muestra in _resumen_espera(n, p)),
+    )
+    return "\n".join(lineas) + "\n"
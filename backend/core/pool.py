@@ -0,0 +1,137 @@
+# ------------------------------------------------------------------------------
+# Métricas del pool de conexiones.
+# QueuePoolMedido cronometra cada checkout (_do_get: la espera por una conexión
+# libre, más la conexión nueva cuando hay que abrirla) y los eventos del pool
+# cuentan las conexiones abiertas, cerradas e invalidadas (rotación). Con eso
+# GET /pool muestra espera, uso y rotación por worker para dimensionar
+# DB_POOL_SIZE / DB_MAX_OVERFLOW con carga real.
+# ------------------------------------------------------------------------------
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+MUESTRAS_ESPERA = 2048  # esperas recientes para los percentiles
+
+
+class MetricasPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inicio = time.monotonic()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.esperas = deque(maxlen=MUESTRAS_ESPERA)
+        self.abiertas = 0
+        self.cerradas = 0
+        self.invalidadas = 0
+
+    def registrar_espera(self, segundos: float, timeout: bool = False) -> None:
+        with self.lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_max = max(self.espera_max, segundos)
+            self.esperas.append(segundos)
+
+    def contar(self, campo: str) -> None:
+        with self.lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def resumen(self, pool) -> dict:
+        with self.lock:
+            esperas = sorted(self.esperas)
+            minutos = max(time.monotonic() - self.inicio, 1.0) / 60
+            capacidad = pool.size() + max(pool._max_overflow, 0)
+            en_uso = pool.checkedout()
+
+            def percentil(p: float) -> float:
+                return round(esperas[min(int(len(esperas) * p), len(esperas) - 1)] * 1000, 3) if esperas else 0.0
+
+            return {
+                "tamano": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout_s": pool.timeout(),
+                "en_uso": en_uso,
+                "libres": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "utilizacion": round(en_uso / capacidad, 3) if capacidad > 0 else None,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "espera_ms": {
+                    "promedio": round(self.espera_total * 1000 / max(self.checkouts + self.timeouts, 1), 3),
+                    "max": round(self.espera_max * 1000, 3),
+                    "p50": percentil(0.50),
+                    "p95": percentil(0.95),
+                    "p99": percentil(0.99),
+                },
+                "conexiones": {
+                    "abiertas": self.abiertas,
+                    "cerradas": self.cerradas,
+                    "invalidadas": self.invalidadas,
+                    "abiertas_por_minuto": round(self.abiertas / minutos, 2),
+                },
+            }
+
+
+class _Medido:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metricas = MetricasPool()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except exc.TimeoutError:
+            self.metricas.registrar_espera(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.metricas.registrar_espera(time.perf_counter() - inicio)
+        return conexion
+
+    def recreate(self):
+        # dispose() crea un pool nuevo: las métricas siguen siendo las mismas
+        nuevo = super().recreate()
+        nuevo.metricas = self.metricas
+        return nuevo
+
+
+class QueuePoolMedido(_Medido, QueuePool):
+    pass
+
+
+class AsyncQueuePoolMedido(_Medido, AsyncAdaptedQueuePool):
+    pass
+
+
+_motores = {}
+
+
+def medir(nombre: str, engine) -> None:
+    """Registra el engine (sync, o el sync_engine de uno async) para GET /pool."""
+    _motores[nombre] = engine
+
+    @event.listens_for(engine, "connect")
+    def _abierta(dbapi_conn, registro):
+        engine.pool.metricas.contar("abiertas")
+
+    @event.listens_for(engine, "close")
+    def _cerrada(dbapi_conn, registro):
+        engine.pool.metricas.contar("cerradas")
+
+    @event.listens_for(engine, "close_detached")
+    def _cerrada_suelta(dbapi_conn):
+        engine.pool.metricas.contar("cerradas")
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidada(dbapi_conn, registro, excepcion):
+        engine.pool.metricas.contar("invalidadas")
+
+
+def estado_pools() -> dict:
+    return {nombre: engine.pool.metricas.resumen(engine.pool) for nombre, engine in _motores.items()}
@@ -1,10 +1,52 @@
+import os
+import secrets
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from core.config import settings
+from core.consultas import trazar
+from core.pool import AsyncQueuePoolMedido, QueuePoolMedido, medir
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 print("Database URL is: ", SQLALCHEMY_DATABASE_URL)
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"sslmode":"require"}) #Neon requieres SSL
 
-SessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
\ No newline at end of file
+OPCIONES_POOL = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+# application_name de las conexiones de este proceso: identifica al worker en
+# pg_stat_activity y en los avisos de cambios de la base de reglas (core/invalidacion.py)
+ORIGEN = f"sistema-experto-{os.getpid()}-{secrets.token_hex(3)}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"sslmode": "require", "application_name": ORIGEN},  # Neon requiere SSL
+    poolclass=QueuePoolMedido,
+    **OPCIONES_POOL,
+)
+medir("sync", engine)
+trazar(engine)
+
+SessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
+
+# motor async (asyncpg): solo se crea si DB_ASYNC está activo
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        connect_args={"ssl": "require", "server_settings": {"application_name": ORIGEN}},
+        poolclass=AsyncQueuePoolMedido,
+        **OPCIONES_POOL,
+    )
+    medir("async", async_engine.sync_engine)
+    trazar(async_engine.sync_engine)
+    # expire_on_commit=False: los objetos devueltos se leen fuera de la sesión sin recargar
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
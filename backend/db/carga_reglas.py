@@ -0,0 +1,195 @@
+# ------------------------------------------------------------------------------
+# Carga masiva y exportación de reglas.
+# Formato (CSV con encabezado o NDJSON, una regla por fila):
+#     factor,categoria,hecho,operador,valor
+# La carga valida todas las filas antes de tocar la base; luego las copia a una
+# tabla temporal con COPY (psycopg2 copy_expert) y, en la misma transacción,
+# crea los factores y hechos que falten e inserta las reglas con tres
+# INSERT ... SELECT. Los factores se buscan por nombre exacto y, si no hay,
+# sin distinguir mayúsculas (con nombres repetidos gana el último id, como en
+# el motor); los hechos por descripción exacta (sin espacios en los extremos). Las reglas que ya existen, o que se
+# repiten dentro del mismo archivo, se omiten (y se cuentan en "omitidas"): así
+# una exportación se puede volver a cargar sin duplicar nada.
+# ------------------------------------------------------------------------------
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from db.models.factor import Factor
+from db.models.hecho import Hecho
+from db.models.factor_hecho import FactorHecho
+
+CAMPOS = ("factor", "categoria", "hecho", "operador", "valor")
+OBLIGATORIOS = ("factor", "hecho")
+RECORTADOS = ("factor", "categoria", "hecho")  # operador y valor se guardan tal cual, como en POST /reglas/
+MAX_ERRORES = 50
+TAMANO_EXPORTACION = 1000  # filas por trozo de la respuesta y por viaje al cursor
+
+
+class CargaInvalida(ValueError):
+    def __init__(self, errores: List[dict], total: int):
+        super().__init__(f"{total} filas inválidas")
+        self.errores = errores
+        self.total = total
+
+
+def leer_csv(texto: str) -> Iterator[Tuple[int, dict]]:
+    lector = csv.DictReader(io.StringIO(texto))
+    faltantes = [c for c in CAMPOS if c not in (lector.fieldnames or [])]
+    if faltantes:
+        raise CargaInvalida([{"linea": 1, "error": f"Faltan columnas: {', '.join(faltantes)}"}], 1)
+    for registro in lector:
+        yield lector.line_num, registro
+
+
+def leer_ndjson(texto: str) -> Iterator[Tuple[int, object]]:
+    for numero, linea in enumerate(texto.splitlines(), start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except json.JSONDecodeError as e:
+            yield numero, f"JSON inválido: {e.msg}"
+
+
+def validar(registros: Iterable[Tuple[int, object]]) -> List[Tuple[int, str, str, str, str, str]]:
+    """Filas (linea, factor, categoria, hecho, operador, valor); CargaInvalida si alguna no sirve."""
+    filas, errores, total = [], [], 0
+    for linea, registro in registros:
+        if isinstance(registro, str):
+            error = registro
+        elif not isinstance(registro, dict):
+            error = "Cada fila debe ser un objeto"
+        else:
+            valores = {c: registro.get(c) for c in CAMPOS}
+            if any(v is not None and not isinstance(v, (str, int, float)) for v in valores.values()):
+                error = "Los campos deben ser texto"
+            else:
+                valores = {c: "" if v is None else str(v) for c, v in valores.items()}
+                valores.update((c, valores[c].strip()) for c in RECORTADOS)
+                vacios = [c for c in OBLIGATORIOS if not valores[c]]
+                error = f"Campos vacíos: {', '.join(vacios)}" if vacios else None
+        if error:
+            total += 1
+            if len(errores) < MAX_ERRORES:
+                errores.append({"linea": linea, "error": error})
+            continue
+        filas.append((linea, *(valores[c] for c in CAMPOS)))
+    if total:
+        raise CargaInvalida(errores, total)
+    if not filas:
+        raise CargaInvalida([{"linea": 0, "error": "No hay reglas para cargar"}], 1)
+    return filas
+
+
+# los nombres de tabla salen del modelo (Base los genera en minúsculas)
+_SQL_FACTORES = f"""
+    INSERT INTO {Factor.__tablename__} (nombre, categoria)
+    SELECT factor, categoria FROM (
+        SELECT DISTINCT ON (lower(c.factor)) c.factor, c.categoria, c.linea
+        FROM carga_reglas c
+        WHERE NOT EXISTS (SELECT 1 FROM {Factor.__tablename__} f WHERE lower(f.nombre) = lower(c.factor))
+        ORDER BY lower(c.factor), c.linea
+    ) nuevos
+    ORDER BY linea
+"""
+
+_SQL_HECHOS = f"""
+    INSERT INTO {Hecho.__tablename__} (descripcion)
+    SELECT c.hecho
+    FROM carga_reglas c
+    WHERE NOT EXISTS (SELECT 1 FROM {Hecho.__tablename__} h WHERE h.descripcion = c.hecho)
+    GROUP BY c.hecho
+    ORDER BY min(c.linea)
+"""
+
+_SQL_REGLAS = f"""
+    WITH nombres AS (SELECT DISTINCT factor FROM carga_reglas),
+    factores AS MATERIALIZED (
+        SELECT n.factor, (
+            SELECT f.id FROM {Factor.__tablename__} f
+            WHERE lower(f.nombre) = lower(n.factor)
+            ORDER BY f.nombre = n.factor DESC, f.id DESC
+            LIMIT 1
+        ) AS id
+        FROM nombres n
+    )
+    INSERT INTO {FactorHecho.__tablename__} (factor_id, hecho_id, operador, valor)
+    SELECT factor_id, hecho_id, operador, valor FROM (
+        -- una fila por regla aunque venga repetida en el archivo (gana la primera línea)
+        SELECT DISTINCT ON (f.id, h.id, c.operador, c.valor)
+            f.id AS factor_id, h.id AS hecho_id, c.operador, c.valor, c.linea
+        FROM carga_reglas c
+        JOIN factores f ON f.factor = c.factor
+        JOIN (SELECT descripcion, max(id) AS id FROM {Hecho.__tablename__} GROUP BY descripcion) h
+            ON h.descripcion = c.hecho
+        ORDER BY f.id, h.id, c.operador, c.valor, c.linea
+    ) nuevas
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {FactorHecho.__tablename__} r
+        WHERE r.factor_id = nuevas.factor_id AND r.hecho_id = nuevas.hecho_id
+            AND r.operador = nuevas.operador AND r.valor = nuevas.valor
+    )
+    ORDER BY linea
+"""
+
+
+def cargar(db: Session, filas: List[Tuple[int, str, str, str, str, str]]) -> dict:
+    """Carga las filas validadas en una sola transacción (COPY + INSERT ... SELECT)."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE carga_reglas "
+            "(linea integer, factor text, categoria text, hecho text, operador text, valor text) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY carga_reglas FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (categoria, operador, valor))", buffer
+        )
+        cursor.execute("ANALYZE carga_reglas")
+        cursor.execute(_SQL_FACTORES)
+        factores = cursor.rowcount
+        cursor.execute(_SQL_HECHOS)
+        hechos = cursor.rowcount
+        cursor.execute(_SQL_REGLAS)
+        reglas = cursor.rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {"factores": factores, "hechos": hechos, "reglas": reglas, "omitidas": len(filas) - reglas}
+
+
+def exportar(db: Session, formato: str) -> Iterator[str]:
+    """Todas las reglas en el formato de carga, de a TAMANO_EXPORTACION filas (cursor del servidor)."""
+    query = (
+        db.query(Factor.nombre, Factor.categoria, Hecho.descripcion, FactorHecho.operador, FactorHecho.valor)
+        .select_from(FactorHecho)
+        .join(Factor, Factor.id == FactorHecho.factor_id)
+        .join(Hecho, Hecho.id == FactorHecho.hecho_id)
+        .order_by(FactorHecho.id.asc())
+        .yield_per(TAMANO_EXPORTACION)
+    )
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    if formato == "csv":
+        escritor.writerow(CAMPOS)
+    for numero, fila in enumerate(query, start=1):
+        if formato == "csv":
+            escritor.writerow(fila)
+        else:
+            buffer.write(json.dumps(dict(zip(CAMPOS, fila)), ensure_ascii=False) + "\n")
+        if numero % TAMANO_EXPORTACION == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
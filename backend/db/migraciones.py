@@ -0,0 +1,205 @@
+# ------------------------------------------------------------------------------
+# Migraciones versionadas del esquema (reemplazan a Base.metadata.create_all).
+# Cada migración es (versión, descripción, sentencias SQL) y se aplica una sola
+# vez: la tabla esquema_version guarda las ya aplicadas. Un advisory lock de
+# sesión serializa las migraciones, así varios workers que arrancan a la vez no
+# aplican la misma dos veces. Cada migración corre en su propia transacción: si
+# una sentencia falla no queda nada a medias (en PostgreSQL el DDL es
+# transaccional). Las de SIN_TRANSACCION (CREATE INDEX CONCURRENTLY, que no
+# puede ir en una transacción) corren sentencia por sentencia en autocommit y
+# no bloquean las escrituras sobre la tabla mientras se arma el índice.
+# La 1 crea las tablas con IF NOT EXISTS: una base creada antes con create_all
+# queda registrada en la versión 1 sin cambios.
+#
+# Uso: python -m db.migraciones            (aplica las pendientes)
+#      python -m db.migraciones --estado   (solo muestra cuáles faltan)
+# ------------------------------------------------------------------------------
+import argparse
+import re
+import time
+from typing import List
+
+from sqlalchemy import text
+
+# clave del pg_advisory_lock que serializa las migraciones
+CANDADO_MIGRACIONES = 4201707
+
+# segundos entre intentos de tomar el candado
+ESPERA_CANDADO = 0.5
+
+# migraciones que corren fuera de una transacción (ver _aplicar_sin_transaccion)
+SIN_TRANSACCION = {2}
+
+MIGRACIONES = [
+    (1, "esquema inicial", [
+        """CREATE TABLE IF NOT EXISTS factor (
+            id SERIAL PRIMARY KEY,
+            nombre VARCHAR NOT NULL,
+            categoria VARCHAR NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS hecho (
+            id SERIAL PRIMARY KEY,
+            descripcion TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS factorhecho (
+            id SERIAL PRIMARY KEY,
+            factor_id INTEGER NOT NULL REFERENCES factor (id),
+            hecho_id INTEGER NOT NULL REFERENCES hecho (id),
+            operador VARCHAR NOT NULL,
+            valor VARCHAR NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS usuario (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(50) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            is_active BOOLEAN,
+            password VARCHAR(100) NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_usuario_id ON usuario (id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_usuario_name ON usuario (name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_usuario_email ON usuario (email)",
+        """CREATE TABLE IF NOT EXISTS empleado (
+            id SERIAL PRIMARY KEY,
+            nombre VARCHAR NOT NULL,
+            email VARCHAR NOT NULL UNIQUE,
+            password VARCHAR NOT NULL,
+            es_admin BOOLEAN
+        )""",
+    ]),
+    # Las consultas de reglas filtran por factor, por factor y hecho, por los
+    # valores de un factor y por prefijo del valor sin mayúsculas (con_prefijo).
+    # text_pattern_ops deja usar el índice en LIKE 'prefijo%' con cualquier collation.
+    # hecho_id solo: /reglas/?hecho_id= y, al borrar un hecho, la búsqueda de sus
+    # reglas (la cascada es del ORM, db/models/hecho.py; la clave foránea no
+    # tiene ON DELETE CASCADE) y la verificación de la clave foránea.
+    # CONCURRENTLY: con una factorhecho grande, un CREATE INDEX normal bloquea
+    # las escrituras de reglas mientras se arma el índice.
+    (2, "índices de factorhecho", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_factorhecho_factor_hecho ON factorhecho (factor_id, hecho_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_factorhecho_factor_valor ON factorhecho (factor_id, valor)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_factorhecho_valor_lower ON factorhecho (lower(valor) text_pattern_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_factorhecho_hecho ON factorhecho (hecho_id)",
+        "ANALYZE factorhecho",
+    ]),
+    # Versión de la base de reglas compartida por todos los workers. Cualquier
+    # escritura sobre factor, hecho o factorhecho (endpoints, carga masiva o SQL
+    # a mano) la sube y avisa por NOTIFY base_reglas, que se entrega al hacer
+    # commit. El aviso lleva el application_name de la conexión para que el
+    # worker que escribió no descarte su propia instantánea (core/invalidacion.py).
+    (3, "versión de la base de reglas y avisos", [
+        """CREATE TABLE IF NOT EXISTS base_reglas_version (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version BIGINT NOT NULL
+        )""",
+        "INSERT INTO base_reglas_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+        """CREATE OR REPLACE FUNCTION base_reglas_cambio() RETURNS trigger AS $$
+        DECLARE
+            nueva BIGINT;
+        BEGIN
+            UPDATE base_reglas_version SET version = version + 1 WHERE id = 1 RETURNING version INTO nueva;
+            PERFORM pg_notify(
+                'base_reglas',
+                json_build_object('version', nueva, 'origen', current_setting('application_name'))::text
+            );
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql""",
+    ] + [
+        sentencia
+        for tabla in ("factor", "hecho", "factorhecho")
+        for sentencia in (
+            f"DROP TRIGGER IF EXISTS tr_{tabla}_base_reglas ON {tabla}",
+            f"""CREATE TRIGGER tr_{tabla}_base_reglas
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {tabla}
+                FOR EACH STATEMENT EXECUTE FUNCTION base_reglas_cambio()""",
+        )
+    ]),
+]
+
+_SQL_TABLA_VERSION = """
+    CREATE TABLE IF NOT EXISTS esquema_version (
+        version INTEGER PRIMARY KEY,
+        descripcion TEXT NOT NULL,
+        aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def pendientes(conn) -> List[tuple]:
+    conn.execute(text(_SQL_TABLA_VERSION))
+    aplicadas = set(conn.execute(text("SELECT version FROM esquema_version")).scalars())
+    return [m for m in MIGRACIONES if m[0] not in aplicadas]
+
+
+_INDICE_CONCURRENTE = re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)", re.IGNORECASE)
+
+
+def _aplicar_sin_transaccion(conn, sentencias: List[str]) -> None:
+    """
+    Sentencias de una migración de SIN_TRANSACCION, en una conexión en autocommit.
+    Si un CREATE INDEX CONCURRENTLY anterior se cortó, el índice quedó marcado
+    como inválido y IF NOT EXISTS lo saltaría: se borra antes de volver a armarlo.
+    """
+    for sentencia in sentencias:
+        indice = _INDICE_CONCURRENTE.search(sentencia)
+        if indice:
+            invalido = conn.execute(
+                text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :nombre AND NOT i.indisvalid"
+                ),
+                {"nombre": indice.group(1)},
+            ).first()
+            if invalido:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.group(1)}"))
+        conn.execute(text(sentencia))
+
+
+def migrar(engine) -> List[int]:
+    """Aplica las migraciones pendientes, en orden. Devuelve las versiones aplicadas."""
+    aplicadas = []
+    # el candado es de sesión (no de transacción): se conserva entre las
+    # transacciones de cada migración y durante las que corren en autocommit.
+    # Se sondea con pg_try_advisory_lock en lugar de esperar en pg_advisory_lock:
+    # CREATE INDEX CONCURRENTLY espera a que terminen las transacciones abiertas,
+    # y un worker bloqueado en pg_advisory_lock lo es (se esperarían entre sí).
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as candado:
+        while not candado.execute(text("SELECT pg_try_advisory_lock(:clave)"), {"clave": CANDADO_MIGRACIONES}).scalar():
+            time.sleep(ESPERA_CANDADO)
+        try:
+            with engine.begin() as conn:
+                faltan = pendientes(conn)
+            for version, descripcion, sentencias in faltan:
+                if version in SIN_TRANSACCION:
+                    _aplicar_sin_transaccion(candado, sentencias)
+                with engine.begin() as conn:
+                    if version not in SIN_TRANSACCION:
+                        for sentencia in sentencias:
+                            conn.execute(text(sentencia))
+                    conn.execute(
+                        text("INSERT INTO esquema_version (version, descripcion) VALUES (:v, :d)"),
+                        {"v": version, "d": descripcion},
+                    )
+                print(f"🧱 Migración {version} aplicada: {descripcion}")
+                aplicadas.append(version)
+        finally:
+            candado.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": CANDADO_MIGRACIONES})
+    return aplicadas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones del esquema")
+    parser.add_argument("--estado", action="store_true", help="muestra las pendientes sin aplicarlas")
+    args = parser.parse_args()
+
+    from core.session import engine
+
+    if args.estado:
+        with engine.begin() as conn:
+            faltan = pendientes(conn)
+        for version, descripcion, _ in faltan:
+            print(f"⏳ {version}: {descripcion}")
+        print("✅ Esquema al día" if not faltan else f"{len(faltan)} migraciones pendientes")
+    else:
+        aplicadas = migrar(engine)
+        print("✅ Esquema al día" if not aplicadas else f"✅ Aplicadas: {aplicadas}")
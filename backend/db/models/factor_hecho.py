@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship
 from core.base_class import Base
 
+# los índices de esta tabla los crea la migración 2 (db/migraciones.py)
 class FactorHecho(Base):
     id = Column(Integer, primary_key=True)
     factor_id = Column(Integer, ForeignKey("factor.id"), nullable=False)
@@ -1,25 +1,32 @@
-from fastapi import Depends, FastAPI, HTTPException, status, Request, Form, Body
+from fastapi import Depends, FastAPI, HTTPException, status, Request, Response, Form, Body, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles  # ← AGREGAR ESTE IMPORT
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import EmailStr
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
 from collections import defaultdict
 from sqlalchemy.orm import Session
 from sqlalchemy import text, func, and_, or_
-from passlib.context import CryptContext
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-import psycopg2
-from psycopg2 import OperationalError
 
+import asyncio
+import codecs
+import json
 import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # ---- Configuración base ----
 from core.config import settings
-from core.session import engine
-from core.base_class import Base
-from core.deps import get_db
+from core.session import ORIGEN, SessionLocal, engine
+from core.claves import claves
+from core.deps import BD, get_bd, get_db
+from core.consultas import PresupuestoConsultas
+from core.invalidacion import escucha
+from core.metricas import TIPO_CONTENIDO, exponer, instrumentar
+from core.pool import estado_pools
 
 # ---- Modelos ----
 from db.models.factor import Factor
@@ -35,6 +42,33 @@ from db.schemas.hecho import HechoCreate, HechoResponse
 from db.schemas.factor_hecho import FactorHechoCreate, FactorHechoResponse
 from db.schemas.usuario import CrearUsuario, LeerUsuario, ActualizarUsuario
 
+# ---- Esquema y carga masiva ----
+from db.migraciones import migrar
+from db.carga_reglas import CargaInvalida, cargar, exportar, leer_csv, leer_ndjson, validar
+
+# ---- Motor de inferencia ----
+from motor.base_reglas import (
+    BaseReglas,
+    base_vigente,
+    confirmar_escritura,
+    etiqueta_base,
+    flujo_listo,
+    etiqueta_version_bd,
+    invalidar_base,
+    leer_version_bd,
+    obtener_base,
+    preparador,
+    registrar_factor,
+    registrar_hecho,
+    registrar_regla,
+    retirar_regla,
+    version_vigente,
+)
+from motor.condiciones import parsear_respuesta
+from motor.flujo import construcciones_flujo, preguntas, siguiente_pregunta
+from motor.resultados import cache_resultados, clave_respuestas
+from motor.sesiones import SesionesCuestionario
+
 
 # ============================================================
 #              INICIALIZACIÓN Y ARRANQUE DE APP
@@ -42,23 +76,71 @@ from db.schemas.usuario import CrearUsuario, LeerUsuario, ActualizarUsuario
 def test_connection():
     print("🧠 Probando conexión a la base de datos...")
     print("🔗 URL:", repr(settings.DATABASE_URL))
-    try:
-        conn = psycopg2.connect(settings.DATABASE_URL, sslmode="require", connect_timeout=5)
-        print("✅ Conexión exitosa a la base de datos!")
-        conn.close()
-    except OperationalError as e:
-        print("❌ Error al conectar con la base de datos:")
-        print(e)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    print("✅ Conexión exitosa a la base de datos!")
 
 def create_tables():
-    Base.metadata.create_all(bind=engine)
-    print("🧱 Tablas creadas correctamente")
+    aplicadas = migrar(engine)
+    print("🧱 Esquema al día" + (f" (migraciones {aplicadas})" if aplicadas else ""))
 
-def start_application():
-    app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+# Estado del arranque para /ready. El worker atiende peticiones desde el primer
+# momento (lo que no esté caliente se carga al usarse), pero solo se reporta
+# listo cuando terminó el calentamiento.
+arranque = {"listo": False, "etapa": "pendiente", "intentos": 0, "error": None, "segundos": None}
+
+def recargar_base():
+    """Carga la instantánea de la base de reglas (si hace falta) con su puntaje y flujo."""
+    db = SessionLocal()
+    try:
+        obtener_base(db).preparar()
+    finally:
+        db.close()
+
+def calentar():
+    """Conexión, esquema, base de reglas (puntaje y flujo) y plantillas, en ese orden."""
+    arranque["etapa"] = "conexion"
     test_connection()
-    create_tables()
-    return app
+    if settings.MIGRAR_AL_ARRANCAR:
+        arranque["etapa"] = "esquema"
+        create_tables()
+    arranque["etapa"] = "base_reglas"
+    recargar_base()
+    arranque["etapa"] = "plantillas"
+    for nombre in templates.env.list_templates(filter_func=lambda n: n.endswith(".html")):
+        templates.env.get_template(nombre)
+
+async def arrancar():
+    inicio = time.perf_counter()
+    espera = 1.0
+    while True:
+        arranque["intentos"] += 1
+        try:
+            await asyncio.to_thread(calentar)
+            break
+        except Exception as e:
+            arranque["error"] = repr(e)
+            print(f"⚠️ Arranque: falló '{arranque['etapa']}', reintento en {espera:.0f}s:", repr(e))
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, settings.ARRANQUE_REINTENTO_MAX)
+    arranque.update(listo=True, etapa="listo", error=None, segundos=round(time.perf_counter() - inicio, 3))
+    print("🚀 Worker listo:", arranque)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # la escucha arranca antes de cargar la base: un cambio durante el calentamiento no se pierde
+    if settings.INVALIDACION_ESCUCHAR and engine.dialect.name == "postgresql":
+        dsn = settings.INVALIDACION_URL or engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        escucha.iniciar(dsn, ORIGEN, recargar_base if settings.INVALIDACION_RECARGAR else None)
+    # el calentamiento corre en segundo plano: una base lenta no impide que el worker levante
+    tarea = asyncio.create_task(arrancar())
+    yield
+    tarea.cancel()
+    escucha.detener()
+    claves.cerrar()
+
+def start_application():
+    return FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION, lifespan=lifespan)
 
 # Configuración de directorios
 BASE_DIR = Path(__file__).resolve().parent.parent  
@@ -66,7 +148,9 @@ FRONTEND_DIR = BASE_DIR / "frontend"
 STATIC_DIR = FRONTEND_DIR / "static"  # ← AGREGAR ESTA LÍNEA
 
 app = start_application()
+app.add_middleware(PresupuestoConsultas)
 templates = Jinja2Templates(directory=str(FRONTEND_DIR))
+sesiones = SesionesCuestionario(settings.SESIONES_MAX, settings.SESIONES_TTL)
 
 # Montar archivos estáticos
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")  # ← AGREGAR ESTA LÍNEA
@@ -108,29 +192,141 @@ def admin_consul_reglas_page(request: Request):
 #                     ENDPOINTS DE NEGOCIO
 # ============================================================
 @app.get("/health")
-def health(db: Session = Depends(get_db)):
-    db.execute(text("SELECT 1"))
-    return {"ok": True, "db": "up"}
+async def health():
+    """Liveness: el proceso responde. No toca la base ni el threadpool."""
+    return {"ok": True}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: 503 hasta que el calentamiento del arranque termina."""
+    if not arranque["listo"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        **arranque,
+        "version": version_vigente(),
+        "base_cargada": base_vigente() is not None,
+        "preparaciones": preparador.construcciones,
+        "flujo": construcciones_flujo.ultimo,
+    }
+
+@app.get("/pool")
+def estado_pool():
+    """Espera de checkout, uso y rotación del pool de conexiones de este worker."""
+    return estado_pools()
+
+@app.get("/metrics", include_in_schema=False)
+async def metricas():
+    """Latencias, códigos y peticiones en vuelo por ruta, caché de reglas y pool (formato Prometheus)."""
+    return Response(exponer(), media_type=TIPO_CONTENIDO)
+
+# ---------- GET condicionales ----------
+# Los listados que salen de la base de reglas llevan un ETag con su versión:
+# el cliente revalida con If-None-Match y, si nada cambió, recibe un 304 sin
+# que se consulte la base de datos. Es la versión de base_reglas_version de la
+# instantánea (etiqueta_base), así el 304 vale en cualquier worker; si no se
+# conoce, una etiqueta propia de este proceso.
+# Los listados paginados o filtrados se consultan en la base de datos: su ETag
+# es la versión de base_reglas_version, que sube con cualquier escritura de
+# cualquier worker (la versión de la instantánea de este proceso puede no
+# haberse enterado todavía). Sin esa tabla (SQLite, esquema viejo) no hay 304.
+CACHE_CONTROL_REGLAS = "no-cache"
+
+def sin_cambios(request: Request, etag: Optional[str]) -> Optional[Response]:
+    recibidas = request.headers.get("if-none-match")
+    if etag and recibidas and any(e.strip() in (etag, "*") for e in recibidas.split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL_REGLAS})
+    return None
+
+def etiquetar(response: Response, etag: Optional[str]) -> None:
+    if etag:
+        response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL_REGLAS
+
+async def etiqueta_consulta(bd: BD) -> Optional[str]:
+    """ETag de un listado consultado en la base de datos (None si no hay base_reglas_version)."""
+    version_bd = await bd.ejecutar(leer_version_bd)
+    return None if version_bd is None else etiqueta_version_bd(version_bd)
+
+# ---------- Listados paginados ----------
+# Paginación por keyset: ?limit=N&despues_de=<id> devuelve las N filas con id
+# mayor al cursor, en orden de id, y el cursor de la página siguiente va en la
+# cabecera X-Siguiente-Cursor (sin cabecera = última página). El cuerpo sigue
+# siendo un arreglo. Sin ?limit= se devuelve el listado completo, como antes.
+# La versión (etiqueta_consulta) se toma antes de consultar: los datos nunca son
+# más viejos que su ETag.
+def pagina(query, columna_id, response: Response, limit: Optional[int], despues_de: Optional[int]):
+    if despues_de is not None:
+        query = query.filter(columna_id > despues_de)
+    query = query.order_by(columna_id.asc())
+    if limit is None:
+        return query.all()
+    filas = query.limit(limit + 1).all()
+    if len(filas) > limit:
+        filas = filas[:limit]
+        response.headers["X-Siguiente-Cursor"] = str(filas[-1].id)
+    return filas
+
+def con_prefijo(columna, prefijo: str):
+    """LIKE 'prefijo%' sin distinguir mayúsculas, con %, _ y \\ escapados."""
+    escapado = prefijo.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return func.lower(columna).like(escapado + "%", escape="\\")
 
 # ---------- FACTORES ----------
+# Los endpoints de negocio son async: las consultas (síncronas, con Session) se
+# escriben en una función local y bd.ejecutar() las corre con asyncpg o en el
+# threadpool según settings.DB_ASYNC (ver core/deps.py). El parche de la
+# instantánea (registrar_*) va aparte, siempre en el threadpool: con DB_ASYNC
+# la función local corre en el event loop.
 @app.post("/factores/", response_model=FactorResponse)
-def create_factor(factor: FactorCreate, db: Session = Depends(get_db)):
-    new_factor = Factor(nombre=factor.nombre, categoria=factor.categoria)
-    db.add(new_factor)
-    db.commit()
-    db.refresh(new_factor)
+async def create_factor(factor: FactorCreate, bd: BD = Depends(get_bd)):
+    def crear(db: Session):
+        antes = leer_version_bd(db, bloquear=True)
+        new_factor = Factor(nombre=factor.nombre, categoria=factor.categoria)
+        db.add(new_factor)
+        versiones = confirmar_escritura(db, antes)
+        db.refresh(new_factor)
+        return new_factor, versiones
+    new_factor, versiones = await bd.ejecutar(crear)
+    await run_in_threadpool(registrar_factor, new_factor, versiones)
     return new_factor
 
 #consulta de todos los factores
 @app.get("/factores/")
-def list_factores(db: Session = Depends(get_db)):
-    factores = db.query(Factor).order_by(Factor.id.asc()).all()
+async def list_factores(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.PAGINA_MAX),
+    despues_de: Optional[int] = None,
+    nombre: Optional[str] = None,
+    bd: BD = Depends(get_bd),
+):
+    if limit is None and despues_de is None and not nombre:
+        base = await bd.base()
+        no_modificado = sin_cambios(request, etiqueta_base(base))
+        if no_modificado:
+            return no_modificado
+        etiquetar(response, etiqueta_base(base))
+        return [{"id": f.id, "nombre": f.clave} for f in base.factores.values()]
+
+    etag = await etiqueta_consulta(bd)
+    no_modificado = sin_cambios(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    def consultar(db: Session):
+        query = db.query(Factor.id, Factor.nombre)
+        if nombre:
+            query = query.filter(con_prefijo(Factor.nombre, nombre))
+        return pagina(query, Factor.id, response, limit, despues_de)
+
+    etiquetar(response, etag)
+    factores = await bd.ejecutar(consultar)
     return [{"id": f.id, "nombre": (f.nombre or "").lower()} for f in factores]
 
 #consulta de un solo factor
 @app.get("/factores/{factor_id}", response_model=FactorResponse)
-def get_factor(factor_id: int, db: Session = Depends(get_db)):
-    factor = db.query(Factor).filter(Factor.id == factor_id).first()
+async def get_factor(factor_id: int, bd: BD = Depends(get_bd)):
+    factor = await bd.ejecutar(lambda db: db.query(Factor).filter(Factor.id == factor_id).first())
     if not factor:
         raise HTTPException(status_code=404, detail="Factor no encontrado")
     return factor
@@ -138,23 +334,63 @@ def get_factor(factor_id: int, db: Session = Depends(get_db)):
 #Creando Hechos
 # ---------- HECHOS ----------
 @app.post("/hechos/", response_model=HechoResponse)
-def create_hecho(hecho: HechoCreate, db: Session = Depends(get_db)):
-    new_hecho = Hecho(descripcion=hecho.descripcion)
-    db.add(new_hecho)
-    db.commit()
-    db.refresh(new_hecho)
+async def create_hecho(hecho: HechoCreate, bd: BD = Depends(get_bd)):
+    def crear(db: Session):
+        antes = leer_version_bd(db, bloquear=True)
+        new_hecho = Hecho(descripcion=hecho.descripcion)
+        db.add(new_hecho)
+        versiones = confirmar_escritura(db, antes)
+        db.refresh(new_hecho)
+        return new_hecho, versiones
+    new_hecho, versiones = await bd.ejecutar(crear)
+    await run_in_threadpool(registrar_hecho, new_hecho, versiones)
     return new_hecho
 
 #consulta de todos los hechos
 @app.get("/hechos/", response_model=List[HechoResponse])
-def get_hechos(db: Session = Depends(get_db)):
-    hechos = db.query(Hecho).all()
-    return hechos
+async def get_hechos(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.PAGINA_MAX),
+    despues_de: Optional[int] = None,
+    descripcion: Optional[str] = None,
+    factor_id: Optional[int] = None,
+    bd: BD = Depends(get_bd),
+):
+    if limit is None and despues_de is None and not descripcion and factor_id is None:
+        base = await bd.base()
+        no_modificado = sin_cambios(request, etiqueta_base(base))
+        if no_modificado:
+            return no_modificado
+        etiquetar(response, etiqueta_base(base))
+        return [{"id": h.id, "descripcion": h.descripcion} for h in base.hechos.values()]
+
+    etag = await etiqueta_consulta(bd)
+    no_modificado = sin_cambios(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    def consultar(db: Session):
+        query = db.query(Hecho.id, Hecho.descripcion)
+        if descripcion:
+            query = query.filter(con_prefijo(Hecho.descripcion, descripcion))
+        if factor_id is not None:
+            # hechos con alguna regla sobre el factor
+            query = query.filter(
+                db.query(FactorHecho.id)
+                .filter(FactorHecho.hecho_id == Hecho.id, FactorHecho.factor_id == factor_id)
+                .exists()
+            )
+        return pagina(query, Hecho.id, response, limit, despues_de)
+
+    etiquetar(response, etag)
+    hechos = await bd.ejecutar(consultar)
+    return [{"id": h.id, "descripcion": h.descripcion} for h in hechos]
 
 #consulta de un solo hecho
 @app.get("/hechos/{hecho_id}", response_model=HechoResponse)
-def get_hecho(hecho_id: int, db: Session = Depends(get_db)):
-    hecho = db.query(Hecho).filter(Hecho.id == hecho_id).first()
+async def get_hecho(hecho_id: int, bd: BD = Depends(get_bd)):
+    hecho = await bd.ejecutar(lambda db: db.query(Hecho).filter(Hecho.id == hecho_id).first())
     if not hecho:
         raise HTTPException(status_code=404, detail="Hecho no encontrado")
     return hecho
@@ -162,50 +398,196 @@ def get_hecho(hecho_id: int, db: Session = Depends(get_db)):
 #Creando Reglas
 # ---------- FACTOR-HECHO ----------
 @app.post("/reglas/", response_model=FactorHechoResponse)
-def create_regla(fh: FactorHechoCreate, db: Session = Depends(get_db)):
-    new_regla = FactorHecho(
-        factor_id=fh.factor_id, hecho_id=fh.hecho_id, operador=fh.operador, valor=fh.valor
-    )
-    db.add(new_regla)
-    db.commit()
-    db.refresh(new_regla)
+async def create_regla(fh: FactorHechoCreate, bd: BD = Depends(get_bd)):
+    def crear(db: Session):
+        antes = leer_version_bd(db, bloquear=True)
+        new_regla = FactorHecho(
+            factor_id=fh.factor_id, hecho_id=fh.hecho_id, operador=fh.operador, valor=fh.valor
+        )
+        db.add(new_regla)
+        versiones = confirmar_escritura(db, antes)
+        db.refresh(new_regla)
+        return new_regla, versiones
+    new_regla, versiones = await bd.ejecutar(crear)
+    await run_in_threadpool(registrar_regla, new_regla, versiones)
     return new_regla
 
+def filtrar_reglas(query, factor_id: Optional[int], hecho_id: Optional[int], operador: Optional[str], valor: Optional[str]):
+    """Filtros de /reglas/: factor, hecho, operador exacto y prefijo del valor."""
+    if factor_id is not None:
+        query = query.filter(FactorHecho.factor_id == factor_id)
+    if hecho_id is not None:
+        query = query.filter(FactorHecho.hecho_id == hecho_id)
+    if operador:
+        query = query.filter(FactorHecho.operador == operador)
+    if valor:
+        query = query.filter(con_prefijo(FactorHecho.valor, valor))
+    return query
+
 #consulta de todas las reglas
 @app.get("/reglas/")
-def list_reglas(db: Session = Depends(get_db)):
-    reglas = db.query(FactorHecho).order_by(FactorHecho.id.asc()).all()
+async def list_reglas(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.PAGINA_MAX),
+    despues_de: Optional[int] = None,
+    factor_id: Optional[int] = None,
+    hecho_id: Optional[int] = None,
+    operador: Optional[str] = None,
+    valor: Optional[str] = None,
+    bd: BD = Depends(get_bd),
+):
+    etag = await etiqueta_consulta(bd)
+    no_modificado = sin_cambios(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    def consultar(db: Session):
+        query = db.query(
+            FactorHecho.id, FactorHecho.factor_id, FactorHecho.hecho_id, FactorHecho.operador, FactorHecho.valor
+        )
+        query = filtrar_reglas(query, factor_id, hecho_id, operador, valor)
+        return pagina(query, FactorHecho.id, response, limit, despues_de)
+
+    etiquetar(response, etag)
+    reglas = await bd.ejecutar(consultar)
     return [
         {"id": r.id, "factor_id": r.factor_id, "hecho_id": r.hecho_id, "operador": r.operador, "valor": r.valor}
         for r in reglas
     ]
 
+#consulta de reglas con el nombre del factor y la descripción del hecho (un solo JOIN)
+@app.get("/reglas/expanded")
+async def list_reglas_expandidas(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.PAGINA_MAX),
+    despues_de: Optional[int] = None,
+    factor_id: Optional[int] = None,
+    hecho_id: Optional[int] = None,
+    operador: Optional[str] = None,
+    valor: Optional[str] = None,
+    bd: BD = Depends(get_bd),
+):
+    etag = await etiqueta_consulta(bd)
+    no_modificado = sin_cambios(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    def consultar(db: Session):
+        query = (
+            db.query(
+                FactorHecho.id,
+                FactorHecho.factor_id,
+                Factor.nombre.label("factor_nombre"),
+                FactorHecho.hecho_id,
+                Hecho.descripcion.label("hecho_descripcion"),
+                FactorHecho.operador,
+                FactorHecho.valor,
+            )
+            .join(Factor, Factor.id == FactorHecho.factor_id)
+            .join(Hecho, Hecho.id == FactorHecho.hecho_id)
+        )
+        query = filtrar_reglas(query, factor_id, hecho_id, operador, valor)
+        return pagina(query, FactorHecho.id, response, limit, despues_de)
+
+    etiquetar(response, etag)
+    reglas = await bd.ejecutar(consultar)
+    return [
+        {
+            "id": r.id,
+            "factor_id": r.factor_id,
+            "factor_nombre": (r.factor_nombre or "").lower(),
+            "hecho_id": r.hecho_id,
+            "hecho_descripcion": r.hecho_descripcion,
+            "operador": r.operador,
+            "valor": r.valor,
+        }
+        for r in reglas
+    ]
+
+# ---------- CARGA MASIVA Y EXPORTACIÓN ----------
+# Formato: factor,categoria,hecho,operador,valor (CSV con encabezado o NDJSON).
+TIPOS_REGLAS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def formato_reglas(formato: Optional[str], tipo: str = "") -> str:
+    if not formato:
+        formato = "ndjson" if "ndjson" in tipo or "jsonlines" in tipo else "csv"
+    formato = formato.lower()
+    if formato not in TIPOS_REGLAS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (csv o ndjson)")
+    return formato
+
+def _cargar_reglas(db: Session, cuerpo: bytes, formato: str) -> dict:
+    try:
+        texto = cuerpo.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+    try:
+        filas = validar(leer_csv(texto) if formato == "csv" else leer_ndjson(texto))
+    except CargaInvalida as e:
+        raise HTTPException(status_code=422, detail={"errores": e.errores, "total": e.total})
+    resumen = cargar(db, filas)
+    invalidar_base()
+    return resumen
+
+# la carga y la exportación usan la sesión síncrona: COPY y el cursor del servidor son de psycopg2
+@app.post("/reglas/bulk")
+async def cargar_reglas_masivo(request: Request, formato: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Carga un archivo de reglas (CSV: text/csv, NDJSON: application/x-ndjson o ?formato=)
+    en una sola transacción. Crea los factores y hechos que no existan y omite las reglas repetidas.
+    Devuelve {"factores", "hechos", "reglas", "omitidas"}; si alguna fila es inválida no se carga nada (422).
+    """
+    formato = formato_reglas(formato, request.headers.get("content-type", ""))
+    cuerpo = await request.body()
+    return await run_in_threadpool(_cargar_reglas, db, cuerpo, formato)
+
+@app.get("/reglas/export")
+def exportar_reglas(formato: Optional[str] = "csv", db: Session = Depends(get_db)):
+    """Todas las reglas en el formato de /reglas/bulk, escritas a medida que se leen."""
+    formato = formato_reglas(formato)
+    return StreamingResponse(
+        exportar(db, formato),
+        media_type=TIPOS_REGLAS[formato],
+        headers={"Content-Disposition": f'attachment; filename="reglas.{formato}"'},
+    )
+
 #consulta una sola regla
 @app.get("/reglas/{regla_id}", response_model=FactorHechoResponse)
-def get_regla(regla_id: int, db: Session = Depends(get_db)):
-    regla = db.query(FactorHecho).filter(FactorHecho.id == regla_id).first()
+async def get_regla(regla_id: int, bd: BD = Depends(get_bd)):
+    regla = await bd.ejecutar(lambda db: db.query(FactorHecho).filter(FactorHecho.id == regla_id).first())
     if not regla:
         raise HTTPException(status_code=404, detail="Regla no encontrada")
     return regla
 @app.put("/reglas/{regla_id}", response_model=FactorHechoResponse)
-def update_regla(regla_id: int, fh: FactorHechoCreate, db: Session = Depends(get_db)):
-    regla = db.query(FactorHecho).filter(FactorHecho.id == regla_id).first()
-    if not regla:
-        raise HTTPException(status_code=404, detail="Regla no encontrada")
-    regla.factor_id = fh.factor_id
-    regla.hecho_id = fh.hecho_id
-    regla.operador = fh.operador
-    regla.valor = fh.valor
-    db.commit()
-    db.refresh(regla)
+async def update_regla(regla_id: int, fh: FactorHechoCreate, bd: BD = Depends(get_bd)):
+    def actualizar(db: Session):
+        antes = leer_version_bd(db, bloquear=True)
+        regla = db.query(FactorHecho).filter(FactorHecho.id == regla_id).first()
+        if not regla:
+            raise HTTPException(status_code=404, detail="Regla no encontrada")
+        regla.factor_id = fh.factor_id
+        regla.hecho_id = fh.hecho_id
+        regla.operador = fh.operador
+        regla.valor = fh.valor
+        versiones = confirmar_escritura(db, antes)
+        db.refresh(regla)
+        return regla, versiones
+    regla, versiones = await bd.ejecutar(actualizar)
+    await run_in_threadpool(registrar_regla, regla, versiones)
     return regla
 @app.delete("/reglas/{regla_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_regla(regla_id: int, db: Session = Depends(get_db)): 
-    regla = db.query(FactorHecho).filter(FactorHecho.id == regla_id).first()
-    if not regla:
-        raise HTTPException(status_code=404, detail="Regla no encontrada")
-    db.delete(regla)
-    db.commit()
+async def delete_regla(regla_id: int, bd: BD = Depends(get_bd)):
+    def eliminar(db: Session):
+        antes = leer_version_bd(db, bloquear=True)
+        regla = db.query(FactorHecho).filter(FactorHecho.id == regla_id).first()
+        if not regla:
+            raise HTTPException(status_code=404, detail="Regla no encontrada")
+        db.delete(regla)
+        return confirmar_escritura(db, antes)
+    versiones = await bd.ejecutar(eliminar)
+    await run_in_threadpool(retirar_regla, regla_id, versiones)
     return None
 
 # -------------------- GESTIÓN DE USUARIOS --------------------
@@ -215,52 +597,35 @@ def delete_regla(regla_id: int, db: Session = Depends(get_db)):
 #            NUEVA RUTA: FACTORES + VALORES (hechos)
 # ============================================================
 @app.get("/factors-values")
-def get_factors_values(db: Session = Depends(get_db)):
+async def get_factors_values(request: Request, response: Response, bd: BD = Depends(get_bd)):
     """
     Devuelve [{nombre: "clima", valores: ["húmedo", "seco", ...]}, ...]
-    Extrae valores únicos de FactorHecho para cada Factor.
+    Valores únicos de las reglas de cada Factor, en una sola pasada por la base de reglas.
     """
-    factors = db.query(Factor).order_by(Factor.nombre.asc()).all()
-    
+    base = await bd.base()
+    no_modificado = sin_cambios(request, etiqueta_base(base))
+    if no_modificado:
+        return no_modificado
+    etiquetar(response, etiqueta_base(base))
+
     result = []
-    for factor in factors:
-        # Obtener valores únicos para este factor
-        valores = db.query(FactorHecho.valor).filter(
-            FactorHecho.factor_id == factor.id
-        ).distinct().all()
-        
-        # Normalizar: valores es lista de tuplas, extraer strings
-        valores_list = [v[0] for v in valores if v[0]]  # Filtrar None/vacíos
-        
+    for factor in sorted(base.factores.values(), key=lambda f: f.nombre):
+        # dict.fromkeys: únicos conservando el orden de las reglas; sin None/vacíos
+        valores = dict.fromkeys(c.valor for c in base.condiciones_de_factor(factor.id) if c.valor)
         result.append({
-            "nombre": factor.nombre.lower(),
-            "valores": valores_list
+            "nombre": factor.clave,
+            "valores": list(valores)
         })
-    
+
     return result
 
 
 # ============================================================
 #              AUTENTICACIÓN Y GESTIÓN DE USUARIOS
 # ============================================================
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-try:
-    _ = pwd_context.hash("probe")
-except Exception as e:
-    print("⚠️ bcrypt falló, usando sha256_crypt:", repr(e))
-    pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        return pwd_context.verify(plain, hashed)
-    except Exception:
-        return False
-
-
-def create_user_core(payload: CrearUsuario, db: Session) -> Usuario:
+# Los hashes de bcrypt se calculan en el pool de procesos de core/claves.py;
+# las consultas van por bd.ejecutar() como en el resto de endpoints async.
+def create_user_core(payload: CrearUsuario, db: Session, password_hash: str) -> Usuario:
     exists = db.query(Usuario).filter(
         (Usuario.email == payload.email) | (Usuario.name == payload.name)
     ).first()
@@ -270,7 +635,7 @@ def create_user_core(payload: CrearUsuario, db: Session) -> Usuario:
     user = Usuario(
         name=payload.name,
         email=payload.email,
-        password=get_password_hash(payload.password),
+        password=password_hash,
         is_active=True,
     )
     db.add(user)
@@ -279,10 +644,9 @@ def create_user_core(payload: CrearUsuario, db: Session) -> Usuario:
     return user
 
 
-@app.post("/users", response_model=LeerUsuario, status_code=status.HTTP_201_CREATED)
-def create_user(payload: CrearUsuario, db: Session = Depends(get_db)):
+def crear_usuario(db: Session, payload: CrearUsuario, password_hash: str) -> Usuario:
     try:
-        return create_user_core(payload, db)
+        return create_user_core(payload, db, password_hash)
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="Violación de integridad (duplicado).")
@@ -291,52 +655,68 @@ def create_user(payload: CrearUsuario, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error de base de datos.")
 
 
+def guardar_hash(db: Session, cuenta, password_hash: str) -> None:
+    """Rehash al iniciar sesión (cambió BCRYPT_ROUNDS o el esquema)."""
+    cuenta.password = password_hash
+    db.commit()
+    db.refresh(cuenta)
+
+
+@app.post("/users", response_model=LeerUsuario, status_code=status.HTTP_201_CREATED)
+async def create_user(payload: CrearUsuario, bd: BD = Depends(get_bd)):
+    password_hash = await claves.hash(payload.password)
+    return await bd.ejecutar(crear_usuario, payload, password_hash)
+
+
 @app.post("/users-form", response_model=LeerUsuario, status_code=status.HTTP_201_CREATED)
-def create_user_form(
+async def create_user_form(
     name: str = Form(...),
     email: EmailStr = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db),
+    bd: BD = Depends(get_bd),
 ):
-    try:
-        payload = CrearUsuario(name=name, email=email, password=password)
-        return create_user_core(payload, db)
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Violación de integridad (duplicado).")
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(status_code=500, detail="Error de base de datos.")
+    payload = CrearUsuario(name=name, email=email, password=password)
+    password_hash = await claves.hash(payload.password)
+    return await bd.ejecutar(crear_usuario, payload, password_hash)
 
 
 @app.post("/login", response_model=LeerUsuario)
-def login(email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = db.query(Usuario).filter(Usuario.email == email).first()
-    if not user or not verify_password(password, user.password):
+async def login(email: str = Form(...), password: str = Form(...), bd: BD = Depends(get_bd)):
+    user = await bd.ejecutar(lambda db: db.query(Usuario).filter(Usuario.email == email).first())
+    if not user:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    valida, nuevo_hash = await claves.verificar(password, user.password)
+    if not valida:
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    if nuevo_hash:
+        await bd.ejecutar(guardar_hash, user, nuevo_hash)
     return user
 
 
 @app.patch("/users/{user_id}", response_model=LeerUsuario)
-def update_user(user_id: int, payload: ActualizarUsuario, db: Session = Depends(get_db)):
-    user = db.query(Usuario).get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+async def update_user(user_id: int, payload: ActualizarUsuario, bd: BD = Depends(get_bd)):
+    password_hash = await claves.hash(payload.password) if payload.password else None
 
-    if payload.email and db.query(Usuario).filter(Usuario.email == payload.email, Usuario.id != user_id).first():
-        raise HTTPException(status_code=400, detail="Email ya en uso")
+    def actualizar(db: Session):
+        user = db.query(Usuario).get(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    if payload.name and db.query(Usuario).filter(Usuario.name == payload.name, Usuario.id != user_id).first():
-        raise HTTPException(status_code=400, detail="Nombre ya en uso")
+        if payload.email and db.query(Usuario).filter(Usuario.email == payload.email, Usuario.id != user_id).first():
+            raise HTTPException(status_code=400, detail="Email ya en uso")
 
-    if payload.is_active is not None:
-        user.is_active = payload.is_active
-    if payload.password:
-        user.password = get_password_hash(payload.password)
+        if payload.name and db.query(Usuario).filter(Usuario.name == payload.name, Usuario.id != user_id).first():
+            raise HTTPException(status_code=400, detail="Nombre ya en uso")
 
-    db.commit()
-    db.refresh(user)
-    return user
+        if payload.is_active is not None:
+            user.is_active = payload.is_active
+        if password_hash:
+            user.password = password_hash
+
+        db.commit()
+        db.refresh(user)
+        return user
+    return await bd.ejecutar(actualizar)
 
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -348,387 +728,265 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
     db.commit()
     return None
 @app.post("/empleados", response_model=EmpleadoRead, status_code=status.HTTP_201_CREATED)
-def create_empleado(payload: EmpleadoCreate, db: Session = Depends(get_db)):
-    exists = db.query(Empleado).filter(Empleado.email == payload.email).first()
+async def create_empleado(payload: EmpleadoCreate, bd: BD = Depends(get_bd)):
+    exists = await bd.ejecutar(lambda db: db.query(Empleado).filter(Empleado.email == payload.email).first())
     if exists:
         raise HTTPException(status_code=400, detail="Empleado ya existe (email)")
-
-    emp = Empleado(
-        nombre=payload.nombre,
-        email=payload.email,
-        password=get_password_hash(payload.password),
-        es_admin=payload.es_admin if payload.es_admin is not None else True,
-    )
-    db.add(emp)
-    db.commit()
-    db.refresh(emp)
-    return emp
+    password_hash = await claves.hash(payload.password)
+
+    def crear(db: Session):
+        emp = Empleado(
+            nombre=payload.nombre,
+            email=payload.email,
+            password=password_hash,
+            es_admin=payload.es_admin if payload.es_admin is not None else True,
+        )
+        db.add(emp)
+        db.commit()
+        db.refresh(emp)
+        return emp
+    return await bd.ejecutar(crear)
 
 @app.post("/empleado/login", response_model=EmpleadoRead)
-def login_empleado(
+async def login_empleado(
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db),
+    bd: BD = Depends(get_bd),
 ):
-    emp = db.query(Empleado).filter(Empleado.email == email).first()
-    if not emp or not verify_password(password, emp.password):
+    emp = await bd.ejecutar(lambda db: db.query(Empleado).filter(Empleado.email == email).first())
+    if not emp:
+        raise HTTPException(status_code=401, detail="Credenciales invalidas")
+    valida, nuevo_hash = await claves.verificar(password, emp.password)
+    if not valida:
         raise HTTPException(status_code=401, detail="Credenciales invalidas")
+    if nuevo_hash:
+        await bd.ejecutar(guardar_hash, emp, nuevo_hash)
     return emp
 
 
+async def base_con_puntaje(bd: BD) -> BaseReglas:
+    """
+    Instantánea vigente con el motor de puntaje armado (no espera el flujo de
+    preguntas). Si falta, se arma en un hilo y las peticiones concurrentes
+    esperan esa misma construcción (BaseReglas.esperar).
+    """
+    base = await bd.base()
+    await base.esperar("puntaje")
+    return base
+
+
 @app.get("/api/preguntas")
-def get_preguntas(altitud: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_preguntas(altitud: Optional[str] = None, bd: BD = Depends(get_bd)):
     """
     Provee el flujo de preguntas ordenado: primero altitud, luego factores compatibles.
     Solo pregunta altitud, clima y suelo en ese orden.
     - Sin altitud => solo pregunta inicial.
     - Con altitud => factores de los hechos que cumplen esa condicion.
     """
-    factors = db.query(Factor).order_by(Factor.id.asc()).all()
-    name_map = {(f.nombre or "").lower(): f for f in factors}
-    alt_factor = name_map.get("altitud")
-    clima_factor = name_map.get("clima")
-    suelo_factor = name_map.get("suelo")
-
-    def build_altitud_question() -> List[dict]:
-        if not alt_factor:
-            return []
-        registros = (
-            db.query(FactorHecho)
-            .filter(FactorHecho.factor_id == alt_factor.id)
-            .order_by(FactorHecho.id.asc())
-            .all()
-        )
-        seen = set()
-        options = []
-        for row in registros:
-            raw_value = (row.valor or "").strip()
-            if not raw_value:
-                continue
-            op = (row.operador or "").strip() or "="
-            normalized = raw_value if any(raw_value.startswith(prefix) for prefix in (">=", "=>", "<=", "=<")) else raw_value
-            if op in (">=", "=>") and not normalized.startswith((">=", "=>")):
-                normalized = f">={raw_value}"
-            if op in ("<=", "=<") and not normalized.startswith(("<=", "=<")):
-                normalized = f"<={raw_value}"
-            if normalized in seen:
-                continue
-            seen.add(normalized)
-
-            if "-" in raw_value:
-                label = f"{raw_value} msnm"
-            elif normalized.startswith(">=") or op in (">=", "=>"):
-                label = f">= {raw_value} msnm"
-            elif normalized.startswith("<=") or op in ("<=", "=<"):
-                label = f"<= {raw_value} msnm"
-            else:
-                label = f"{raw_value} msnm"
-            options.append({"v": normalized, "t": label})
-
-        if not options:
-            return []
-        return [{"id": "altitud", "text": alt_factor.nombre or "Altitud", "options": options}]
-
-    preguntas = build_altitud_question()
-    if not altitud or not alt_factor:
-        return preguntas
-
-    hechos_validos = set()
-    alt_rules = db.query(FactorHecho).filter(FactorHecho.factor_id == alt_factor.id).all()
-    for rule in alt_rules:
-        if evaluar_condicion(rule.operador, rule.valor, altitud):
-            hechos_validos.add(rule.hecho_id)
-
-    if not hechos_validos:
-        return preguntas
-
-    ordered_factors = [f for f in (clima_factor, suelo_factor) if f]
-
-    factor_lookup = {f.id: f for f in factors}
-    for factor in ordered_factors:
-        if not factor:
-            continue
-        registros = (
-            db.query(FactorHecho)
-            .filter(FactorHecho.factor_id == factor.id)
-            .filter(FactorHecho.hecho_id.in_(hechos_validos))
-            .order_by(FactorHecho.id.asc())
-            .all()
-        )
-        nombre_factor = (factor.nombre or "").lower()
-        opciones = []
-        vistos = set()
-        for row in registros:
-            valor = (row.valor or "").strip()
-            if not valor:
-                continue
-            normalized = valor.lower()
-            if normalized in vistos:
-                continue
-            vistos.add(normalized)
-            opciones.append({"v": normalized, "t": valor})
-
-        # si hay pocas opciones por el filtro, agregar valores de todas las reglas de ese factor
-        if len(opciones) < 2:
-            extra_vals = (
-                db.query(FactorHecho.valor)
-                .filter(FactorHecho.factor_id == factor.id)
-                .distinct()
-                .all()
-            )
-            for (val_extra,) in extra_vals:
-                v = (val_extra or "").strip()
-                if not v:
-                    continue
-                norm = v.lower()
-                if norm in vistos:
-                    continue
-                vistos.add(norm)
-                opciones.append({"v": norm, "t": v})
-
-        if opciones:
-            opciones = sorted(opciones, key=lambda o: (o.get("t") or o.get("v") or "").lower())
-            preguntas.append({
-                "id": nombre_factor,
-                "text": factor.nombre or nombre_factor,
-                "options": opciones,
-            })
-
-    return preguntas
-
-
-def recomendar(respuestas: dict, db: Session = Depends(get_db)):
-    """Calcula porcentaje de viabilidad por hecho."""
+    base = await bd.base()
+    flujo = flujo_listo(base)  # sin flujo todavía (recién escrita) se calcula sobre la misma versión
+    resultado = flujo.precalculadas(altitud) if flujo is not None else None
+    if resultado is None:
+        resultado = await run_in_threadpool(preguntas, base, altitud)
+    return resultado
+
+
+def puntuar(base: BaseReglas, respuestas: dict) -> dict:
+    """Calcula porcentaje de viabilidad por hecho contra una instantánea ya cargada."""
     resp = {k.lower(): (v or "").strip() for k, v in (respuestas or {}).items()}
-    resultados = []
-    hechos = db.query(Hecho).all()
-    for hecho in hechos:
-        condiciones = db.query(FactorHecho).filter(FactorHecho.hecho_id == hecho.id).all()
-        if not condiciones:
-            continue
-        cumplidas = 0
-        for condicion in condiciones:
-            factor = db.query(Factor).filter(Factor.id == condicion.factor_id).first()
-            fname = (factor.nombre or "").lower() if factor else None
-            if not fname:
-                continue
-            valor_usuario = resp.get(fname, "")
-            if evaluar_condicion(condicion.operador, condicion.valor, valor_usuario):
-                cumplidas += 1
-        porcentaje = int((cumplidas * 100) / len(condiciones)) if condiciones else 0
-        if porcentaje > 0:
-            resultados.append({"descripcion": hecho.descripcion, "porcentaje": porcentaje})
-
-    resultados.sort(key=lambda x: x["porcentaje"], reverse=True)
+    parseadas = {k: parsear_respuesta(v) for k, v in resp.items()}
+    resultados = [
+        {"descripcion": base.hechos[hecho_id].descripcion, "porcentaje": porcentaje}
+        for hecho_id, porcentaje in base.puntaje.ranking(parseadas, 5)  # mostrar solo las 5 mejores
+    ]
     if resultados:
-        top = resultados[:5]  # mostrar solo las 5 mejores
-        return {"count": len(top), "recomendaciones": top}
+        return {"count": len(resultados), "recomendaciones": resultados}
     return {"count": 0, "recomendaciones": [], "message": "No hay recomendaciones para tu combinacion de respuestas."}
 
 
 @app.post("/api/recomendar")
-def recomendar_endpoint(respuestas: dict = Body(...), db: Session = Depends(get_db)):
-    return recomendar(respuestas, db)
-
-
-@app.post("/api/pregunta-siguiente")
-def pregunta_siguiente(respuestas: dict = Body(...), db: Session = Depends(get_db)):
-    """
-    Devuelve solo la siguiente pregunta necesaria, filtrando factores
-    por los hechos que aun son compatibles con las respuestas actuales.
-    Solo considera altitud, clima y suelo en ese orden.
-    """
-    resp = {k.lower(): (v or "").strip() for k, v in (respuestas or {}).items()}
-    factors = db.query(Factor).order_by(Factor.id.asc()).all()
-    name_map = {(f.nombre or "").lower(): f for f in factors}
-    factor_lookup = {f.id: f for f in factors}
-    alt_factor = name_map.get("altitud")
-    allowed = [alt_factor, name_map.get("clima"), name_map.get("suelo")]
-
-    def build_altitud_question():
-        if not alt_factor:
-            return None
-        registros = (
-            db.query(FactorHecho)
-            .filter(FactorHecho.factor_id == alt_factor.id)
-            .order_by(FactorHecho.id.asc())
-            .all()
-        )
-        seen = set()
-        options = []
-        for row in registros:
-            raw_value = (row.valor or "").strip()
-            if not raw_value:
+async def recomendar_endpoint(respuestas: dict = Body(...), bd: BD = Depends(get_bd)):
+    base = await base_con_puntaje(bd)
+    clave = clave_respuestas(base.version, respuestas)
+    if clave is None:
+        return await run_in_threadpool(puntuar, base, respuestas)
+    resultado = cache_resultados.obtener(clave)
+    if resultado is None:
+        resultado = cache_resultados.guardar(clave, await run_in_threadpool(puntuar, base, respuestas))
+    return resultado
+
+
+# ---------- RECOMENDACIONES POR LOTE ----------
+TAMANO_TANDA_LOTE = 200          # respuestas puntuadas por viaje al threadpool
+MAX_ELEMENTO_LOTE = 1024 * 1024  # tamaño máximo de un elemento del lote (bytes)
+
+
+async def _lineas(stream):
+    """Líneas de un cuerpo NDJSON a medida que llegan, sin leerlo completo."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pendiente = ""
+    async for chunk in stream:
+        pendiente += decoder.decode(chunk)
+        *lineas, pendiente = pendiente.split("\n")
+        for linea in lineas:
+            yield linea
+        if len(pendiente) > MAX_ELEMENTO_LOTE:
+            raise ValueError("Línea demasiado larga en el lote")
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+class LineaInvalida(NamedTuple):
+    """Línea NDJSON que no es JSON: se responde con su error y el lote sigue."""
+    error: str
+
+
+async def _elementos_lote(request: Request):
+    """Elementos del lote: NDJSON (una respuesta por línea) o un arreglo JSON leído de a un elemento."""
+    tipo = request.headers.get("content-type", "")
+    if "ndjson" in tipo or "jsonlines" in tipo:
+        async for linea in _lineas(request.stream()):
+            if linea.strip():
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError as e:
+                    yield LineaInvalida(f"JSON inválido: {e.msg}")
+        return
+
+    decoder = json.JSONDecoder()
+    texto = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    abierto = False
+    async for chunk in request.stream():
+        buffer += texto.decode(chunk)
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                break
+            if not abierto:
+                if buffer[0] != "[":
+                    raise ValueError("El lote debe ser un arreglo JSON o NDJSON")
+                buffer, abierto = buffer[1:], True
                 continue
-            op = (row.operador or "").strip() or "="
-            normalized = raw_value if any(raw_value.startswith(prefix) for prefix in (">=", "=>", "<=", "=<")) else raw_value
-            if op in (">=", "=>") and not normalized.startswith((">=", "=>")):
-                normalized = f">={raw_value}"
-            if op in ("<=", "=<") and not normalized.startswith(("<=", "=<")):
-                normalized = f"<={raw_value}"
-            if normalized in seen:
+            if buffer[0] == "]":
+                return
+            if buffer[0] == ",":
+                buffer = buffer[1:]
                 continue
-            seen.add(normalized)
-
-            if "-" in raw_value:
-                label = f"{raw_value} msnm"
-            elif normalized.startswith(">=") or op in (">=", "=>"):
-                label = f">= {raw_value} msnm"
-            elif normalized.startswith("<=") or op in ("<=", "=<"):
-                label = f"<= {raw_value} msnm"
-            else:
-                label = f"{raw_value} msnm"
-            options.append({"v": normalized, "t": label})
-
-        if not options:
-            return None
-        return {"id": "altitud", "text": alt_factor.nombre or "Altitud", "options": options}
-
-    if not resp.get("altitud"):
-        alt_q = build_altitud_question()
-        return {"pregunta": alt_q, "pendientes": 1 if alt_q else 0}
-
-    hechos = db.query(Hecho).all()
-    hechos_candidatos = []
-    for hecho in hechos:
-        condiciones = db.query(FactorHecho).filter(FactorHecho.hecho_id == hecho.id).all()
-        cumple = True
-        for cond in condiciones:
-            factor = factor_lookup.get(cond.factor_id)
-            fname = (factor.nombre or "").lower() if factor else None
-            if fname and fname in resp:
-                if not evaluar_condicion(cond.operador, cond.valor, resp[fname]):
-                    cumple = False
-                    break
-        if cumple:
-            hechos_candidatos.append(hecho.id)
-
-    if not hechos_candidatos:
-        return {"pregunta": None, "pendientes": 0, "message": "No quedan hechos compatibles con tus respuestas."}
-
-    pendientes = []
-    for f in allowed:
-        if not f or f == alt_factor:
+            try:
+                elemento, fin = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if len(buffer) > MAX_ELEMENTO_LOTE:
+                    raise ValueError("Elemento demasiado largo en el lote")
+                break  # elemento incompleto: leer más
+            if fin == len(buffer) and isinstance(elemento, (int, float)):
+                break  # un número al final del trozo puede seguir en el siguiente ("12" + "3")
+            buffer = buffer[fin:]
+            yield elemento
+    raise ValueError("Arreglo JSON incompleto")
+
+
+class RespuestaNDJSON(StreamingResponse):
+    """
+    StreamingResponse que no escucha la desconexión del cliente: esa escucha
+    consume los mensajes del cuerpo de la petición, y el lote se sigue leyendo
+    mientras se responde. Si el cliente se va, request.stream() lo detecta.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _puntuar_tanda(base: BaseReglas, tanda: list) -> str:
+    lineas = []
+    for indice, elemento in tanda:
+        if isinstance(elemento, LineaInvalida):
+            lineas.append({"id": indice, "error": elemento.error})
             continue
-        fname = (f.nombre or "").lower()
-        if fname not in resp:
-            pendientes.append(f)
-    if not pendientes:
-        return {"pregunta": None, "pendientes": 0}
-
-    factor = pendientes[0]
-    registros = (
-        db.query(FactorHecho.valor)
-        .filter(FactorHecho.factor_id == factor.id)
-        .filter(FactorHecho.hecho_id.in_(hechos_candidatos))
-        .distinct()
-        .all()
-    )
-    options = []
-    seen = set()
-    for (valor,) in registros:
-        val = (valor or "").strip()
-        if not val:
+        if not isinstance(elemento, dict):
+            lineas.append({"id": indice, "error": "Cada elemento debe ser un objeto"})
             continue
-        norm = val.lower()
-        if norm in seen:
+        correlacion = elemento.get("id", indice)
+        respuestas = elemento.get("respuestas")
+        if respuestas is None:
+            respuestas = {k: v for k, v in elemento.items() if k != "id"}
+        try:
+            resultado = puntuar(base, respuestas)
+        except (AttributeError, TypeError):
+            lineas.append({"id": correlacion, "error": "Respuestas inválidas"})
             continue
-        seen.add(norm)
-        options.append({"v": norm, "t": val})
-
-    if len(options) < 2:
-        extra_registros = (
-            db.query(FactorHecho.valor)
-            .filter(FactorHecho.factor_id == factor.id)
-            .distinct()
-            .all()
-        )
-        for (valor,) in extra_registros:
-            val = (valor or "").strip()
-            if not val:
-                continue
-            norm = val.lower()
-            if norm in seen:
-                continue
-            seen.add(norm)
-            options.append({"v": norm, "t": val})
+        lineas.append({"id": correlacion, **resultado})
+    return "".join(json.dumps(linea, ensure_ascii=False) + "\n" for linea in lineas)
 
-    options = sorted(options, key=lambda o: (o.get("t") or o.get("v") or "").lower())
-    if not options:
-        return {"pregunta": None, "pendientes": 0}
-
-    nombre_factor = (factor.nombre or "").lower()
-    return {
-        "pregunta": {"id": nombre_factor, "text": factor.nombre or nombre_factor, "options": options},
-        "pendientes": len(pendientes),
-    }
 
-def evaluar_condicion(operador, valor_regla, valor_respuesta):
+@app.post("/api/recomendar/batch")
+async def recomendar_lote(request: Request, bd: BD = Depends(get_bd)):
     """
-    Evalua si la respuesta del usuario coincide con la condicion de la regla.
-    Soporta '=' y comparadores numericos '<=' '>=' y rangos tipo '1000-2000' o '>=3000'.
+    Puntúa muchas combinaciones de respuestas contra una sola carga de la base de reglas.
+    Entrada: arreglo JSON o NDJSON (Content-Type: application/x-ndjson) de objetos
+    {"id": <correlación>, "respuestas": {...}}; sin "respuestas" se usa el objeto mismo.
+    Salida: NDJSON, una línea por elemento con su "id", a medida que se procesa.
+    Una línea NDJSON que no es JSON se responde como {"id": <índice>, "error": ...}
+    y el lote sigue; un arreglo JSON mal formado corta el lote en ese punto.
     """
-    if not valor_respuesta:
-        return False
+    base = await base_con_puntaje(bd)
+
+    async def generar():
+        tanda = []
+        indice = 0
+        try:
+            async for elemento in _elementos_lote(request):
+                tanda.append((indice, elemento))
+                indice += 1
+                if len(tanda) >= TAMANO_TANDA_LOTE:
+                    yield await run_in_threadpool(_puntuar_tanda, base, tanda)
+                    tanda = []
+        except ValueError as e:  # incluye json.JSONDecodeError
+            if tanda:
+                yield await run_in_threadpool(_puntuar_tanda, base, tanda)
+            yield json.dumps({"error": f"Lote inválido: {e}"}, ensure_ascii=False) + "\n"
+            return
+        if tanda:
+            yield await run_in_threadpool(_puntuar_tanda, base, tanda)
+
+    return RespuestaNDJSON(generar())
+
+
+def _continuar_sesion(sesion: Optional[str], base: BaseReglas, resp: dict):
+    """Paso fuera del flujo precalculado: filtra los candidatos y elige la pregunta (CPU, va al threadpool)."""
+    parseadas = {k: parsear_respuesta(v) for k, v in resp.items()}
+    estado = sesiones.continuar(sesion, base, resp, parseadas)
+    return estado, siguiente_pregunta(base, resp, estado.candidatos)
+
 
-    val_resp = str(valor_respuesta).strip().lower()
-    val_regla = str(valor_regla).strip().lower()
-    op = (operador or "").strip() or "="
+@app.post("/api/pregunta-siguiente")
+async def pregunta_siguiente(respuestas: dict = Body(...), sesion: Optional[str] = None, bd: BD = Depends(get_bd)):
+    """
+    Devuelve solo la siguiente pregunta necesaria, filtrando factores
+    por los hechos que aun son compatibles con las respuestas actuales.
+    Solo considera altitud, clima y suelo en ese orden.
+    La respuesta trae un token "sesion"; enviandolo como ?sesion=<token> en el
+    siguiente paso solo se aplican las respuestas nuevas sobre los candidatos
+    guardados. Sin token (o vencido) se recalcula todo.
+    """
+    resp = {k.lower(): (v or "").strip() for k, v in (respuestas or {}).items()}
+    base = await bd.base()
+    flujo = flujo_listo(base)
+    nodo = flujo.buscar(resp) if flujo is not None else None
+    if nodo is not None:
+        estado = sesiones.registrar(sesion, base, resp, nodo.candidatos)
+        resultado = dict(nodo.resultado)
+    else:
+        estado, resultado = await run_in_threadpool(_continuar_sesion, sesion, base, resp)
+    resultado["sesion"] = estado.token
+    return resultado
 
-    # igualdad textual (incluye rangos exactos)
-    if op in ("=", "==") and not val_regla.startswith((">=", "=>", "<=", "=<")) and "-" not in val_regla:
-        return val_resp == val_regla
 
-    try:
-        # regla como rango "a-b"
-        if "-" in val_regla:
-            parts_regla = [int("".join(ch for ch in p if ch.isdigit())) for p in val_regla.split("-") if any(ch.isdigit() for ch in p)]
-            if len(parts_regla) == 2:
-                low_r, high_r = parts_regla
-                if "-" in val_resp:
-                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
-                    if len(parts_resp) == 2:
-                        low_u, high_u = parts_resp
-                        return low_u >= low_r and high_u <= high_r
-                if val_resp.isdigit():
-                    num_resp = int(val_resp)
-                    return low_r <= num_resp <= high_r
-                if val_resp.startswith(">=") or val_resp.startswith("=>"):
-                    num_resp = int("".join(ch for ch in val_resp if ch.isdigit()))
-                    return num_resp >= low_r
-                if val_resp.startswith("<=") or val_resp.startswith("=<"):
-                    num_resp = int("".join(ch for ch in val_resp if ch.isdigit()))
-                    return num_resp <= high_r
-
-        # regla >=X (por valor o por operador)
-        if val_regla.startswith(">=") or val_regla.startswith("=>") or op in (">=", "=>"):
-            num_regla = int("".join(ch for ch in val_regla if ch.isdigit())) if any(ch.isdigit() for ch in val_regla) else None
-            if num_regla is not None:
-                if val_resp.isdigit():
-                    return int(val_resp) >= num_regla
-                if val_resp.startswith(">=") or val_resp.startswith("=>"):
-                    return int("".join(ch for ch in val_resp if ch.isdigit())) >= num_regla
-                if "-" in val_resp:
-                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
-                    if len(parts_resp) == 2:
-                        low_u, _ = parts_resp
-                        return low_u >= num_regla
-
-        # regla <=X
-        if val_regla.startswith("<=") or val_regla.startswith("=<") or op in ("<=", "=<"):
-            num_regla = int("".join(ch for ch in val_regla if ch.isdigit())) if any(ch.isdigit() for ch in val_regla) else None
-            if num_regla is not None:
-                if val_resp.isdigit():
-                    return int(val_resp) <= num_regla
-                if val_resp.startswith("<=") or val_resp.startswith("=<"):
-                    return int("".join(ch for ch in val_resp if ch.isdigit())) <= num_regla
-                if "-" in val_resp:
-                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
-                    if len(parts_resp) == 2:
-                        _, high_u = parts_resp
-                        return high_u <= num_regla
-
-        # ultima opcion: comparar texto
-        return val_resp == val_regla
-    except Exception:
-        return False
\ No newline at end of file
+# ============================================================
+#              MÉTRICAS (después de declarar todas las rutas)
+# ============================================================
+instrumentar(app)
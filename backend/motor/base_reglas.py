@@ -0,0 +1,790 @@
+# ------------------------------------------------------------------------------
+# Base de reglas en memoria.
+# Se carga una sola vez desde la base de datos (factores, hechos y condiciones)
+# y queda agrupada por hecho y por factor, con el nombre del factor ya resuelto.
+# Los endpoints de inferencia leen de aquí en lugar de consultar la base.
+# Las escrituras (/factores/, /hechos/, /reglas/) no mutan la instantánea
+# vigente: publican una copia parcheada, así una petición que ya tiene su
+# instantánea nunca la ve cambiar a mitad de camino.
+# Con INSTANTANEA_DIR, cada versión cargada desde la base se escribe además como
+# archivo binario compartido entre workers (motor/instantanea.py) y los demás
+# la abren de ahí sin consultar la base (la arman igual en memoria; solo la
+# matriz de puntaje queda sobre el mmap).
+# ------------------------------------------------------------------------------
+import asyncio
+import secrets
+import sys
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import repeat
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db.models.factor import Factor
+from db.models.hecho import Hecho
+from db.models.factor_hecho import FactorHecho
+from motor.condiciones import Predicado, compilar
+from core.config import settings
+from motor.flujo import TrieFlujo
+from motor import instantanea
+from motor.indice import IndiceBits
+from motor.intervalos import IndiceNumerico
+from motor.resultados import cache_resultados
+from motor import vectorial
+
+
+class FactorInfo(NamedTuple):
+    id: int
+    nombre: str
+    categoria: str
+
+    @property
+    def clave(self) -> str:
+        return (self.nombre or "").lower()
+
+
+class HechoInfo(NamedTuple):
+    id: int
+    descripcion: str
+
+
+class Condicion(NamedTuple):
+    id: int
+    factor_id: int
+    hecho_id: int
+    operador: str
+    valor: str
+    factor_nombre: str  # nombre del factor en minúsculas, "" si no existe
+    predicado: Optional[Predicado] = None
+
+
+def _compartir(texto):
+    return sys.intern(texto) if type(texto) is str else texto
+
+
+def _clave(factor: Optional[FactorInfo]) -> str:
+    return sys.intern(factor.clave) if factor else ""
+
+
+def _candados() -> Dict[str, threading.Lock]:
+    # uno por índice: armar el flujo (lento) no hace esperar a quien solo pide el puntaje
+    return {"_bits": threading.Lock(), "_matriz": threading.Lock(), "_flujo": threading.Lock()}
+
+
+def _id(c: Condicion) -> int:
+    return c.id
+
+
+def _resolver(c: Condicion, nombre: str) -> Condicion:
+    """La condición con el nombre (ya internado) de su factor y su predicado compilado."""
+    if c.factor_nombre is nombre and c.predicado is not None:
+        return c
+    return Condicion(
+        c.id,
+        c.factor_id,
+        c.hecho_id,
+        _compartir(c.operador),
+        _compartir(c.valor),
+        nombre,
+        c.predicado or compilar(c.operador, c.valor),
+    )
+
+
+class BaseReglas:
+    """Instantánea inmutable de factores, hechos y condiciones."""
+
+    def __init__(
+        self,
+        factores: Iterable[FactorInfo],
+        hechos: Iterable[HechoInfo],
+        condiciones: Iterable[Condicion],
+        version: int = 0,
+    ):
+        self.version = version
+        self.version_bd: Optional[int] = None  # base_reglas_version de la que se leyó (None si es un parche)
+        self.factores: Dict[int, FactorInfo] = {f.id: f for f in sorted(factores, key=lambda f: f.id)}
+        self.hechos: Dict[int, HechoInfo] = {h.id: h for h in sorted(hechos, key=lambda h: h.id)}
+
+        # el nombre del factor y el predicado se resuelven aquí una sola vez;
+        # los parches reutilizan las condiciones ya compiladas. Los textos
+        # repetidos (nombre, operador, valor) quedan como un único objeto y los
+        # predicados iguales se comparten (compilar tiene cache).
+        claves = {f.id: _clave(f) for f in self.factores.values()}
+        condiciones_resueltas = [
+            _resolver(c, claves.get(c.factor_id, "")) for c in sorted(condiciones, key=lambda c: c.id)
+        ]
+        self.condiciones: Dict[int, Condicion] = {c.id: c for c in condiciones_resueltas}
+
+        self.por_hecho: Dict[int, List[Condicion]] = defaultdict(list)
+        self.por_factor: Dict[int, List[Condicion]] = defaultdict(list)
+        self.por_nombre: Dict[str, List[Condicion]] = defaultdict(list)
+        for c in condiciones_resueltas:
+            self.por_hecho[c.hecho_id].append(c)
+            self.por_factor[c.factor_id].append(c)
+            if c.factor_nombre:
+                self.por_nombre[c.factor_nombre].append(c)
+
+        # índices derivados, se construyen la primera vez que se piden
+        self._indices: Dict[tuple, IndiceNumerico] = {}
+        self._bits: Optional[IndiceBits] = None
+        self._matriz: Optional["vectorial.MatrizReglas"] = None
+        self._flujo: Optional[TrieFlujo] = None
+        self._candados = _candados()
+        self._tareas: Dict[str, "asyncio.Task"] = {}
+        self.preparada = False
+
+        # igual que {nombre: factor for factor in factores}: con nombres repetidos gana el último id
+        self.factores_por_nombre: Dict[str, FactorInfo] = {f.clave: f for f in self.factores.values()}
+
+    def factor(self, nombre: str) -> Optional[FactorInfo]:
+        return self.factores_por_nombre.get(nombre)
+
+    def condiciones_de_hecho(self, hecho_id: int) -> List[Condicion]:
+        return self.por_hecho.get(hecho_id, [])
+
+    def condiciones_de_factor(self, factor_id: int) -> List[Condicion]:
+        return self.por_factor.get(factor_id, [])
+
+    def hechos_con_nombre(self, nombre: str) -> Set[int]:
+        """Hechos con alguna condición sobre los factores con ese nombre."""
+        return {c.hecho_id for c in self.por_nombre.get(nombre, [])}
+
+    def indice_de_factor(self, factor_id: int) -> IndiceNumerico:
+        return self._indice(("id", factor_id), lambda: self.condiciones_de_factor(factor_id))
+
+    def indice_de_nombre(self, nombre: str) -> IndiceNumerico:
+        return self._indice(("nombre", nombre), lambda: self.por_nombre.get(nombre, []))
+
+    def _derivado(self, atributo: str, construir):
+        """
+        Índice derivado guardado en `atributo`, construido una sola vez: si varios
+        hilos lo piden a la vez, uno lo arma y los demás esperan ese resultado.
+        """
+        valor = getattr(self, atributo)
+        if valor is None:
+            with self._candados[atributo]:
+                valor = getattr(self, atributo)
+                if valor is None:
+                    valor = construir()
+                    setattr(self, atributo, valor)
+        return valor
+
+    @property
+    def bits(self) -> IndiceBits:
+        return self._derivado("_bits", lambda: IndiceBits(self))
+
+    @property
+    def matriz(self) -> Optional["vectorial.MatrizReglas"]:
+        """Matriz de incidencia para el puntaje con NumPy (None si NumPy no está instalado)."""
+        if not vectorial.disponible():
+            return None
+        return self._derivado("_matriz", lambda: vectorial.MatrizReglas(self))
+
+    @property
+    def flujo(self) -> TrieFlujo:
+        return self._derivado("_flujo", lambda: TrieFlujo(self, settings.FLUJO_MAX_NODOS))
+
+    @property
+    def puntaje(self):
+        """Motor de puntaje de /api/recomendar según settings.MOTOR_RECOMENDACION."""
+        if settings.MOTOR_RECOMENDACION == "numpy" and self.matriz is not None:
+            return self.matriz
+        return self.bits
+
+    def preparar(self) -> "BaseReglas":
+        """Construye los índices de las rutas calientes (puntaje y flujo de preguntas)."""
+        self.puntaje
+        # el archivo compartido lleva la matriz pero no el flujo: se escribe antes
+        # de armarlo, así los workers que lo esperan no esperan también el flujo
+        guardar_instantanea(self)
+        self.flujo
+        self.preparada = True
+        return self
+
+    def _armado(self, indice: str) -> bool:
+        if indice == "flujo":
+            return self._flujo is not None
+        if settings.MOTOR_RECOMENDACION == "numpy" and vectorial.disponible():
+            return self._matriz is not None
+        return self._bits is not None
+
+    async def esperar(self, indice: str):
+        """
+        `self.puntaje` o `self.flujo` desde código async. Si falta, se arma en un
+        hilo con una sola tarea por instantánea e índice: las peticiones que
+        llegan mientras tanto esperan esa misma tarea en lugar de ocupar cada
+        una un hilo del threadpool bloqueado en el candado de _derivado.
+        """
+        if self._armado(indice):
+            return getattr(self, indice)
+        loop = asyncio.get_running_loop()
+        tarea = self._tareas.get(indice)
+        if tarea is None or tarea.get_loop() is not loop:
+            tarea = loop.create_task(asyncio.to_thread(getattr, self, indice))
+            self._tareas[indice] = tarea
+
+            def olvidar(t: asyncio.Task) -> None:
+                # si falló, la próxima petición lo vuelve a intentar
+                if (t.cancelled() or t.exception() is not None) and self._tareas.get(indice) is t:
+                    del self._tareas[indice]
+
+            tarea.add_done_callback(olvidar)
+        # shield: si se cancela una petición que espera, la construcción sigue para las demás
+        return await asyncio.shield(tarea)
+
+    def _indice(self, clave: tuple, condiciones) -> IndiceNumerico:
+        indice = self._indices.get(clave)
+        if indice is None:
+            indice = self._indices[clave] = IndiceNumerico(condiciones())
+        return indice
+
+    # ---------- parches (devuelven una instantánea nueva) ----------
+    # Una escritura cambia unas pocas filas: la instantánea nueva comparte con
+    # esta las condiciones y las listas de los hechos, factores y nombres que no
+    # se tocaron (los diccionarios de primer nivel se copian, no se recorren), y
+    # los índices de los factores que no cambiaron.
+    def con_factor(self, factor: FactorInfo, version: int) -> "BaseReglas":
+        factores = dict(self.factores)
+        anterior = factores.get(factor.id)
+        factores[factor.id] = factor
+        if anterior is None and self.factores and factor.id < next(reversed(self.factores)):
+            factores = dict(sorted(factores.items()))
+        # si cambió el nombre, sus condiciones pasan a otro nombre de factor
+        renombradas = self.por_factor.get(factor.id, []) if anterior is None or anterior.clave != factor.clave else []
+        return self._parche(version, factores=factores, condiciones=renombradas)
+
+    def con_hecho(self, hecho: HechoInfo, version: int) -> "BaseReglas":
+        hechos = dict(self.hechos)
+        nuevo = hecho.id not in hechos
+        hechos[hecho.id] = hecho
+        if nuevo and self.hechos and hecho.id < next(reversed(self.hechos)):
+            hechos = dict(sorted(hechos.items()))
+        return self._parche(version, hechos=hechos, hechos_afectados=[hecho.id])
+
+    def con_condicion(self, condicion: Condicion, version: int) -> "BaseReglas":
+        return self._parche(version, condiciones=[condicion])
+
+    def sin_condicion(self, condicion_id: int, version: int) -> "BaseReglas":
+        return self._parche(version, retiradas=[condicion_id])
+
+    def _parche(
+        self,
+        version: int,
+        factores: Optional[Dict[int, FactorInfo]] = None,
+        hechos: Optional[Dict[int, HechoInfo]] = None,
+        condiciones: Iterable[Condicion] = (),
+        retiradas: Iterable[int] = (),
+        hechos_afectados: Iterable[int] = (),
+    ) -> "BaseReglas":
+        nueva = BaseReglas.__new__(BaseReglas)
+        nueva.version = version
+        nueva.version_bd = None
+        nueva.factores = self.factores if factores is None else factores
+        nueva.hechos = self.hechos if hechos is None else hechos
+        nueva.factores_por_nombre = (
+            self.factores_por_nombre if factores is None else {f.clave: f for f in nueva.factores.values()}
+        )
+
+        cambios = {c.id: _resolver(c, _clave(nueva.factores.get(c.factor_id))) for c in condiciones}
+        tocadas = set(cambios).union(retiradas)
+        anteriores = [self.condiciones[i] for i in tocadas if i in self.condiciones]
+        afectadas = anteriores + list(cambios.values())
+
+        nueva.condiciones = dict(self.condiciones)
+        for condicion_id in retiradas:
+            nueva.condiciones.pop(condicion_id, None)
+        ultimo = next(reversed(self.condiciones), 0)
+        nueva.condiciones.update(cambios)
+        if any(i < ultimo and i not in self.condiciones for i in cambios):
+            nueva.condiciones = dict(sorted(nueva.condiciones.items()))
+
+        # solo se copian las listas donde estaba o está cada condición tocada (siguen en orden de id)
+        nueva.por_hecho = self.por_hecho.copy()
+        nueva.por_factor = self.por_factor.copy()
+        nueva.por_nombre = self.por_nombre.copy()
+        for agrupadas, campo in (
+            (nueva.por_hecho, "hecho_id"), (nueva.por_factor, "factor_id"), (nueva.por_nombre, "factor_nombre")
+        ):
+            for clave in {getattr(c, campo) for c in afectadas}:
+                lista = list(agrupadas.get(clave, ()))
+                for c in anteriores:
+                    if getattr(c, campo) == clave:
+                        del lista[bisect_left(lista, c.id, key=_id)]
+                for c in cambios.values():
+                    if getattr(c, campo) == clave:
+                        insort(lista, c, key=_id)
+                if lista and (campo != "factor_nombre" or clave):
+                    agrupadas[clave] = lista
+                else:
+                    agrupadas.pop(clave, None)
+
+        # índices derivados: se conservan los de los factores que no cambiaron
+        nombres_afectados = {c.factor_nombre for c in afectadas}
+        descartados = {("id", c.factor_id) for c in afectadas} | {("nombre", n) for n in nombres_afectados}
+        nueva._indices = {clave: i for clave, i in dict(self._indices).items() if clave not in descartados}
+        hechos_afectados = {c.hecho_id for c in afectadas}.union(hechos_afectados)
+        nueva._bits = self._bits.parchear(nueva, nombres_afectados, hechos_afectados) if self._bits is not None else None
+        nueva._matriz = None
+        nueva._flujo = None  # lo arma el preparador en segundo plano (ver flujo_listo)
+        nueva._candados = _candados()
+        nueva._tareas = {}
+        nueva.preparada = False
+        return nueva
+
+
+def factor_info(factor: Factor) -> FactorInfo:
+    return FactorInfo(factor.id, factor.nombre, factor.categoria)
+
+
+def hecho_info(hecho: Hecho) -> HechoInfo:
+    return HechoInfo(hecho.id, hecho.descripcion)
+
+
+def condicion_info(regla: FactorHecho) -> Condicion:
+    return Condicion(regla.id, regla.factor_id, regla.hecho_id, regla.operador, regla.valor, "")
+
+
+def leer_tablas(db: Session) -> Tuple[List[FactorInfo], List[HechoInfo], List[Condicion]]:
+    """Lee las tres tablas con una consulta cada una (sin N+1)."""
+    factores = [FactorInfo(*row) for row in db.query(Factor.id, Factor.nombre, Factor.categoria)]
+    hechos = [HechoInfo(*row) for row in db.query(Hecho.id, Hecho.descripcion)]
+    condiciones = [
+        Condicion(*row, "")
+        for row in db.query(
+            FactorHecho.id, FactorHecho.factor_id, FactorHecho.hecho_id, FactorHecho.operador, FactorHecho.valor
+        )
+    ]
+    return factores, hechos, condiciones
+
+
+def leer_version_bd(db: Session, bloquear: bool = False) -> Optional[int]:
+    """
+    Versión de base_reglas_version (migración 3); None si la base no la tiene.
+    Con bloquear, la fila queda tomada hasta el commit (ver confirmar_escritura).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    sql = "SELECT version FROM base_reglas_version WHERE id = 1" + (" FOR UPDATE" if bloquear else "")
+    try:
+        with db.begin_nested():
+            return db.execute(text(sql)).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def confirmar_escritura(db: Session, antes: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    Commit de una escritura de reglas que empezó con antes = leer_version_bd(db, bloquear=True).
+    Con la fila tomada no se intercala ninguna otra escritura, así que la versión
+    leída antes del commit es exactamente la de este cambio. Devuelve
+    (antes, después) para registrar_* (None sin base_reglas_version).
+    """
+    db.flush()
+    despues = leer_version_bd(db) if antes is not None else None
+    db.commit()
+    return None if despues is None else (antes, despues)
+
+
+def cargar_base(db: Session, version: int = 0) -> BaseReglas:
+    # la versión se lee antes que las tablas: si cambian en el medio, la
+    # instantánea queda marcada con una versión vieja y se vuelve a cargar
+    version_bd = leer_version_bd(db)
+    base = BaseReglas(*leer_tablas(db), version)
+    base.version_bd = version_bd
+    return base
+
+
+# ============================================================
+#      INSTANTÁNEA COMPARTIDA (archivo mmap entre workers)
+# ============================================================
+def _compartida() -> bool:
+    return bool(settings.INSTANTANEA_DIR) and vectorial.disponible()
+
+
+# versiones que este proceso reservó para escribir (ver instantanea.reservar)
+_reservadas: Set[int] = set()
+
+
+def _liberar_reserva(version_bd: Optional[int]) -> None:
+    if version_bd in _reservadas:
+        _reservadas.discard(version_bd)
+        instantanea.liberar(settings.INSTANTANEA_DIR, version_bd)
+
+
+def guardar_instantanea(base: BaseReglas) -> None:
+    """
+    Escribe la instantánea de una base leída de la base de datos, si no existe
+    ya y ningún otro worker la está escribiendo.
+    """
+    if not _compartida() or base.version_bd is None:
+        return
+    if base.version_bd in instantanea.versiones(settings.INSTANTANEA_DIR):
+        _liberar_reserva(base.version_bd)
+        return
+    if base.version_bd not in _reservadas:
+        if not instantanea.reservar(settings.INSTANTANEA_DIR, base.version_bd, settings.INSTANTANEA_ESPERA):
+            return
+        _reservadas.add(base.version_bd)
+    try:
+        _escribir_instantanea(base)
+    finally:
+        _liberar_reserva(base.version_bd)
+
+
+def _escribir_instantanea(base: BaseReglas) -> None:
+    np = vectorial.np
+    textos: Dict[str, int] = {}
+
+    def indices(valores) -> "np.ndarray":
+        return np.array([-1 if v is None else textos.setdefault(v, len(textos)) for v in valores], dtype=np.int32)
+
+    factores = list(base.factores.values())
+    hechos = list(base.hechos.values())
+    condiciones = list(base.condiciones.values())
+    secciones = {
+        "factor_id": np.array([f.id for f in factores], dtype=np.int64),
+        "factor_nombre": indices(f.nombre for f in factores),
+        "factor_categoria": indices(f.categoria for f in factores),
+        "hecho_id": np.array([h.id for h in hechos], dtype=np.int64),
+        "hecho_descripcion": indices(h.descripcion for h in hechos),
+        "regla_id": np.array([c.id for c in condiciones], dtype=np.int64),
+        "regla_factor": np.array([c.factor_id for c in condiciones], dtype=np.int64),
+        "regla_hecho": np.array([c.hecho_id for c in condiciones], dtype=np.int64),
+        "regla_operador": indices(c.operador for c in condiciones),
+        "regla_valor": indices(c.valor for c in condiciones),
+    }
+    matriz = base._matriz
+    if matriz is not None:
+        # cada columna se guarda como un (operador, valor) que compila a su predicado
+        origen = {}
+        for c in condiciones:
+            origen.setdefault((c.factor_nombre, c.predicado), (c.operador, c.valor))
+        columnas = matriz.definiciones()
+        secciones.update(
+            matriz_orden=np.array(matriz.orden, dtype=np.int64),
+            matriz_totales=matriz.totales,
+            matriz_filas=matriz.filas,
+            matriz_columnas=matriz.columnas,
+            columna_factor=indices(nombre for nombre, _ in columnas),
+            columna_operador=indices(origen[d][0] for d in columnas),
+            columna_valor=indices(origen[d][1] for d in columnas),
+        )
+    try:
+        ruta = instantanea.escribir(settings.INSTANTANEA_DIR, base.version_bd, secciones, list(textos))
+        print(f"💾 Instantánea de la base de reglas (versión {base.version_bd}) escrita en {ruta}")
+    except OSError as e:
+        print("⚠️ No se pudo escribir la instantánea de la base de reglas:", repr(e))
+
+
+def abrir_instantanea(version: int, version_bd: int) -> Optional[BaseReglas]:
+    """
+    Base de reglas desde el archivo compartido de `version_bd`, o None si hay
+    que cargarla de la base. Si el archivo no existe, el primer worker que lo
+    pide lo reserva (lo escribirá guardar_instantanea) y los demás lo esperan.
+    Factores, hechos y reglas se copian a objetos de Python (.tolist()); la
+    matriz de puntaje usa los arreglos del mmap sin copiarlos.
+    """
+    if not _compartida():
+        return None
+    leida = instantanea.abrir(settings.INSTANTANEA_DIR, version_bd)
+    if leida is None:
+        if instantanea.reservar(settings.INSTANTANEA_DIR, version_bd, settings.INSTANTANEA_ESPERA):
+            _reservadas.add(version_bd)
+            return None
+        leida = instantanea.esperar(settings.INSTANTANEA_DIR, version_bd, settings.INSTANTANEA_ESPERA)
+        if leida is None:
+            return None
+    s, textos = leida.secciones, leida.textos
+
+    def columna(nombre: str) -> list:
+        return [None if i < 0 else textos[i] for i in s[nombre].tolist()]
+
+    base = BaseReglas(
+        map(FactorInfo, s["factor_id"].tolist(), columna("factor_nombre"), columna("factor_categoria")),
+        map(HechoInfo, s["hecho_id"].tolist(), columna("hecho_descripcion")),
+        map(
+            Condicion,
+            s["regla_id"].tolist(),
+            s["regla_factor"].tolist(),
+            s["regla_hecho"].tolist(),
+            columna("regla_operador"),
+            columna("regla_valor"),
+            repeat(""),
+        ),
+        version,
+    )
+    base.version_bd = leida.version_bd
+    if "matriz_filas" in s:
+        definiciones = [
+            (nombre, compilar(operador, valor))
+            for nombre, operador, valor in zip(
+                columna("columna_factor"), columna("columna_operador"), columna("columna_valor")
+            )
+        ]
+        base._matriz = vectorial.MatrizReglas.desde_columnas(
+            s["matriz_orden"].tolist(), s["matriz_totales"], s["matriz_filas"], s["matriz_columnas"], definiciones
+        )
+    print(f"💾 Base de reglas abierta desde la instantánea compartida (versión {leida.version_bd})")
+    return base
+
+
+# ============================================================
+#           INSTANTÁNEA VIGENTE (una por proceso)
+# ============================================================
+_estado_lock = threading.Lock()
+_carga_lock = threading.Lock()
+_carga_async_lock = asyncio.Lock()
+_base: Optional[BaseReglas] = None
+_version = 0
+# última versión de la base de datos conocida (la anota core/invalidacion.py)
+_version_bd: Optional[int] = None
+# distingue las versiones de este proceso de las de otro arranque o worker
+_arranque = secrets.token_hex(4)
+
+
+class Accesos:
+    """Aciertos (instantánea ya publicada) y fallos (hubo que cargarla de la base), para /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def acierto(self, base: BaseReglas) -> BaseReglas:
+        with self.lock:
+            self.aciertos += 1
+        return base
+
+    def fallo(self) -> None:
+        with self.lock:
+            self.fallos += 1
+
+
+accesos = Accesos()
+
+
+def version_vigente() -> int:
+    """Versión que tendrá la instantánea vigente (no toca la base de datos)."""
+    return _version
+
+
+def etiqueta_version(version: int) -> str:
+    """ETag (débil) de las respuestas construidas con la versión dada (válida solo en este proceso)."""
+    return f'W/"{_arranque}-{version}"'
+
+
+def etiqueta_base(base: BaseReglas) -> str:
+    """
+    ETag de una respuesta construida con `base`: la de su versión de la base de
+    datos, igual en todos los workers; si no se conoce (SQLite, o un parche
+    sobre una instantánea de versión desconocida), la de este proceso.
+    """
+    if base.version_bd is not None:
+        return etiqueta_version_bd(base.version_bd)
+    return etiqueta_version(base.version)
+
+
+def etiqueta_version_bd(version_bd: int) -> str:
+    """ETag (débil) de las respuestas consultadas con base_reglas_version = version_bd (igual en todos los workers)."""
+    return f'W/"bd-{version_bd}"'
+
+
+def obtener_base(db: Session) -> BaseReglas:
+    """Devuelve la instantánea vigente; la carga desde la base solo si no existe."""
+    base = _base
+    if base is not None:
+        return accesos.acierto(base)
+    with _carga_lock:
+        base = _base
+        if base is not None:
+            return accesos.acierto(base)
+        accesos.fallo()
+        version = _version
+        version_bd = leer_version_bd(db) if _al_arrancar(version) else _version_bd
+        base = abrir_instantanea(version, version_bd) if version_bd is not None else None
+        if base is None:
+            base = cargar_base(db, version)
+        with _estado_lock:
+            # si hubo escrituras mientras se leía, la carga puede estar desactualizada:
+            # se usa para esta petición pero no se publica
+            if version == _version:
+                _publicar(base)
+        _soltar_otras(version_bd, base)
+        return base
+
+
+async def obtener_base_async(db) -> BaseReglas:
+    """
+    obtener_base para una AsyncSession. Las consultas corren con run_sync sobre
+    el event loop, así que la espera usa un asyncio.Lock (un threading.Lock
+    tomado mientras se espera la base bloquearía el loop) y la construcción de
+    la instantánea, que es puro CPU, va a un hilo.
+    """
+    base = _base
+    if base is not None:
+        return accesos.acierto(base)
+    async with _carga_async_lock:
+        base = _base
+        if base is not None:
+            return accesos.acierto(base)
+        accesos.fallo()
+        version = _version
+        version_bd = await db.run_sync(leer_version_bd) if _al_arrancar(version) else _version_bd
+        base = await asyncio.to_thread(abrir_instantanea, version, version_bd) if version_bd is not None else None
+        if base is None:
+            leida_bd = await db.run_sync(leer_version_bd)
+            tablas = await db.run_sync(leer_tablas)
+            base = await asyncio.to_thread(BaseReglas, *tablas, version)
+            base.version_bd = leida_bd
+        with _estado_lock:
+            if version == _version:
+                _publicar(base)
+        _soltar_otras(version_bd, base)
+        return base
+
+
+def base_vigente() -> Optional[BaseReglas]:
+    """Instantánea publicada, o None si hay que cargarla."""
+    return _base
+
+
+# ============================================================
+#        PREPARACIÓN EN SEGUNDO PLANO (puntaje y flujo)
+# ============================================================
+# Cada instantánea que se publica se prepara en un hilo propio, una a la vez,
+# en lugar de armar sus índices dentro de la petición que llega después de una
+# escritura. Mientras el flujo de preguntas no está, /api/preguntas y
+# /api/pregunta-siguiente calculan la respuesta sobre la misma instantánea
+# (motor/flujo.py), nunca sobre una versión anterior.
+def flujo_listo(base: BaseReglas) -> Optional[TrieFlujo]:
+    """Flujo de preguntas de `base` si ya está armado; si no, pide armarlo en segundo plano y devuelve None."""
+    if base._flujo is not None:
+        return base._flujo
+    preparador.pedir(base)
+    return None
+
+
+class Preparador:
+    """
+    Hilo que arma los índices de las instantáneas publicadas (base.preparar()).
+    Una construcción a la vez: si se publican varias versiones mientras arma
+    una, al terminar sigue con la más nueva y descarta las intermedias.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pendiente: Optional[BaseReglas] = None
+        self._hilo: Optional[threading.Thread] = None
+        self.construcciones = 0
+
+    def pedir(self, base: BaseReglas) -> None:
+        if base.preparada:
+            return
+        with self._lock:
+            if self._pendiente is not None and self._pendiente.version > base.version:
+                return
+            self._pendiente = base
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._correr, name="preparar-base-reglas", daemon=True)
+                self._hilo.start()
+
+    def _correr(self) -> None:
+        while True:
+            with self._lock:
+                base, self._pendiente = self._pendiente, None
+                if base is None:
+                    self._hilo = None
+                    return
+            if base.preparada or base.version < _version:
+                _liberar_reserva(base.version_bd)
+                continue  # ya lista, o reemplazada por una escritura posterior
+            try:
+                base.preparar()
+                self.construcciones += 1
+            except Exception as e:
+                print("⚠️ No se pudo preparar la base de reglas:", repr(e))
+
+
+preparador = Preparador()
+
+
+def _al_arrancar(version: int) -> bool:
+    # solo se abre el archivo de la versión que tiene la base de datos. Después
+    # de arrancar la anota la escucha (_version_bd); al arrancar (nada cargado
+    # ni invalidado todavía) se lee de la base antes de confiar en un archivo
+    # que puede haber quedado de una versión vieja. Tras una escritura local
+    # (_version_bd en None) se carga directamente de la base.
+    return _version_bd is None and version == 0 and _compartida()
+
+
+def _soltar_otras(reservada: Optional[int], base: BaseReglas) -> None:
+    """Libera la reserva de `reservada` si la base que se cargó no la va a escribir."""
+    if base.version_bd != reservada or base is not _base:
+        _liberar_reserva(reservada)
+
+
+def anotar_version_bd(version_bd: int) -> bool:
+    """
+    Registra la versión vigente en la base de datos. Devuelve True si la
+    instantánea publicada se leyó de otra versión (p. ej. un archivo compartido
+    viejo al arrancar) y hay que descartarla.
+    """
+    global _version_bd
+    _version_bd = version_bd
+    base = _base
+    return base is not None and base.version_bd is not None and base.version_bd != version_bd
+
+
+def invalidar_base() -> None:
+    """Descarta la instantánea; la siguiente lectura recarga desde la base."""
+    global _base, _version, _version_bd
+    with _estado_lock:
+        _version += 1
+        _base = None
+        _version_bd = None  # la escritura que invalidó puede no tener archivo todavía
+        cache_resultados.invalidar(_version)
+
+
+def _publicar(base: Optional[BaseReglas]) -> None:
+    global _base
+    _base = base
+    if base is not None:
+        preparador.pedir(base)
+
+
+def _parchear(aplicar, versiones: Optional[Tuple[int, int]]) -> None:
+    global _version
+    with _estado_lock:
+        _version += 1
+        cache_resultados.invalidar(_version)
+        if _base is not None:
+            nueva = aplicar(_base, _version)
+            # el parche es exactamente la versión `después` de la base de datos
+            # solo si se aplicó sobre `antes` (con escrituras concurrentes en
+            # este proceso el orden puede cambiar: entonces queda desconocida)
+            if versiones is not None and _base.version_bd == versiones[0]:
+                nueva.version_bd = versiones[1]
+            _publicar(nueva)
+
+
+def registrar_factor(factor: Factor, versiones: Optional[Tuple[int, int]] = None) -> None:
+    info = factor_info(factor)
+    _parchear(lambda base, version: base.con_factor(info, version), versiones)
+
+
+def registrar_hecho(hecho: Hecho, versiones: Optional[Tuple[int, int]] = None) -> None:
+    info = hecho_info(hecho)
+    _parchear(lambda base, version: base.con_hecho(info, version), versiones)
+
+
+def registrar_regla(regla: FactorHecho, versiones: Optional[Tuple[int, int]] = None) -> None:
+    info = condicion_info(regla)
+    _parchear(lambda base, version: base.con_condicion(info, version), versiones)
+
+
+def retirar_regla(regla_id: int, versiones: Optional[Tuple[int, int]] = None) -> None:
+    _parchear(lambda base, version: base.sin_condicion(regla_id, version), versiones)
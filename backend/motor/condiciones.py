@@ -0,0 +1,270 @@
+# ------------------------------------------------------------------------------
+# Condiciones de las reglas (FactorHecho) compiladas a predicados.
+# evaluar_condicion() vuelve a normalizar y a recorrer el texto de la regla en
+# cada llamada. Aquí cada par (operador, valor) se compila una sola vez a un
+# Predicado con sus límites enteros ya extraídos, y cada respuesta del usuario
+# se analiza una sola vez por petición (Respuesta). cumple() recorre exactamente
+# el mismo árbol de decisiones que evaluar_condicion(), incluidos los casos en
+# los que esta devolvía False por una excepción al convertir a entero.
+# ------------------------------------------------------------------------------
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+PREFIJOS_MAYOR = (">=", "=>")
+PREFIJOS_MENOR = ("<=", "=<")
+
+# tipos de predicado
+IGUALDAD = "igualdad"    # comparación de texto (incluye reglas sin número)
+RANGO = "rango"          # "a-b"
+MINIMO = "minimo"        # ">=x" o operador >=
+MAXIMO = "maximo"        # "<=x" o operador <=
+COMPUESTO = "compuesto"  # cota inferior y superior a la vez, o número ilegible
+NUNCA = "nunca"          # rango ilegible: evaluar_condicion siempre daba False
+
+# las cotas de los índices se guardan en int64; las que no caben se evalúan con cumple()
+LIMITE = 2 ** 62
+
+
+class _Error:
+    """Marca un número que int() no pudo convertir (evaluar_condicion devolvía False)."""
+
+    def __repr__(self):
+        return "ERROR"
+
+
+ERROR = _Error()
+Numero = Union[int, _Error]
+
+
+def _digitos(texto: str) -> str:
+    return "".join(ch for ch in texto if ch.isdigit())
+
+
+def _entero(texto: str) -> Numero:
+    try:
+        return int(texto)
+    except ValueError:
+        return ERROR
+
+
+def _partes(texto: str) -> Union[List[int], _Error]:
+    partes = []
+    for p in texto.split("-"):
+        if any(ch.isdigit() for ch in p):
+            n = _entero(_digitos(p))
+            if n is ERROR:
+                return ERROR
+            partes.append(n)
+    return partes
+
+
+class Predicado(NamedTuple):
+    tipo: str
+    texto: str                          # valor de la regla normalizado
+    rango: Optional[Tuple[int, int]]
+    minimo: Optional[Numero]
+    maximo: Optional[Numero]
+
+
+class Respuesta(NamedTuple):
+    vacia: bool
+    texto: str
+    entero: Optional[Numero]            # solo si la respuesta es un número
+    mayor: bool                         # empieza con >= o =>
+    menor: bool                         # empieza con <= o =<
+    digitos: Optional[Numero]           # todos sus dígitos, solo si tiene prefijo
+    partes: Union[List[int], _Error, None]  # solo si contiene "-"
+
+
+def indexable(p: "Predicado") -> bool:
+    """True si las cotas del predicado entran en los índices (int64)."""
+    if p.tipo == RANGO:
+        return p.rango[0] < LIMITE and p.rango[1] < LIMITE
+    if p.tipo == MINIMO:
+        return p.minimo < LIMITE
+    if p.tipo == MAXIMO:
+        return p.maximo < LIMITE
+    return True
+
+
+@lru_cache(maxsize=65536)
+def compilar(operador, valor_regla) -> Predicado:
+    """Compila una condición; reglas con el mismo texto comparten el predicado."""
+    texto = str(valor_regla).strip().lower()
+    op = (operador or "").strip() or "="
+
+    if op in ("=", "==") and not texto.startswith(PREFIJOS_MAYOR + PREFIJOS_MENOR) and "-" not in texto:
+        return Predicado(IGUALDAD, texto, None, None, None)
+
+    rango = None
+    if "-" in texto:
+        partes = _partes(texto)
+        if partes is ERROR:
+            return Predicado(NUNCA, texto, None, None, None)
+        if len(partes) == 2:
+            rango = (partes[0], partes[1])
+
+    numero = _entero(_digitos(texto)) if any(ch.isdigit() for ch in texto) else None
+    minimo = numero if texto.startswith(PREFIJOS_MAYOR) or op in PREFIJOS_MAYOR else None
+    maximo = numero if texto.startswith(PREFIJOS_MENOR) or op in PREFIJOS_MENOR else None
+
+    if rango is not None:
+        tipo = RANGO
+    elif minimo is None and maximo is None:
+        tipo = IGUALDAD
+    elif maximo is None and minimo is not ERROR:
+        tipo = MINIMO
+    elif minimo is None and maximo is not ERROR:
+        tipo = MAXIMO
+    else:
+        tipo = COMPUESTO
+    return Predicado(tipo, texto, rango, minimo, maximo)
+
+
+def parsear_respuesta(valor_respuesta) -> Respuesta:
+    """Analiza una respuesta del usuario una sola vez por petición."""
+    if not valor_respuesta:
+        return RESPUESTA_VACIA
+    texto = str(valor_respuesta).strip().lower()
+    mayor = texto.startswith(PREFIJOS_MAYOR)
+    menor = texto.startswith(PREFIJOS_MENOR)
+    return Respuesta(
+        vacia=False,
+        texto=texto,
+        entero=_entero(texto) if texto.isdigit() else None,
+        mayor=mayor,
+        menor=menor,
+        digitos=_entero(_digitos(texto)) if mayor or menor else None,
+        partes=_partes(texto) if "-" in texto else None,
+    )
+
+
+RESPUESTA_VACIA = Respuesta(True, "", None, False, False, None, None)
+
+
+def cumple(p: Predicado, r: Respuesta) -> bool:
+    """Equivale a evaluar_condicion(operador, valor_regla, valor_respuesta)."""
+    if r.vacia:
+        return False
+    if p.tipo == IGUALDAD:
+        return r.texto == p.texto
+    if p.tipo == NUNCA:
+        return False
+
+    # regla como rango "a-b"
+    if p.rango is not None:
+        low_r, high_r = p.rango
+        if r.partes is not None:
+            if r.partes is ERROR:
+                return False
+            if len(r.partes) == 2:
+                return r.partes[0] >= low_r and r.partes[1] <= high_r
+        if r.entero is not None:
+            return r.entero is not ERROR and low_r <= r.entero <= high_r
+        if r.mayor:
+            return r.digitos is not ERROR and r.digitos >= low_r
+        if r.menor:
+            return r.digitos is not ERROR and r.digitos <= high_r
+
+    # regla >=X (por valor o por operador)
+    if p.minimo is not None:
+        if p.minimo is ERROR:
+            return False
+        if r.entero is not None:
+            return r.entero is not ERROR and r.entero >= p.minimo
+        if r.mayor:
+            return r.digitos is not ERROR and r.digitos >= p.minimo
+        if r.partes is not None:
+            if r.partes is ERROR:
+                return False
+            if len(r.partes) == 2:
+                return r.partes[0] >= p.minimo
+
+    # regla <=X
+    if p.maximo is not None:
+        if p.maximo is ERROR:
+            return False
+        if r.entero is not None:
+            return r.entero is not ERROR and r.entero <= p.maximo
+        if r.menor:
+            return r.digitos is not ERROR and r.digitos <= p.maximo
+        if r.partes is not None:
+            if r.partes is ERROR:
+                return False
+            if len(r.partes) == 2:
+                return r.partes[1] <= p.maximo
+
+    # ultima opcion: comparar texto
+    return r.texto == p.texto
+
+
+def evaluar_condicion(operador, valor_regla, valor_respuesta):
+    """
+    Evalua si la respuesta del usuario coincide con la condicion de la regla.
+    Soporta '=' y comparadores numericos '<=' '>=' y rangos tipo '1000-2000' o '>=3000'.
+    Se conserva como referencia: el motor usa compilar() + cumple(), que dan lo mismo.
+    """
+    if not valor_respuesta:
+        return False
+
+    val_resp = str(valor_respuesta).strip().lower()
+    val_regla = str(valor_regla).strip().lower()
+    op = (operador or "").strip() or "="
+
+    # igualdad textual (incluye rangos exactos)
+    if op in ("=", "==") and not val_regla.startswith((">=", "=>", "<=", "=<")) and "-" not in val_regla:
+        return val_resp == val_regla
+
+    try:
+        # regla como rango "a-b"
+        if "-" in val_regla:
+            parts_regla = [int("".join(ch for ch in p if ch.isdigit())) for p in val_regla.split("-") if any(ch.isdigit() for ch in p)]
+            if len(parts_regla) == 2:
+                low_r, high_r = parts_regla
+                if "-" in val_resp:
+                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
+                    if len(parts_resp) == 2:
+                        low_u, high_u = parts_resp
+                        return low_u >= low_r and high_u <= high_r
+                if val_resp.isdigit():
+                    num_resp = int(val_resp)
+                    return low_r <= num_resp <= high_r
+                if val_resp.startswith(">=") or val_resp.startswith("=>"):
+                    num_resp = int("".join(ch for ch in val_resp if ch.isdigit()))
+                    return num_resp >= low_r
+                if val_resp.startswith("<=") or val_resp.startswith("=<"):
+                    num_resp = int("".join(ch for ch in val_resp if ch.isdigit()))
+                    return num_resp <= high_r
+
+        # regla >=X (por valor o por operador)
+        if val_regla.startswith(">=") or val_regla.startswith("=>") or op in (">=", "=>"):
+            num_regla = int("".join(ch for ch in val_regla if ch.isdigit())) if any(ch.isdigit() for ch in val_regla) else None
+            if num_regla is not None:
+                if val_resp.isdigit():
+                    return int(val_resp) >= num_regla
+                if val_resp.startswith(">=") or val_resp.startswith("=>"):
+                    return int("".join(ch for ch in val_resp if ch.isdigit())) >= num_regla
+                if "-" in val_resp:
+                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
+                    if len(parts_resp) == 2:
+                        low_u, _ = parts_resp
+                        return low_u >= num_regla
+
+        # regla <=X
+        if val_regla.startswith("<=") or val_regla.startswith("=<") or op in ("<=", "=<"):
+            num_regla = int("".join(ch for ch in val_regla if ch.isdigit())) if any(ch.isdigit() for ch in val_regla) else None
+            if num_regla is not None:
+                if val_resp.isdigit():
+                    return int(val_resp) <= num_regla
+                if val_resp.startswith("<=") or val_resp.startswith("=<"):
+                    return int("".join(ch for ch in val_resp if ch.isdigit())) <= num_regla
+                if "-" in val_resp:
+                    parts_resp = [int("".join(ch for ch in p if ch.isdigit())) for p in val_resp.split("-") if any(ch.isdigit() for ch in p)]
+                    if len(parts_resp) == 2:
+                        _, high_u = parts_resp
+                        return high_u <= num_regla
+
+        # ultima opcion: comparar texto
+        return val_resp == val_regla
+    except Exception:
+        return False
\ No newline at end of file
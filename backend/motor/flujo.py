@@ -0,0 +1,250 @@
+# ------------------------------------------------------------------------------
+# Flujo guiado de preguntas (altitud, clima, suelo) y su trie precalculado.
+# El flujo es fijo y el número de caminos de respuesta distintos es chico y
+# queda determinado por la base de reglas. TrieFlujo recorre una vez, por
+# versión de la base, todos los caminos alcanzables desde las opciones que se
+# ofrecen y guarda en cada nodo la siguiente pregunta, sus candidatos y lo que
+# devuelve /api/preguntas para cada altitud. Servir un paso es entonces
+# recorrer diccionarios; las respuestas fuera de las opciones ofrecidas se
+# calculan como siempre.
+# ------------------------------------------------------------------------------
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from motor.condiciones import parsear_respuesta
+
+
+def construir_pregunta_altitud(base, alt_factor) -> Optional[dict]:
+    """Pregunta inicial de altitud con una opcion por cada valor distinto de sus reglas."""
+    if not alt_factor:
+        return None
+    seen = set()
+    options = []
+    for row in base.condiciones_de_factor(alt_factor.id):
+        raw_value = (row.valor or "").strip()
+        if not raw_value:
+            continue
+        op = (row.operador or "").strip() or "="
+        normalized = raw_value
+        if op in (">=", "=>") and not normalized.startswith((">=", "=>")):
+            normalized = f">={raw_value}"
+        if op in ("<=", "=<") and not normalized.startswith(("<=", "=<")):
+            normalized = f"<={raw_value}"
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+
+        if "-" in raw_value:
+            label = f"{raw_value} msnm"
+        elif normalized.startswith(">=") or op in (">=", "=>"):
+            label = f">= {raw_value} msnm"
+        elif normalized.startswith("<=") or op in ("<=", "=<"):
+            label = f"<= {raw_value} msnm"
+        else:
+            label = f"{raw_value} msnm"
+        options.append({"v": normalized, "t": label})
+
+    if not options:
+        return None
+    return {"id": "altitud", "text": alt_factor.nombre or "Altitud", "options": options}
+
+
+def opciones_factor(base, factor, hechos: set) -> List[dict]:
+    """
+    Valores distintos del factor entre las reglas de los hechos dados.
+    Si quedan menos de dos opciones se completan con los valores de todas sus reglas.
+    """
+    condiciones = base.condiciones_de_factor(factor.id)
+    opciones = []
+    vistos = set()
+
+    def agregar(valor):
+        v = (valor or "").strip()
+        if not v:
+            return
+        norm = v.lower()
+        if norm in vistos:
+            return
+        vistos.add(norm)
+        opciones.append({"v": norm, "t": v})
+
+    for row in condiciones:
+        if row.hecho_id in hechos:
+            agregar(row.valor)
+    if len(opciones) < 2:
+        for row in condiciones:
+            agregar(row.valor)
+
+    return sorted(opciones, key=lambda o: (o.get("t") or o.get("v") or "").lower())
+
+
+def preguntas(base, altitud: Optional[str]) -> List[dict]:
+    """
+    Provee el flujo de preguntas ordenado: primero altitud, luego factores compatibles.
+    - Sin altitud => solo pregunta inicial.
+    - Con altitud => clima y suelo de los hechos que cumplen esa condicion.
+    """
+    alt_factor = base.factor("altitud")
+    clima_factor = base.factor("clima")
+    suelo_factor = base.factor("suelo")
+
+    alt_q = construir_pregunta_altitud(base, alt_factor)
+    resultado = [alt_q] if alt_q else []
+    if not altitud or not alt_factor:
+        return resultado
+
+    hechos_validos = base.indice_de_factor(alt_factor.id).hechos_que_cumplen(parsear_respuesta(altitud))
+    if not hechos_validos:
+        return resultado
+
+    for factor in (clima_factor, suelo_factor):
+        if not factor:
+            continue
+        opciones = opciones_factor(base, factor, hechos_validos)
+        if opciones:
+            nombre_factor = factor.clave
+            resultado.append({
+                "id": nombre_factor,
+                "text": factor.nombre or nombre_factor,
+                "options": opciones,
+            })
+
+    return resultado
+
+
+def siguiente_pregunta(base, resp: dict, candidatos: int) -> dict:
+    """Siguiente pregunta para las respuestas dadas, con `candidatos` ya filtrados por ellas."""
+    alt_factor = base.factor("altitud")
+    allowed = [alt_factor, base.factor("clima"), base.factor("suelo")]
+
+    if not resp.get("altitud"):
+        alt_q = construir_pregunta_altitud(base, alt_factor)
+        return {"pregunta": alt_q, "pendientes": 1 if alt_q else 0}
+
+    hechos_candidatos = base.bits.ids(candidatos)
+    if not hechos_candidatos:
+        return {"pregunta": None, "pendientes": 0, "message": "No quedan hechos compatibles con tus respuestas."}
+
+    pendientes = []
+    for f in allowed:
+        if not f or f == alt_factor:
+            continue
+        if f.clave not in resp:
+            pendientes.append(f)
+    if not pendientes:
+        return {"pregunta": None, "pendientes": 0}
+
+    factor = pendientes[0]
+    options = opciones_factor(base, factor, hechos_candidatos)
+    if not options:
+        return {"pregunta": None, "pendientes": 0}
+
+    nombre_factor = factor.clave
+    return {
+        "pregunta": {"id": nombre_factor, "text": factor.nombre or nombre_factor, "options": options},
+        "pendientes": len(pendientes),
+    }
+
+
+class NodoFlujo:
+    __slots__ = ("respuestas", "candidatos", "resultado", "hijos")
+
+    def __init__(self, respuestas: Dict[str, str], candidatos: int, resultado: dict):
+        self.respuestas = respuestas
+        self.candidatos = candidatos
+        self.resultado = resultado
+        self.hijos: Dict[str, "NodoFlujo"] = {}
+
+
+class ConstruccionesFlujo:
+    """Tries armados en este proceso, su tiempo total y el reporte del último, para /ready y /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.segundos = 0.0
+        self.ultimo: Optional[dict] = None
+
+    def anotar(self, reporte: dict) -> None:
+        with self.lock:
+            self.total += 1
+            self.segundos += reporte["ms"] / 1000
+            self.ultimo = reporte
+
+
+construcciones_flujo = ConstruccionesFlujo()
+
+
+class TrieFlujo:
+    def __init__(self, base, max_nodos: int):
+        inicio = time.perf_counter()
+        self.base = base
+        indice = base.bits
+        self.raiz = NodoFlujo({}, indice.todos, siguiente_pregunta(base, {}, indice.todos))
+        self.nodos = 1
+        self.completo = True
+
+        # a lo ancho: si se llega al máximo quedan precalculados los primeros pasos
+        cola = deque([self.raiz])
+        while cola and self.completo:
+            nodo = cola.popleft()
+            pregunta = nodo.resultado.get("pregunta")
+            if not pregunta:
+                continue
+            for opcion in pregunta["options"]:
+                valor = opcion["v"]
+                if valor in nodo.hijos:
+                    continue
+                if self.nodos >= max_nodos:
+                    self.completo = False
+                    break
+                respuestas = {**nodo.respuestas, pregunta["id"]: valor}
+                candidatos = indice.filtrar(nodo.candidatos, {pregunta["id"]: parsear_respuesta(valor)})
+                hijo = NodoFlujo(respuestas, candidatos, siguiente_pregunta(base, respuestas, candidatos))
+                nodo.hijos[valor] = hijo
+                cola.append(hijo)
+                self.nodos += 1
+
+        # lo que devuelve /api/preguntas sin altitud y para cada altitud ofrecida
+        self.por_altitud: Dict[Optional[str], List[dict]] = {None: preguntas(base, None)}
+        alt_q = construir_pregunta_altitud(base, base.factor("altitud"))
+        for opcion in (alt_q or {}).get("options", []):
+            self.por_altitud[opcion["v"]] = preguntas(base, opcion["v"])
+
+        self.reporte = {
+            "version": base.version,
+            "nodos": self.nodos,
+            "altitudes": len(self.por_altitud) - 1,
+            "completo": self.completo,
+            "ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+        construcciones_flujo.anotar(self.reporte)
+        print("🌳 Flujo de preguntas precalculado:", self.reporte)
+
+    def buscar(self, respuestas: Dict[str, str]) -> Optional[NodoFlujo]:
+        """Nodo del camino exacto de respuestas, o None si no está precalculado."""
+        nodo = self.raiz
+        pendientes = dict(respuestas)
+        while pendientes:
+            pregunta = nodo.resultado.get("pregunta")
+            if not pregunta:
+                return None
+            valor = pendientes.pop(pregunta["id"], None)
+            if valor is None:
+                return None
+            nodo = nodo.hijos.get(valor)
+            if nodo is None:
+                return None
+        return nodo
+
+    def precalculadas(self, altitud: Optional[str]) -> Optional[List[dict]]:
+        """Preguntas ya armadas para esa altitud, o None si no están en el flujo."""
+        return self.por_altitud.get(altitud or None)
+
+    def preguntas(self, altitud: Optional[str]) -> List[dict]:
+        resultado = self.precalculadas(altitud)
+        if resultado is None:
+            resultado = preguntas(self.base, altitud)
+        return resultado
@@ -0,0 +1,201 @@
+# ------------------------------------------------------------------------------
+# Índice invertido (factor, valor normalizado) -> conjunto de hechos en bits.
+# Cada hecho ocupa una posición fija (orden por id) y un conjunto de hechos es
+# un int de Python usado como bitset. Así:
+# - candidatos de pregunta_siguiente = AND de las máscaras de cada respuesta;
+# - coincidencias por hecho en recomendar = suma de unas pocas máscaras.
+# Las igualdades (clima=húmedo, suelo=arcilloso) salen directo del diccionario;
+# los factores con reglas numéricas pasan por IndiceNumerico. Los hechos con
+# más de una condición sobre el mismo factor se cuentan condición por condición.
+# ------------------------------------------------------------------------------
+import copy
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from motor.condiciones import IGUALDAD, Respuesta, cumple
+
+
+def a_bits(posiciones: Iterable[int], tamano: int) -> int:
+    """Convierte posiciones a bitset sin desplazar enteros grandes por cada una."""
+    buffer = bytearray((tamano + 7) // 8)
+    for pos in posiciones:
+        buffer[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def posiciones(bits: int) -> Iterator[int]:
+    """Posiciones de los bits encendidos, de menor a mayor."""
+    texto = bin(bits)[:1:-1]
+    i = texto.find("1")
+    while i >= 0:
+        yield i
+        i = texto.find("1", i + 1)
+
+
+class _IndiceFactor:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.tiene = 0            # hechos con alguna condición sobre el factor
+        self.multiples = 0        # hechos con más de una condición sobre el factor
+        self.iguales: Dict[str, int] = {}
+        self.solo_igualdades = True
+        self.no_iguales = 0       # condiciones que no son igualdades (para los parches)
+        self.condiciones_multiples: Dict[int, list] = {}
+
+
+class IndiceBits:
+    def __init__(self, base):
+        self.base = base
+        self.orden: List[int] = list(base.hechos)
+        self.posicion: Dict[int, int] = {hecho_id: pos for pos, hecho_id in enumerate(self.orden)}
+        self.tamano = len(self.orden)
+        self.todos = (1 << self.tamano) - 1
+        self.totales: List[int] = [len(base.condiciones_de_hecho(h)) for h in self.orden]
+
+        self.factores: Dict[str, _IndiceFactor] = {
+            nombre: self._factor(nombre, condiciones) for nombre, condiciones in base.por_nombre.items()
+        }
+
+    def _factor(self, nombre: str, condiciones) -> _IndiceFactor:
+        indice = _IndiceFactor(nombre)
+        por_hecho = defaultdict(list)
+        iguales = defaultdict(list)
+        for c in condiciones:
+            pos = self.posicion.get(c.hecho_id)
+            if pos is None:
+                continue
+            por_hecho[pos].append(c.predicado)
+            if c.predicado.tipo == IGUALDAD:
+                iguales[c.predicado.texto].append(pos)
+            else:
+                indice.no_iguales += 1
+        indice.solo_igualdades = indice.no_iguales == 0
+        indice.tiene = a_bits(por_hecho, self.tamano)
+        indice.condiciones_multiples = {pos: preds for pos, preds in por_hecho.items() if len(preds) > 1}
+        indice.multiples = a_bits(indice.condiciones_multiples, self.tamano)
+        indice.iguales = {texto: a_bits(pos, self.tamano) for texto, pos in iguales.items()}
+        return indice
+
+    def parchear(self, base, nombres: Iterable[str] = (), hechos: Iterable[int] = ()) -> Optional["IndiceBits"]:
+        """
+        Índice de una instantánea parcheada (BaseReglas._parche) que comparte con
+        este lo que no cambió: rearma solo los factores `nombres` y los totales de
+        `hechos`. Un hecho nuevo se agrega al final si su id es el mayor; si no,
+        cambian las posiciones y devuelve None (hay que armarlo de cero).
+        """
+        nuevo = copy.copy(self)
+        nuevo.base = base
+        hechos = set(hechos)
+        agregados = sorted(h for h in hechos if h not in self.posicion and h in base.hechos)
+        if any(h not in base.hechos for h in hechos) or (agregados and self.orden and agregados[0] < self.orden[-1]):
+            return None
+        if agregados:
+            nuevo.orden = self.orden + agregados
+            nuevo.posicion = dict(self.posicion)
+            nuevo.posicion.update((h, self.tamano + i) for i, h in enumerate(agregados))
+            nuevo.tamano = len(nuevo.orden)
+            nuevo.todos = (1 << nuevo.tamano) - 1
+        if hechos:
+            nuevo.totales = self.totales + [0] * len(agregados)
+            for h in hechos:
+                nuevo.totales[nuevo.posicion[h]] = len(base.condiciones_de_hecho(h))
+        nombres = set(nombres)
+        if nombres:
+            nuevo.factores = dict(self.factores)
+            for nombre in nombres:
+                indice = nuevo._parchear_factor(self.factores.get(nombre), self.base, nombre, hechos)
+                if indice is not None:
+                    nuevo.factores[nombre] = indice
+                else:
+                    nuevo.factores.pop(nombre, None)
+        return nuevo
+
+    def _parchear_factor(self, anterior: Optional[_IndiceFactor], base_anterior, nombre: str, hechos: Set[int]) -> Optional[_IndiceFactor]:
+        """Copia de `anterior` con los bits de `hechos` recalculados desde sus condiciones (pocas por hecho)."""
+        if anterior is None:
+            condiciones = self.base.por_nombre.get(nombre)
+            return self._factor(nombre, condiciones) if condiciones else None
+        indice = copy.copy(anterior)
+        indice.iguales = dict(anterior.iguales)
+        indice.condiciones_multiples = dict(anterior.condiciones_multiples)
+        for h in hechos:
+            pos = self.posicion[h]
+            bit = 1 << pos
+            antes = [c.predicado for c in base_anterior.condiciones_de_hecho(h) if c.factor_nombre == nombre]
+            ahora = [c.predicado for c in self.base.condiciones_de_hecho(h) if c.factor_nombre == nombre]
+            for p in antes:
+                if p.tipo == IGUALDAD:
+                    restantes = indice.iguales.get(p.texto, 0) & ~bit
+                    if restantes:
+                        indice.iguales[p.texto] = restantes
+                    else:
+                        indice.iguales.pop(p.texto, None)
+                else:
+                    indice.no_iguales -= 1
+            for p in ahora:
+                if p.tipo == IGUALDAD:
+                    indice.iguales[p.texto] = indice.iguales.get(p.texto, 0) | bit
+                else:
+                    indice.no_iguales += 1
+            indice.tiene = indice.tiene | bit if ahora else indice.tiene & ~bit
+            if len(ahora) > 1:
+                indice.multiples |= bit
+                indice.condiciones_multiples[pos] = ahora
+            else:
+                indice.multiples &= ~bit
+                indice.condiciones_multiples.pop(pos, None)
+        indice.solo_igualdades = indice.no_iguales == 0
+        return indice if indice.tiene else None
+
+    def cumplen(self, nombre: str, r: Respuesta) -> int:
+        """Hechos con al menos una condición del factor que cumple la respuesta."""
+        indice = self.factores.get(nombre)
+        if indice is None or r.vacia:
+            return 0
+        if indice.solo_igualdades:
+            return indice.iguales.get(r.texto, 0)
+        hechos = self.base.indice_de_nombre(nombre).hechos_que_cumplen(r)
+        return a_bits((self.posicion[h] for h in hechos if h in self.posicion), self.tamano)
+
+    def filtrar(self, bits: int, respuestas: Dict[str, Respuesta]) -> int:
+        """Deja en `bits` solo los hechos cuyas condiciones sobre los factores respondidos se cumplen todas."""
+        for nombre, r in respuestas.items():
+            indice = self.factores.get(nombre)
+            if indice is None:
+                continue
+            bits &= ~indice.tiene | self.cumplen(nombre, r)
+            for pos in posiciones(bits & indice.multiples):
+                if not all(cumple(p, r) for p in indice.condiciones_multiples[pos]):
+                    bits &= ~(1 << pos)
+        return bits
+
+    def ids(self, bits: int) -> Set[int]:
+        return {self.orden[pos] for pos in posiciones(bits)}
+
+    def candidatos(self, respuestas: Dict[str, Respuesta]) -> Set[int]:
+        """Hechos cuyas condiciones sobre los factores respondidos se cumplen todas."""
+        return self.ids(self.filtrar(self.todos, respuestas))
+
+    def conteos(self, respuestas: Dict[str, Respuesta]) -> List[Tuple[int, int, int]]:
+        """(hecho_id, condiciones cumplidas, total de condiciones) para los hechos con alguna cumplida."""
+        cumplidas: Dict[int, int] = defaultdict(int)
+        for nombre, r in respuestas.items():
+            indice = self.factores.get(nombre)
+            if indice is None:
+                continue
+            bits = self.cumplen(nombre, r)
+            for pos in posiciones(bits & ~indice.multiples):
+                cumplidas[pos] += 1
+            for pos in posiciones(bits & indice.multiples):
+                cumplidas[pos] += sum(1 for p in indice.condiciones_multiples[pos] if cumple(p, r))
+        return [(self.orden[pos], cumplidas[pos], self.totales[pos]) for pos in sorted(cumplidas)]
+
+    def ranking(self, respuestas: Dict[str, Respuesta], limite: int) -> List[Tuple[int, int]]:
+        """(hecho_id, porcentaje) de los mejores hechos, empates en orden de id."""
+        resultados = []
+        for hecho_id, cumplidas, total in self.conteos(respuestas):
+            porcentaje = int((cumplidas * 100) / total)
+            if porcentaje > 0:
+                resultados.append((hecho_id, porcentaje))
+        resultados.sort(key=lambda x: x[1], reverse=True)
+        return resultados[:limite]
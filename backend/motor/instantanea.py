@@ -0,0 +1,185 @@
+# ------------------------------------------------------------------------------
+# Instantánea binaria de la base de reglas, compartida entre workers.
+# El worker que carga una versión desde la base de datos la escribe una vez en
+# INSTANTANEA_DIR; los demás (y los que arrancan después) la abren con mmap de
+# solo lectura en vez de consultar la base. Los arreglos se leen con
+# np.frombuffer sobre el mmap, sin copiarlos, pero solo los de la matriz de
+# puntaje (motor/vectorial.py) se usan así al servir: factores, hechos y reglas
+# se vuelven a armar como objetos de Python en cada worker (BaseReglas, sus
+# índices y el flujo), que ocupan la misma memoria que al cargar de la base. Lo
+# que ahorra el archivo es la consulta de las tablas y armar la matriz.
+#
+# Formato:  MAGIA (8 bytes) | largo de la cabecera (uint64 LE) | cabecera JSON
+#           | secciones, cada una alineada a 64 bytes
+# La cabecera trae la versión de la base de datos (base_reglas_version) y, por
+# sección, [dtype, cantidad, desplazamiento]. Los textos van deduplicados en
+# una sola sección UTF-8 con sus desplazamientos; las columnas de texto guardan
+# índices a esa tabla (-1 = None).
+# Cada versión se escribe en un temporal del mismo directorio y se publica con
+# os.replace, que es atómico: un worker nunca abre un archivo a medias. Quedan
+# las CONSERVAR versiones más nuevas; borrar un archivo que otro worker tiene
+# abierto no lo afecta (el mmap mantiene vivo el contenido).
+# Una sola escritura por versión: el worker que no encuentra el archivo crea
+# base_reglas-<versión>.lock con O_EXCL (reservar) y la escribe; los demás
+# esperan el archivo (esperar) en lugar de cargar la base de datos todos a la
+# vez. Un .lock más viejo que el tiempo de espera se da por abandonado.
+# ------------------------------------------------------------------------------
+import json
+import mmap
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from motor.vectorial import np
+
+MAGIA = b"SEBR\x00\x00\x00\x01"  # cambia si cambia el formato
+ALINEACION = 64
+CONSERVAR = 2
+PATRON = re.compile(r"^base_reglas-(\d+)\.bin$")
+
+
+class Instantanea(NamedTuple):
+    version_bd: int
+    secciones: Dict[str, "np.ndarray"]
+    textos: List[str]
+
+
+def _alinear(posicion: int) -> int:
+    return -(-posicion // ALINEACION) * ALINEACION
+
+
+def ruta(directorio: str, version_bd: int) -> str:
+    return os.path.join(directorio, f"base_reglas-{version_bd:012d}.bin")
+
+
+def ruta_reserva(directorio: str, version_bd: int) -> str:
+    return os.path.join(directorio, f"base_reglas-{version_bd:012d}.lock")
+
+
+def reservar(directorio: str, version_bd: int, vencimiento: float) -> bool:
+    """True si este proceso queda a cargo de escribir `version_bd` (nadie más la reservó hace menos de `vencimiento` s)."""
+    os.makedirs(directorio, exist_ok=True)
+    reserva = ruta_reserva(directorio, version_bd)
+    for _ in range(2):
+        try:
+            os.close(os.open(reserva, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(reserva) < vencimiento:
+                    return False
+                os.remove(reserva)  # el worker que la tomó murió o se colgó
+            except FileNotFoundError:
+                pass  # se liberó mientras se miraba: se vuelve a intentar
+    return False
+
+
+def liberar(directorio: str, version_bd: int) -> None:
+    try:
+        os.remove(ruta_reserva(directorio, version_bd))
+    except FileNotFoundError:
+        pass
+
+
+def esperar(directorio: str, version_bd: int, limite: float, intervalo: float = 0.1) -> Optional["Instantanea"]:
+    """
+    Instantánea de `version_bd` que otro worker está escribiendo. Devuelve None
+    si pasan `limite` segundos o si se liberó la reserva sin escribirla.
+    """
+    fin = time.monotonic() + limite
+    while True:
+        reservada = os.path.exists(ruta_reserva(directorio, version_bd))
+        leida = abrir(directorio, version_bd)
+        if leida is not None or not reservada or time.monotonic() >= fin:
+            return leida
+        time.sleep(intervalo)
+
+
+def versiones(directorio: str) -> List[int]:
+    """Versiones con instantánea en el directorio, de la más nueva a la más vieja."""
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return []
+    return sorted((int(m.group(1)) for m in map(PATRON.match, nombres) if m), reverse=True)
+
+
+def escribir(directorio: str, version_bd: int, secciones: Dict[str, "np.ndarray"], textos: List[str]) -> str:
+    """Escribe la instantánea de `version_bd` y la publica de forma atómica. Devuelve su ruta."""
+    codificados = [t.encode("utf-8") for t in textos]
+    desplazamientos = np.zeros(len(codificados) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in codificados], out=desplazamientos[1:])
+    todas = dict(secciones)
+    todas["textos_utf8"] = np.frombuffer(b"".join(codificados), dtype=np.uint8)
+    todas["textos_desplazamientos"] = desplazamientos
+
+    cabecera = {"version_bd": version_bd, "secciones": {}}
+    posicion = 0
+    for nombre, arreglo in list(todas.items()):
+        arreglo = todas[nombre] = np.ascontiguousarray(arreglo)
+        cabecera["secciones"][nombre] = [arreglo.dtype.str, len(arreglo), posicion]
+        posicion = _alinear(posicion + arreglo.nbytes)
+    texto_cabecera = json.dumps(cabecera).encode("utf-8")
+    inicio = _alinear(16 + len(texto_cabecera))
+
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".base_reglas-", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(MAGIA + len(texto_cabecera).to_bytes(8, "little") + texto_cabecera)
+            for nombre, arreglo in todas.items():
+                f.seek(inicio + cabecera["secciones"][nombre][2])
+                f.write(arreglo.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        destino = ruta(directorio, version_bd)
+        os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    for vieja in versiones(directorio)[CONSERVAR:]:
+        try:
+            os.remove(ruta(directorio, vieja))
+        except OSError:
+            pass
+    return destino
+
+
+def abrir(directorio: str, version_bd: Optional[int] = None) -> Optional[Instantanea]:
+    """
+    Abre la instantánea de `version_bd` (la más nueva si es None).
+    Devuelve None si no existe o no se puede leer: entonces se carga de la base.
+    """
+    if version_bd is None:
+        disponibles = versiones(directorio)
+        if not disponibles:
+            return None
+        version_bd = disponibles[0]
+    try:
+        with open(ruta(directorio, version_bd), "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError: archivo vacío
+        return None
+    try:
+        if mapa[:8] != MAGIA:
+            raise ValueError("formato desconocido")
+        largo = int.from_bytes(mapa[8:16], "little")
+        cabecera = json.loads(mapa[16:16 + largo])
+        inicio = _alinear(16 + largo)
+        secciones = {}
+        for nombre, (dtype, cantidad, posicion) in cabecera["secciones"].items():
+            tipo = np.dtype(dtype)
+            secciones[nombre] = (
+                np.frombuffer(mapa, dtype=tipo, count=cantidad, offset=inicio + posicion)
+                if cantidad else np.empty(0, dtype=tipo)
+            )
+    except ValueError as e:  # incluye json.JSONDecodeError y secciones fuera del archivo
+        print(f"⚠️ Instantánea {ruta(directorio, version_bd)} ilegible, se ignora:", repr(e))
+        return None
+    datos = secciones.pop("textos_utf8").tobytes()
+    limites = secciones.pop("textos_desplazamientos").tolist()
+    textos = [datos[a:b].decode("utf-8") for a, b in zip(limites, limites[1:])]
+    return Instantanea(cabecera["version_bd"], secciones, textos)
@@ -0,0 +1,182 @@
+# ------------------------------------------------------------------------------
+# Índice de intervalos para factores numéricos (altitud, temperatura, ...).
+# Dada una respuesta (un número, un rango "a-b" o una cota ">=x" / "<=x")
+# devuelve los hechos que tienen al menos una condición del factor que la
+# cumple, en tiempo logarítmico más el tamaño del resultado:
+# - rangos "a-b": árbol de mezcla ordenado por el extremo inferior; cada nodo
+#   guarda sus rangos por extremo superior descendente (bajo <= x y alto >= y).
+# - cotas ">=m" / "<=M": arreglos ordenados + bisect.
+# - igualdades y reglas que caen en la comparación de texto: diccionarios.
+# Las condiciones raras (COMPUESTO, o cotas que no entran en un int64) se
+# evalúan una por una con cumple().
+# Cotas e ids de hechos van en array("q") (8 bytes por valor) en vez de listas
+# de tuplas e ints de Python: con miles de reglas por factor es la mayor parte
+# de la memoria del índice.
+# ------------------------------------------------------------------------------
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from motor.condiciones import COMPUESTO, ERROR, IGUALDAD, MAXIMO, MINIMO, NUNCA, RANGO, Respuesta, cumple, indexable
+
+
+class ArbolRangos:
+    """Rangos [bajo, alto] para consultas del tipo bajo <= x y alto >= y."""
+
+    def __init__(self, rangos: Iterable[Tuple[int, int, int]]):
+        rangos = sorted(rangos)  # (bajo, alto, hecho_id)
+        self.n = len(rangos)
+        self.bajos = array("q", [r[0] for r in rangos])
+        self.altos_rango = array("q", [r[1] for r in rangos])
+        self.hechos = array("q", [r[2] for r in rangos])
+        por_alto = sorted(range(self.n), key=self.altos_rango.__getitem__)
+        self.altos = array("q", [self.altos_rango[i] for i in por_alto])
+        self.hechos_por_alto = array("q", [self.hechos[i] for i in por_alto])
+
+        # árbol de mezcla guardado por niveles: el nodo j de profundidad d cubre
+        # las posiciones [j * ancho, (j + 1) * ancho) con ancho = tamano >> d, y
+        # niveles[d] las guarda (índices a los arreglos de arriba) por alto descendente
+        self.tamano = 1
+        while self.tamano < self.n:
+            self.tamano *= 2
+        nivel = array("i", range(self.n))
+        self.niveles: List[array] = [nivel]
+        ancho = 1
+        while ancho < self.tamano:
+            ancho *= 2
+            nivel = array("i")
+            for inicio in range(0, self.n, ancho):
+                tramo = sorted(range(inicio, min(inicio + ancho, self.n)), key=self.altos_rango.__getitem__, reverse=True)
+                nivel.extend(tramo)
+            self.niveles.append(nivel)
+        self.niveles.reverse()  # niveles[0] es la raíz
+
+    def contienen(self, x: int, y: int) -> List[int]:
+        """Hechos de los rangos con bajo <= x y alto >= y."""
+        hechos = []
+        izq, der = self.tamano, self.tamano + bisect_right(self.bajos, x)
+        while izq < der:
+            if izq & 1:
+                self._recorrer(izq, y, hechos)
+                izq += 1
+            if der & 1:
+                der -= 1
+                self._recorrer(der, y, hechos)
+            izq >>= 1
+            der >>= 1
+        return hechos
+
+    def _recorrer(self, nodo: int, y: int, hechos: List[int]) -> None:
+        profundidad = nodo.bit_length() - 1
+        ancho = self.tamano >> profundidad
+        inicio = (nodo - (1 << profundidad)) * ancho
+        nivel, altos, ids = self.niveles[profundidad], self.altos_rango, self.hechos
+        for i in range(inicio, min(inicio + ancho, self.n)):
+            pos = nivel[i]
+            if altos[pos] < y:
+                break
+            hechos.append(ids[pos])
+
+    def desde_bajo(self, x: int) -> array:
+        """Hechos de los rangos con bajo <= x."""
+        return self.hechos[: bisect_right(self.bajos, x)]
+
+    def hasta_alto(self, y: int) -> array:
+        """Hechos de los rangos con alto >= y."""
+        return self.hechos_por_alto[bisect_left(self.altos, y):]
+
+
+class Cotas:
+    """Valores ordenados con el hecho al que pertenecen."""
+
+    def __init__(self, cotas: Iterable[Tuple[int, int]]):
+        pares = sorted(cotas)
+        self.valores = array("q", [p[0] for p in pares])
+        self.hechos = array("q", [p[1] for p in pares])
+
+    def hasta(self, x: int) -> array:
+        """Hechos con cota <= x."""
+        return self.hechos[: bisect_right(self.valores, x)]
+
+    def desde(self, x: int) -> array:
+        """Hechos con cota >= x."""
+        return self.hechos[bisect_left(self.valores, x):]
+
+
+class IndiceNumerico:
+    """Índice de las condiciones de un factor para responder qué hechos cumplen una respuesta."""
+
+    def __init__(self, condiciones: Iterable):
+        rangos, minimos, maximos = [], [], []
+        por_texto: Dict[str, Dict[str, Set[int]]] = {
+            IGUALDAD: defaultdict(set),
+            RANGO: defaultdict(set),
+            MINIMO: defaultdict(set),
+            MAXIMO: defaultdict(set),
+        }
+        self.compuestas = []
+        self.condiciones = []
+        for c in condiciones:
+            p = c.predicado
+            self.condiciones.append(c)
+            if p.tipo == NUNCA:
+                continue
+            if p.tipo == COMPUESTO or not indexable(p):
+                self.compuestas.append(c)
+                continue
+            por_texto[p.tipo][p.texto].add(c.hecho_id)
+            if p.tipo == RANGO:
+                rangos.append((p.rango[0], p.rango[1], c.hecho_id))
+            elif p.tipo == MINIMO:
+                minimos.append((p.minimo, c.hecho_id))
+            elif p.tipo == MAXIMO:
+                maximos.append((p.maximo, c.hecho_id))
+        self.por_texto: Dict[str, Dict[str, array]] = {
+            tipo: {texto: array("q", sorted(hechos)) for texto, hechos in textos.items()}
+            for tipo, textos in por_texto.items()
+        }
+        self.rangos = ArbolRangos(rangos)
+        self.minimos = Cotas(minimos)
+        self.maximos = Cotas(maximos)
+
+    def hechos_que_cumplen(self, r: Respuesta) -> Set[int]:
+        """Hechos con al menos una condición del factor que cumple la respuesta."""
+        if r.vacia:
+            return set()
+        if (r.mayor or r.menor) and r.partes is not None:
+            # ">=100-200": cada tipo de regla la lee distinto, se evalúa una por una
+            return {c.hecho_id for c in self.condiciones if cumple(c.predicado, r)}
+
+        hechos = {c.hecho_id for c in self.compuestas if cumple(c.predicado, r)}
+        hechos.update(self._texto(IGUALDAD, r))
+        if r.entero is not None:
+            if r.entero is not ERROR:
+                hechos.update(self.rangos.contienen(r.entero, r.entero))
+                hechos.update(self.minimos.hasta(r.entero))
+                hechos.update(self.maximos.desde(r.entero))
+        elif r.mayor:
+            if r.digitos is not ERROR:
+                hechos.update(self.rangos.desde_bajo(r.digitos))
+                hechos.update(self.minimos.hasta(r.digitos))
+            hechos.update(self._texto(MAXIMO, r))
+        elif r.menor:
+            if r.digitos is not ERROR:
+                hechos.update(self.rangos.hasta_alto(r.digitos))
+                hechos.update(self.maximos.desde(r.digitos))
+            hechos.update(self._texto(MINIMO, r))
+        elif r.partes is ERROR:
+            pass
+        elif r.partes is not None and len(r.partes) == 2:
+            bajo, alto = r.partes
+            hechos.update(self.rangos.contienen(bajo, alto))
+            hechos.update(self.minimos.hasta(bajo))
+            hechos.update(self.maximos.desde(alto))
+        else:
+            # sin forma numérica: todas las reglas terminan comparando texto
+            for tipo in (RANGO, MINIMO, MAXIMO):
+                hechos.update(self._texto(tipo, r))
+        return hechos
+
+    def _texto(self, tipo: str, r: Respuesta) -> Iterable[int]:
+        return self.por_texto[tipo].get(r.texto, ())
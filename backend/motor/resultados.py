@@ -0,0 +1,101 @@
+# ------------------------------------------------------------------------------
+# Cache de resultados de /api/recomendar.
+# Los agricultores de una misma zona mandan pocas combinaciones distintas
+# (franja de altitud, clima, suelo), así que el ranking se guarda por
+# combinación de respuestas normalizada (claves en minúscula, valores sin
+# espacios y en minúscula, vacías descartadas, ordenadas) y versión de la base
+# de reglas. Toda escritura sobre reglas, factores o hechos sube la versión: un
+# resultado de una versión anterior no se vuelve a servir y, en cuanto aparece
+# la versión nueva, se vacía el cache entero.
+# La memoria queda acotada por un TTL y un máximo de entradas (LRU).
+# ------------------------------------------------------------------------------
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from core.config import settings
+
+Clave = Tuple[int, Tuple[Tuple[str, str], ...]]
+
+
+def clave_respuestas(version: int, respuestas: dict) -> Optional[Clave]:
+    """
+    Clave de cache de unas respuestas, o None si no se pueden normalizar
+    (valores que no son texto: se puntúan sin cache y fallan igual que antes).
+    """
+    normalizadas = {}
+    for k, v in respuestas.items():
+        if v is not None and not isinstance(v, str):
+            return None
+        normalizadas[k.lower()] = (v or "").strip().lower()
+    # una respuesta vacía no cumple ninguna condición: equivale a no responder
+    return version, tuple(sorted((k, v) for k, v in normalizadas.items() if v))
+
+
+class CacheResultados:
+    def __init__(self, maximo: int, ttl: float):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.version = 0
+        self._entradas: "OrderedDict[Clave, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # contadores para /metrics
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = {"tamano": 0, "ttl": 0, "version": 0}
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obtener(self, clave: Clave) -> Optional[dict]:
+        with self._lock:
+            self._cambiar_version(clave[0])
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada[1] > self.ttl:
+                del self._entradas[clave]
+                self.desalojos["ttl"] += 1
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave: Clave, resultado: dict) -> dict:
+        with self._lock:
+            self._cambiar_version(clave[0])
+            # calculado con una versión que ya no es la vigente: no se guarda
+            if self.maximo > 0 and clave[0] == self.version:
+                self._entradas[clave] = (resultado, time.monotonic())
+                self._entradas.move_to_end(clave)
+                self._purgar()
+        return resultado
+
+    def invalidar(self, version: int) -> None:
+        """Descarta todo lo calculado con versiones anteriores a `version`."""
+        with self._lock:
+            self._cambiar_version(version)
+
+    def _cambiar_version(self, version: int) -> None:
+        if version > self.version:
+            self.version = version
+            self.desalojos["version"] += len(self._entradas)
+            self._entradas.clear()
+
+    def _purgar(self) -> None:
+        ahora = time.monotonic()
+        # las más antiguas quedan al principio: basta mirar desde ahí
+        while self._entradas:
+            clave, (_, guardada) = next(iter(self._entradas.items()))
+            if ahora - guardada > self.ttl:
+                self.desalojos["ttl"] += 1
+            elif len(self._entradas) > self.maximo:
+                self.desalojos["tamano"] += 1
+            else:
+                break
+            del self._entradas[clave]
+
+
+cache_resultados = CacheResultados(settings.RECOMENDAR_CACHE_MAX, settings.RECOMENDAR_CACHE_TTL)
@@ -0,0 +1,92 @@
+# ------------------------------------------------------------------------------
+# Sesiones del cuestionario guiado (/api/pregunta-siguiente).
+# Cada sesión guarda, para un token, las respuestas ya aplicadas y el conjunto
+# de hechos candidatos (bitset de IndiceBits). En cada paso solo se aplican las
+# respuestas nuevas sobre ese conjunto. Si el usuario cambia o borra una
+# respuesta, o la base de reglas cambió de versión, se recalcula desde cero
+# igual que sin sesión.
+# La memoria queda acotada por un TTL y un máximo de sesiones (LRU).
+# ------------------------------------------------------------------------------
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from motor.condiciones import Respuesta
+
+
+class Sesion(NamedTuple):
+    token: str
+    version: int           # versión de la base de reglas de los candidatos
+    respuestas: Dict[str, str]
+    candidatos: int        # bitset de IndiceBits
+    usada: float
+
+
+class SesionesCuestionario:
+    def __init__(self, maximo: int, ttl: float):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._sesiones: "OrderedDict[str, Sesion]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sesiones)
+
+    def obtener(self, token: Optional[str]) -> Optional[Sesion]:
+        if not token:
+            return None
+        with self._lock:
+            sesion = self._sesiones.get(token)
+            if sesion is None:
+                return None
+            if time.monotonic() - sesion.usada > self.ttl:
+                del self._sesiones[token]
+                return None
+            self._sesiones.move_to_end(token)
+            return sesion
+
+    def guardar(self, sesion: Sesion) -> None:
+        with self._lock:
+            self._sesiones[sesion.token] = sesion
+            self._sesiones.move_to_end(sesion.token)
+            self._purgar()
+
+    def _purgar(self) -> None:
+        ahora = time.monotonic()
+        # las más antiguas quedan al principio: basta mirar desde ahí
+        while self._sesiones:
+            token, sesion = next(iter(self._sesiones.items()))
+            if len(self._sesiones) <= self.maximo and ahora - sesion.usada <= self.ttl:
+                break
+            del self._sesiones[token]
+
+    def continuar(self, token: Optional[str], base, respuestas: Dict[str, str], parseadas: Dict[str, Respuesta]) -> Sesion:
+        """Aplica las respuestas a la sesión del token (o a una nueva) y la guarda."""
+        indice = base.bits
+        sesion = self.obtener(token)
+        previas_intactas = sesion is not None and all(
+            respuestas.get(k) == v for k, v in sesion.respuestas.items()
+        )
+        if sesion is not None and sesion.version == base.version and previas_intactas:
+            nuevas = {k: r for k, r in parseadas.items() if k not in sesion.respuestas}
+            candidatos = indice.filtrar(sesion.candidatos, nuevas)
+        else:
+            candidatos = indice.filtrar(indice.todos, parseadas)
+        return self._guardar_estado(sesion, base, respuestas, candidatos)
+
+    def registrar(self, token: Optional[str], base, respuestas: Dict[str, str], candidatos: int) -> Sesion:
+        """Guarda candidatos ya calculados (por ejemplo, del flujo precalculado)."""
+        return self._guardar_estado(self.obtener(token), base, respuestas, candidatos)
+
+    def _guardar_estado(self, sesion: Optional[Sesion], base, respuestas: Dict[str, str], candidatos: int) -> Sesion:
+        sesion = Sesion(
+            token=sesion.token if sesion is not None else secrets.token_urlsafe(16),
+            version=base.version,
+            respuestas=dict(respuestas),
+            candidatos=candidatos,
+            usada=time.monotonic(),
+        )
+        self.guardar(sesion)
+        return sesion
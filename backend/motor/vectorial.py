@@ -0,0 +1,185 @@
+# ------------------------------------------------------------------------------
+# Puntaje vectorizado con NumPy para recomendar.
+# La base de reglas se guarda como matriz de incidencia hecho x condición
+# (dispersa, en formato coordenado: una fila y una columna por regla), más el
+# total de condiciones de cada hecho. Cada columna es una condición distinta
+# (nombre de factor + predicado compilado); los factores numéricos guardan sus
+# cotas en arreglos para evaluar todas las columnas de una vez.
+# Las respuestas se convierten en un vector de columnas cumplidas y las
+# coincidencias de todos los hechos salen de un solo producto matriz-vector
+# (np.bincount con pesos), sin recorrer reglas en Python.
+# ------------------------------------------------------------------------------
+from typing import Dict, List, Tuple
+
+from motor.condiciones import COMPUESTO, ERROR, IGUALDAD, LIMITE, MAXIMO, MINIMO, NUNCA, RANGO, Respuesta, cumple, indexable
+
+try:
+    import numpy as np
+except ImportError:  # el motor de bits sigue disponible sin NumPy
+    np = None
+
+
+def disponible() -> bool:
+    return np is not None
+
+
+class _ColumnasFactor:
+    def __init__(self):
+        self.columnas: List[int] = []
+        self.predicados: list = []
+        self.texto: Dict[str, Dict[str, list]] = {IGUALDAD: {}, RANGO: {}, MINIMO: {}, MAXIMO: {}}
+        self.compuestas: List[Tuple[int, object]] = []
+        self.rangos: List[Tuple[int, int, int]] = []
+        self.minimos: List[Tuple[int, int]] = []
+        self.maximos: List[Tuple[int, int]] = []
+
+    def agregar(self, col: int, p) -> None:
+        self.columnas.append(col)
+        self.predicados.append(p)
+        if p.tipo == NUNCA:
+            return
+        if p.tipo == COMPUESTO or not indexable(p):
+            self.compuestas.append((col, p))
+            return
+        self.texto[p.tipo].setdefault(p.texto, []).append(col)
+        if p.tipo == RANGO:
+            self.rangos.append((p.rango[0], p.rango[1], col))
+        elif p.tipo == MINIMO:
+            self.minimos.append((p.minimo, col))
+        elif p.tipo == MAXIMO:
+            self.maximos.append((p.maximo, col))
+
+    def congelar(self) -> None:
+        self.texto = {tipo: {t: np.array(cols, dtype=np.int64) for t, cols in por_texto.items()}
+                      for tipo, por_texto in self.texto.items()}
+        self.rango_bajo = np.array([r[0] for r in self.rangos], dtype=np.int64)
+        self.rango_alto = np.array([r[1] for r in self.rangos], dtype=np.int64)
+        self.rango_cols = np.array([r[2] for r in self.rangos], dtype=np.int64)
+        self.min_val = np.array([m[0] for m in self.minimos], dtype=np.int64)
+        self.min_cols = np.array([m[1] for m in self.minimos], dtype=np.int64)
+        self.max_val = np.array([m[0] for m in self.maximos], dtype=np.int64)
+        self.max_cols = np.array([m[1] for m in self.maximos], dtype=np.int64)
+
+
+class MatrizReglas:
+    def __init__(self, base):
+        self.orden: List[int] = list(base.hechos)
+        posicion = {hecho_id: pos for pos, hecho_id in enumerate(self.orden)}
+        self.totales = np.array([len(base.condiciones_de_hecho(h)) for h in self.orden], dtype=np.int64)
+
+        columnas: Dict[tuple, int] = {}
+        self.factores: Dict[str, _ColumnasFactor] = {}
+        filas, cols = [], []
+        for c in base.condiciones.values():
+            pos = posicion.get(c.hecho_id)
+            if pos is None or not c.factor_nombre:
+                continue
+            clave = (c.factor_nombre, c.predicado)
+            col = columnas.get(clave)
+            if col is None:
+                col = columnas[clave] = len(columnas)
+                self.factores.setdefault(c.factor_nombre, _ColumnasFactor()).agregar(col, c.predicado)
+            filas.append(pos)
+            cols.append(col)
+        for factor in self.factores.values():
+            factor.congelar()
+
+        self.n_columnas = len(columnas)
+        self.filas = np.array(filas, dtype=np.int64)
+        self.columnas = np.array(cols, dtype=np.int64)
+
+    @classmethod
+    def desde_columnas(cls, orden: List[int], totales, filas, columnas, definiciones: List[tuple]) -> "MatrizReglas":
+        """
+        Matriz ya calculada (p. ej. leída de la instantánea compartida, ver
+        motor/instantanea.py): los arreglos se usan tal cual, sin copiarlos, y
+        solo se rearman las columnas de cada factor desde sus definiciones.
+        """
+        matriz = cls.__new__(cls)
+        matriz.orden = orden
+        matriz.totales = totales
+        matriz.filas = filas
+        matriz.columnas = columnas
+        matriz.n_columnas = len(definiciones)
+        matriz.factores = {}
+        for col, (nombre, predicado) in enumerate(definiciones):
+            matriz.factores.setdefault(nombre, _ColumnasFactor()).agregar(col, predicado)
+        for factor in matriz.factores.values():
+            factor.congelar()
+        return matriz
+
+    def definiciones(self) -> List[tuple]:
+        """(nombre del factor, predicado) de cada columna, en orden de columna."""
+        definiciones = [None] * self.n_columnas
+        for nombre, factor in self.factores.items():
+            for col, predicado in zip(factor.columnas, factor.predicados):
+                definiciones[col] = (nombre, predicado)
+        return definiciones
+
+    def vector_cumplidas(self, respuestas: Dict[str, Respuesta]):
+        vector = np.zeros(self.n_columnas, dtype=np.bool_)
+        for nombre, r in respuestas.items():
+            factor = self.factores.get(nombre)
+            if factor is not None and not r.vacia:
+                self._marcar(factor, r, vector)
+        return vector
+
+    def _marcar(self, f: _ColumnasFactor, r: Respuesta, vector) -> None:
+        # mismo reparto por forma de respuesta que IndiceNumerico.hechos_que_cumplen
+        if (r.mayor or r.menor) and r.partes is not None:
+            for col, p in zip(f.columnas, f.predicados):
+                if cumple(p, r):
+                    vector[col] = True
+            return
+
+        for col, p in f.compuestas:
+            if cumple(p, r):
+                vector[col] = True
+        self._texto(f, IGUALDAD, r, vector)
+        if r.entero is not None:
+            if r.entero is not ERROR:
+                n = min(r.entero, LIMITE)
+                vector[f.rango_cols[(f.rango_bajo <= n) & (f.rango_alto >= n)]] = True
+                vector[f.min_cols[f.min_val <= n]] = True
+                vector[f.max_cols[f.max_val >= n]] = True
+        elif r.mayor:
+            if r.digitos is not ERROR:
+                d = min(r.digitos, LIMITE)
+                vector[f.rango_cols[f.rango_bajo <= d]] = True
+                vector[f.min_cols[f.min_val <= d]] = True
+            self._texto(f, MAXIMO, r, vector)
+        elif r.menor:
+            if r.digitos is not ERROR:
+                d = min(r.digitos, LIMITE)
+                vector[f.rango_cols[f.rango_alto >= d]] = True
+                vector[f.max_cols[f.max_val >= d]] = True
+            self._texto(f, MINIMO, r, vector)
+        elif r.partes is ERROR:
+            pass
+        elif r.partes is not None and len(r.partes) == 2:
+            bajo, alto = min(r.partes[0], LIMITE), min(r.partes[1], LIMITE)
+            vector[f.rango_cols[(f.rango_bajo <= bajo) & (f.rango_alto >= alto)]] = True
+            vector[f.min_cols[f.min_val <= bajo]] = True
+            vector[f.max_cols[f.max_val >= alto]] = True
+        else:
+            for tipo in (RANGO, MINIMO, MAXIMO):
+                self._texto(f, tipo, r, vector)
+
+    @staticmethod
+    def _texto(f: _ColumnasFactor, tipo: str, r: Respuesta, vector) -> None:
+        cols = f.texto[tipo].get(r.texto)
+        if cols is not None:
+            vector[cols] = True
+
+    def porcentajes(self, respuestas: Dict[str, Respuesta]):
+        """Porcentaje entero de viabilidad de cada hecho (en el orden de self.orden)."""
+        vector = self.vector_cumplidas(respuestas)
+        cumplidas = np.bincount(self.filas, weights=vector[self.columnas], minlength=len(self.orden))
+        return cumplidas.astype(np.int64) * 100 // np.maximum(self.totales, 1)
+
+    def ranking(self, respuestas: Dict[str, Respuesta], limite: int) -> List[Tuple[int, int]]:
+        """(hecho_id, porcentaje) de los mejores hechos, empates en orden de id."""
+        porcentajes = self.porcentajes(respuestas)
+        positivos = np.flatnonzero(porcentajes > 0)
+        mejores = positivos[np.argsort(-porcentajes[positivos], kind="stable")][:limite]
+        return [(self.orden[pos], int(porcentajes[pos])) for pos in mejores]
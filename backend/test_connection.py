@@ -2,12 +2,11 @@ import psycopg2
 from psycopg2 import OperationalError
 from core.config import settings  # ajusta el import según tu estructura real (por ejemplo: from config import settings)
 from core.session import engine
-from core.base_class import Base
-from db.models.factor import Factor 
+from db.migraciones import migrar
 
 def create_tables():
-    Base.metadata.create_all(bind=engine)
-    print("tabla creada correctamente")
+    migrar(engine)
+    print("esquema al día")
 
 def test_connection():
     print("🧠 Probando conexión a la base de datos...")
@@ -0,0 +1,103 @@
+# ------------------------------------------------------------------------------
+# Bases de reglas al azar (semilla fija) y las respuestas de referencia
+# calculadas como lo hacía el código original: recorriendo todas las
+# condiciones con evaluar_condicion(), sin índices. Las usan los tests de los
+# índices (bits, matriz, flujo) y de los parches de la instantánea.
+# ------------------------------------------------------------------------------
+from typing import Dict, List, Set, Tuple
+
+from motor.base_reglas import BaseReglas, Condicion, FactorInfo, HechoInfo
+from motor.condiciones import evaluar_condicion, parsear_respuesta
+
+NOMBRES = ["Altitud", "Clima", "suelo", "Riego", "CLIMA"]  # "CLIMA": dos factores con el mismo nombre
+OPERADORES = ["=", "==", ">=", "=>", "<=", "=<", "", "!=", " >= "]
+ALTITUDES = ["1000-2000", ">=3000", "<=500", "1500", "500-1000", "=>2500", "2000 - 2800", "abc", "", "10-20-30", "-5"]
+TEXTOS = {
+    "clima": ["Húmedo", "seco", " Templado ", "frío", "HÚMEDO"],
+    "suelo": ["arcilloso", "Arenoso", "franco", "limoso"],
+    "riego": ["si", "no"],
+}
+RESPUESTAS_ALTITUD = ALTITUDES + ["1200", "3000", ">=2000", "<=700", "1000-1500", "=<100", ">=1000-1500", "²"]
+
+
+def condicion_aleatoria(rnd, condicion_id: int, factor: FactorInfo, hecho_id: int) -> Condicion:
+    clave = factor.clave
+    if clave == "altitud":
+        operador, valor = rnd.choice(OPERADORES), rnd.choice(ALTITUDES)
+    else:
+        operador, valor = rnd.choice(["=", "=", "=", ">="]), rnd.choice(TEXTOS.get(clave, ["x"]))
+    return Condicion(condicion_id, factor.id, hecho_id, operador, valor, "")
+
+
+def tablas_aleatorias(rnd, hechos: int = 60):
+    nombres = NOMBRES if rnd.random() < 0.3 else NOMBRES[:-1]
+    factores = [FactorInfo(i, nombre, "x") for i, nombre in enumerate(nombres, 1)]
+    lista_hechos = [HechoInfo(i, f"cultivo {i}") for i in range(1, hechos + 1)]
+    condiciones = []
+    for hecho in lista_hechos:
+        for factor in factores:
+            for _ in range(rnd.choice([0, 1, 1, 1, 2])):
+                condiciones.append(condicion_aleatoria(rnd, len(condiciones) + 1, factor, hecho.id))
+    return factores, lista_hechos, condiciones
+
+
+def base_aleatoria(rnd, hechos: int = 60) -> BaseReglas:
+    return BaseReglas(*tablas_aleatorias(rnd, hechos), version=1)
+
+
+def respuestas_aleatorias(rnd) -> Dict[str, str]:
+    """Respuestas con claves en minúsculas, como las deja /api/recomendar antes de puntuar."""
+    respuestas = {}
+    if rnd.random() < 0.9:
+        respuestas["altitud"] = rnd.choice(RESPUESTAS_ALTITUD)
+    if rnd.random() < 0.7:
+        respuestas["clima"] = rnd.choice([t.strip().lower() for t in TEXTOS["clima"]] + ["nada"])
+    if rnd.random() < 0.5:
+        respuestas["suelo"] = rnd.choice([t.lower() for t in TEXTOS["suelo"]])
+    if rnd.random() < 0.2:
+        respuestas["riego"] = rnd.choice(TEXTOS["riego"])
+    return respuestas
+
+
+def parseadas(respuestas: Dict[str, str]):
+    return {k: parsear_respuesta(v) for k, v in respuestas.items()}
+
+
+# ---------- referencia: recorrido lineal con evaluar_condicion ----------
+def candidatos(base: BaseReglas, respuestas: Dict[str, str]) -> Set[int]:
+    """Hechos cuyas condiciones sobre los factores respondidos se cumplen todas."""
+    return {
+        hecho_id
+        for hecho_id in base.hechos
+        if all(
+            evaluar_condicion(c.operador, c.valor, respuestas[c.factor_nombre])
+            for c in base.condiciones_de_hecho(hecho_id)
+            if c.factor_nombre in respuestas
+        )
+    }
+
+
+def conteos(base: BaseReglas, respuestas: Dict[str, str]) -> List[Tuple[int, int, int]]:
+    """(hecho_id, cumplidas, total) de los hechos con alguna condición cumplida."""
+    resultado = []
+    for hecho_id in base.hechos:
+        condiciones = base.condiciones_de_hecho(hecho_id)
+        cumplidas = sum(
+            1
+            for c in condiciones
+            if c.factor_nombre in respuestas and evaluar_condicion(c.operador, c.valor, respuestas[c.factor_nombre])
+        )
+        if cumplidas:
+            resultado.append((hecho_id, cumplidas, len(condiciones)))
+    return resultado
+
+
+def ranking(conteos: List[Tuple[int, int, int]], limite: int) -> List[Tuple[int, int]]:
+    """(hecho_id, porcentaje) de `conteos` como el recomendar original: mayor porcentaje primero, empates por id."""
+    resultado = []
+    for hecho_id, cumplidas, total in conteos:
+        porcentaje = int((cumplidas * 100) / total)
+        if porcentaje > 0:
+            resultado.append((hecho_id, porcentaje))
+    resultado.sort(key=lambda x: x[1], reverse=True)
+    return resultado[:limite]
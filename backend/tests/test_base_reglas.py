@@ -0,0 +1,86 @@
+# ------------------------------------------------------------------------------
+# Parches de la instantánea (con_condicion, sin_condicion, con_factor,
+# con_hecho) contra una BaseReglas armada de cero con las mismas tablas: tras
+# cada escritura de una secuencia al azar, las agrupaciones, los catálogos y
+# el índice de bits parcheado tienen que quedar iguales a los de la base nueva.
+# ------------------------------------------------------------------------------
+import random
+
+import aleatorias
+from motor.base_reglas import BaseReglas, FactorInfo, HechoInfo
+
+
+def agrupadas(por_clave):
+    return {clave: [c[:6] for c in condiciones] for clave, condiciones in por_clave.items() if condiciones}
+
+
+def iguales(parcheada, fresca, rnd):
+    assert [c[:6] for c in parcheada.condiciones.values()] == [c[:6] for c in fresca.condiciones.values()]
+    assert [c.predicado for c in parcheada.condiciones.values()] == [c.predicado for c in fresca.condiciones.values()]
+    for campo in ("por_hecho", "por_factor", "por_nombre"):
+        assert agrupadas(getattr(parcheada, campo)) == agrupadas(getattr(fresca, campo)), campo
+    assert list(parcheada.hechos.items()) == list(fresca.hechos.items())
+    assert list(parcheada.factores.items()) == list(fresca.factores.items())
+    assert parcheada.factores_por_nombre == fresca.factores_por_nombre
+
+    a, b = parcheada.bits, fresca.bits
+    assert (a.orden, a.totales, a.todos) == (b.orden, b.totales, b.todos)
+    assert set(a.factores) == set(b.factores)
+    for nombre, x in a.factores.items():
+        y = b.factores[nombre]
+        assert (x.tiene, x.multiples, x.iguales, x.solo_igualdades, x.condiciones_multiples) == (
+            y.tiene, y.multiples, y.iguales, y.solo_igualdades, y.condiciones_multiples
+        ), nombre
+    for _ in range(5):
+        respuestas = aleatorias.parseadas(aleatorias.respuestas_aleatorias(rnd))
+        for nombre, r in respuestas.items():
+            assert parcheada.indice_de_nombre(nombre).hechos_que_cumplen(r) == fresca.indice_de_nombre(
+                nombre
+            ).hechos_que_cumplen(r), nombre
+        assert a.filtrar(a.todos, respuestas) == b.filtrar(b.todos, respuestas)
+        assert a.ranking(respuestas, 5) == b.ranking(respuestas, 5)
+
+
+def test_secuencias_de_parches_igual_que_base_nueva():
+    for semilla in range(60):
+        rnd = random.Random(semilla)
+        factores, hechos, condiciones = aleatorias.tablas_aleatorias(rnd, hechos=rnd.choice([5, 20]))
+        factores = {f.id: f for f in factores}
+        # a veces con huecos en los ids, para que los hechos nuevos caigan en medio
+        hechos = {h.id: h for h in hechos if rnd.random() < 0.8 or h.id == 1}
+        condiciones = {c.id: c for c in condiciones if c.hecho_id in hechos}
+        base = BaseReglas(factores.values(), hechos.values(), condiciones.values(), 1)
+        base.bits
+        base.indice_de_nombre("altitud")
+        for version in range(2, 25):
+            k = rnd.random()
+            if k < 0.35:
+                # regla nueva (id al final o en un hueco) o editada
+                condicion_id = rnd.choice([rnd.choice(list(condiciones) or [1]), rnd.randint(1, 400)])
+                c = aleatorias.condicion_aleatoria(
+                    rnd, condicion_id, rnd.choice(list(factores.values())), rnd.choice(list(hechos))
+                )
+                condiciones[c.id] = c
+                base = base.con_condicion(c, version)
+            elif k < 0.6:
+                # a veces una que no existe
+                condicion_id = rnd.choice(list(condiciones)) if condiciones and rnd.random() < 0.9 else 9999
+                condiciones.pop(condicion_id, None)
+                base = base.sin_condicion(condicion_id, version)
+            elif k < 0.8:
+                # factor renombrado, nuevo o con id 0
+                factor_id = rnd.choice(list(factores) + [max(factores) + 1, 0])
+                f = FactorInfo(factor_id, rnd.choice(aleatorias.NOMBRES), "y")
+                factores[factor_id] = f
+                base = base.con_factor(f, version)
+            else:
+                # hecho nuevo al final, en un hueco, con id 0 o solo con otra descripción
+                hecho_id = rnd.choice(list(hechos) + [max(hechos) + 1, 0, 2])
+                h = HechoInfo(hecho_id, f"hecho {version}")
+                hechos[hecho_id] = h
+                base = base.con_hecho(h, version)
+            fresca = BaseReglas(factores.values(), hechos.values(), condiciones.values(), version)
+            assert base.version == version and base.version_bd is None
+            if rnd.random() < 0.5:
+                base.bits  # si el parche tuvo que descartar el índice, se arma aquí
+            iguales(base, fresca, rnd)
@@ -0,0 +1,76 @@
+# ------------------------------------------------------------------------------
+# compilar() + cumple() contra evaluar_condicion(), el evaluador original que se
+# conserva como referencia: para cada forma de regla, operador y respuesta
+# tienen que dar exactamente lo mismo, incluidos los casos en los que el
+# original devolvía False por una excepción al convertir a entero.
+# ------------------------------------------------------------------------------
+import itertools
+import random
+
+import pytest
+
+from motor.condiciones import compilar, cumple, evaluar_condicion, parsear_respuesta
+
+GRANDE = "9" * 20  # más de 2**62: no entra en los índices int64
+
+OPERADORES = ["=", "==", ">=", "=>", "<=", "=<", "", None, " >= ", " = ", "!=", "<", ">"]
+
+REGLAS = [
+    # igualdad de texto
+    "húmedo", " Seco ", "ARCILLOSO", "abc", "",
+    # número
+    "1500", "0", "007", GRANDE, "12.5",
+    # rango "a-b"
+    "1000-2000", "1000 - 2000", "2000-1000", "0-100", f"1-{GRANDE}",
+    # rangos raros: un solo número, tres partes, dígitos ilegibles
+    "-5", "5-", "10-20-30", "a-b", "³-5", "1-²",
+    # cotas en el valor
+    ">=3000", "=>3000", "<=500", "=<500", ">= 3000", f">={GRANDE}", f"<={GRANDE}",
+    # cotas con rango o ilegibles
+    ">=100-200", "<=100-200", ">=²", "<=abc", ">=",
+]
+
+RESPUESTAS = [
+    # vacías
+    "", None, "   ",
+    # número
+    "1500", "0", "3000", "500", "99999", " 1500 ", "007", GRANDE,
+    # rango
+    "1000-2000", "1200-1800", "500-2500", "2000-1000", "1000 - 2000", f"0-{GRANDE}",
+    # rangos raros
+    "-5", "5-", "10-20-30", "a-b", "³-5",
+    # cotas
+    ">=1000", "=>1000", ">=3000", "<=800", "=<800", "<=500", f">={GRANDE}", f"<={GRANDE}",
+    # cota con rango
+    ">=100-200", "<=100-200", "=>1000-2000",
+    # dígitos que int() no convierte
+    "²", "1²", ">=²", "<=1²",
+    # texto
+    "húmedo", "HÚMEDO", " seco ", "arcilloso", "abc", "1e3", "12.5",
+]
+
+
+@pytest.mark.parametrize("operador,regla", list(itertools.product(OPERADORES, REGLAS)))
+def test_igual_que_evaluar_condicion(operador, regla):
+    predicado = compilar(operador, regla)
+    distintas = [
+        respuesta
+        for respuesta in RESPUESTAS
+        if cumple(predicado, parsear_respuesta(respuesta)) != evaluar_condicion(operador, regla, respuesta)
+    ]
+    assert distintas == []
+
+
+def test_combinaciones_aleatorias():
+    # piezas de las formas de arriba combinadas al azar (semilla fija)
+    rnd = random.Random(2024)
+    piezas = ["", " ", "-", ">=", "=>", "<=", "=<", "=", "1", "20", "300", "²", GRANDE, "a", "ñ"]
+
+    def texto():
+        return "".join(rnd.choice(piezas) for _ in range(rnd.randint(0, 4)))
+
+    for _ in range(20000):
+        operador, regla, respuesta = rnd.choice(OPERADORES), texto(), texto()
+        assert cumple(compilar(operador, regla), parsear_respuesta(respuesta)) == evaluar_condicion(
+            operador, regla, respuesta
+        ), (operador, regla, respuesta)
@@ -0,0 +1,81 @@
+# ------------------------------------------------------------------------------
+# TrieFlujo contra siguiente_pregunta() y preguntas() calculadas en el momento:
+# cada nodo precalculado tiene que devolver lo mismo que el cálculo directo con
+# los candidatos del recorrido lineal (evaluar_condicion, aleatorias.py), y el
+# trie de una instantánea parcheada lo mismo que el de una armada de cero.
+# ------------------------------------------------------------------------------
+import random
+
+import aleatorias
+from motor.base_reglas import BaseReglas
+from motor.flujo import TrieFlujo, preguntas, siguiente_pregunta
+from motor.indice import a_bits
+
+
+def nodos(trie):
+    pila = [trie.raiz]
+    while pila:
+        nodo = pila.pop()
+        pila.extend(nodo.hijos.values())
+        yield nodo
+
+
+def comparar(trie, base):
+    for nodo in nodos(trie):
+        candidatos = aleatorias.candidatos(base, nodo.respuestas)
+        assert trie.base.bits.ids(nodo.candidatos) == candidatos, nodo.respuestas
+        bits = base.bits
+        esperado = siguiente_pregunta(base, nodo.respuestas, a_bits((bits.posicion[h] for h in candidatos), bits.tamano))
+        assert nodo.resultado == esperado, nodo.respuestas
+        assert trie.buscar(nodo.respuestas) is nodo
+    for altitud, resultado in trie.por_altitud.items():
+        assert resultado == preguntas(base, altitud), altitud
+
+
+def test_igual_que_calculo_directo():
+    for semilla in range(6):
+        rnd = random.Random(semilla)
+        base = aleatorias.base_aleatoria(rnd, hechos=40)
+        trie = TrieFlujo(base, 100000)
+        assert trie.completo and trie.reporte["nodos"] == trie.nodos == sum(1 for _ in nodos(trie))
+        comparar(trie, aleatorias.base_aleatoria(random.Random(semilla), hechos=40))
+
+
+def test_respuestas_fuera_del_trie():
+    base = aleatorias.base_aleatoria(random.Random(1), hechos=40)
+    trie = TrieFlujo(base, 100000)
+    assert trie.buscar({"altitud": "no es una opción"}) is None
+    assert trie.buscar({"clima": "seco"}) is None  # sin altitud el camino no empieza por clima
+    assert trie.precalculadas("no es una opción") is None
+    assert trie.preguntas("no es una opción") == preguntas(base, "no es una opción")
+
+
+def test_trie_recortado():
+    base = aleatorias.base_aleatoria(random.Random(2), hechos=40)
+    completo = TrieFlujo(base, 100000)
+    for maximo in (1, 2, 5, 30):
+        trie = TrieFlujo(base, maximo)
+        assert not trie.completo and trie.nodos == maximo <= completo.nodos
+        comparar(trie, base)
+
+
+def test_base_parcheada_igual_que_armada_de_cero():
+    for semilla in range(3):
+        rnd = random.Random(semilla)
+        factores, hechos, condiciones = aleatorias.tablas_aleatorias(rnd, hechos=30)
+        condiciones = {c.id: c for c in condiciones}
+        base = BaseReglas(factores, hechos, condiciones.values(), 1)
+        base.bits
+        for version in range(2, 8):
+            if rnd.random() < 0.6:
+                c = aleatorias.condicion_aleatoria(
+                    rnd, rnd.choice([rnd.choice(list(condiciones)), max(condiciones) + 1]),
+                    rnd.choice(factores), rnd.choice(hechos).id,
+                )
+                condiciones[c.id] = c
+                base = base.con_condicion(c, version)
+            else:
+                condicion_id = rnd.choice(list(condiciones))
+                del condiciones[condicion_id]
+                base = base.sin_condicion(condicion_id, version)
+            comparar(TrieFlujo(base, 100000), BaseReglas(factores, hechos, condiciones.values(), version))
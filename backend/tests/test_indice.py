@@ -0,0 +1,85 @@
+# ------------------------------------------------------------------------------
+# IndiceBits contra el recorrido lineal con evaluar_condicion() (aleatorias.py):
+# candidatos de filtrar(), conteos() y ranking() tienen que dar lo mismo que
+# el código original, tanto con el índice armado de cero como con el que
+# parchear() deja después de una serie de escrituras.
+# ------------------------------------------------------------------------------
+import random
+
+import aleatorias
+from motor.base_reglas import BaseReglas, FactorInfo, HechoInfo
+from motor.indice import a_bits, posiciones
+
+
+def comparar(base, rnd, veces=40):
+    bits = base.bits
+    for _ in range(veces):
+        respuestas = aleatorias.respuestas_aleatorias(rnd)
+        parseadas = aleatorias.parseadas(respuestas)
+        assert bits.ids(bits.filtrar(bits.todos, parseadas)) == aleatorias.candidatos(base, respuestas), respuestas
+        conteos = aleatorias.conteos(base, respuestas)
+        assert bits.conteos(parseadas) == conteos, respuestas
+        assert bits.ranking(parseadas, 5) == aleatorias.ranking(conteos, 5), respuestas
+
+
+def test_bits_y_posiciones():
+    rnd = random.Random(1)
+    for tamano in (0, 1, 7, 8, 9, 64, 200):
+        elegidas = sorted(rnd.sample(range(tamano), rnd.randint(0, tamano)))
+        assert list(posiciones(a_bits(elegidas, tamano))) == elegidas
+
+
+def test_igual_que_recorrido_lineal():
+    for semilla in range(15):
+        rnd = random.Random(semilla)
+        comparar(aleatorias.base_aleatoria(rnd), rnd)
+
+
+def test_filtrar_parte_de_candidatos_previos():
+    # el flujo filtra paso a paso desde los candidatos de la respuesta anterior
+    rnd = random.Random(5)
+    base = aleatorias.base_aleatoria(rnd)
+    bits = base.bits
+    for _ in range(100):
+        respuestas = aleatorias.respuestas_aleatorias(rnd)
+        candidatos = bits.todos
+        for clave, valor in respuestas.items():
+            candidatos = bits.filtrar(candidatos, aleatorias.parseadas({clave: valor}))
+        assert bits.ids(candidatos) == aleatorias.candidatos(base, respuestas), respuestas
+
+
+def test_parchear_igual_que_recorrido_lineal():
+    for semilla in range(20):
+        rnd = random.Random(semilla)
+        factores, hechos, condiciones = aleatorias.tablas_aleatorias(rnd, hechos=30)
+        factores = {f.id: f for f in factores}
+        hechos = {h.id: h for h in hechos}
+        condiciones = {c.id: c for c in condiciones}
+        base = BaseReglas(factores.values(), hechos.values(), condiciones.values(), 1)
+        base.bits
+        for version in range(2, 20):
+            k = rnd.random()
+            if k < 0.4:
+                # regla nueva o editada (a veces de otro factor u otro hecho)
+                condicion_id = rnd.choice([rnd.choice(list(condiciones)), max(condiciones) + 1])
+                c = aleatorias.condicion_aleatoria(
+                    rnd, condicion_id, rnd.choice(list(factores.values())), rnd.choice(list(hechos))
+                )
+                condiciones[c.id] = c
+                base = base.con_condicion(c, version)
+            elif k < 0.7:
+                condicion_id = rnd.choice(list(condiciones))
+                del condiciones[condicion_id]
+                base = base.sin_condicion(condicion_id, version)
+            elif k < 0.85:
+                # renombrar un factor mueve sus condiciones a otro nombre
+                f = FactorInfo(rnd.choice(list(factores)), rnd.choice(aleatorias.NOMBRES), "y")
+                factores[f.id] = f
+                base = base.con_factor(f, version)
+            else:
+                # hecho nuevo al final (el índice lo agrega) o existente (solo cambia la descripción)
+                h = HechoInfo(rnd.choice([max(hechos) + 1, rnd.choice(list(hechos))]), f"hecho {version}")
+                hechos[h.id] = h
+                base = base.con_hecho(h, version)
+            assert base._bits is not None  # se parcheó, no quedó para armar de cero
+            comparar(base, rnd, veces=5)
@@ -0,0 +1,94 @@
+# ------------------------------------------------------------------------------
+# IndiceNumerico.hechos_que_cumplen() contra evaluar_condicion() regla por
+# regla: los hechos que devuelve el índice tienen que ser exactamente los que
+# tienen al menos una condición del factor que el evaluador original da por
+# cumplida. ArbolRangos se compara además con el recorrido lineal de sus rangos.
+# ------------------------------------------------------------------------------
+import random
+from collections import namedtuple
+
+import pytest
+
+from motor.condiciones import compilar, evaluar_condicion, parsear_respuesta
+from motor.intervalos import ArbolRangos, IndiceNumerico
+
+GRANDE = "9" * 20  # más de 2**62: no entra en los índices int64
+
+Regla = namedtuple("Regla", "hecho_id operador valor predicado")
+
+OPERADORES = ["=", "==", ">=", "=>", "<=", "=<", "", None, " >= ", "!="]
+
+# reglas de altitud como las de la base, más las formas raras de test_condiciones
+REGLAS = [
+    "1000-2000", "1000 - 2000", "2000-1000", "0-100", "500-1000", f"1-{GRANDE}",
+    "1500", "0", "007", GRANDE, ">=3000", "=>2500", "<=500", "=<100", f">={GRANDE}",
+    "-5", "5-", "10-20-30", "a-b", "³-5", ">=100-200", "<=100-200", ">=²", "abc", "",
+]
+
+RESPUESTAS = [
+    "", None, "1500", "0", "3000", "500", "99999", " 1500 ", "007", GRANDE,
+    "1000-2000", "1200-1800", "500-2500", "2000-1000", f"0-{GRANDE}", "-5", "5-", "10-20-30",
+    ">=1000", "=>1000", ">=3000", "<=800", "=<800", f">={GRANDE}", f"<={GRANDE}",
+    ">=100-200", "<=100-200", "²", "1²", ">=²", "abc", "1e3",
+]
+
+
+def reglas_aleatorias(rnd, n):
+    def valor():
+        if rnd.random() < 0.6:
+            bajo = rnd.randint(0, 40) * 100
+            alto = bajo + rnd.randint(0, 20) * 100
+            return rnd.choice([f"{bajo}-{alto}", f">={bajo}", f"<={alto}", str(bajo), f"{bajo} - {alto}"])
+        return rnd.choice(REGLAS)
+
+    reglas = []
+    for _ in range(n):
+        operador, texto = rnd.choice(OPERADORES), valor()
+        reglas.append(Regla(rnd.randint(1, 40), operador, texto, compilar(operador, texto)))
+    return reglas
+
+
+def respuesta_aleatoria(rnd):
+    if rnd.random() < 0.5:
+        x = rnd.randint(0, 45) * 100 + rnd.choice([0, 0, 50])
+        return rnd.choice([str(x), f"{x}-{x + rnd.randint(0, 10) * 100}", f">={x}", f"<={x}"])
+    return rnd.choice(RESPUESTAS)
+
+
+def esperados(reglas, respuesta):
+    return {r.hecho_id for r in reglas if evaluar_condicion(r.operador, r.valor, respuesta)}
+
+
+@pytest.mark.parametrize("respuesta", RESPUESTAS)
+def test_formas_fijas_igual_que_evaluar_condicion(respuesta):
+    reglas = [
+        Regla(hecho_id, operador, valor, compilar(operador, valor))
+        for hecho_id, (operador, valor) in enumerate(((o, v) for o in OPERADORES for v in REGLAS), 1)
+    ]
+    indice = IndiceNumerico(reglas)
+    assert indice.hechos_que_cumplen(parsear_respuesta(respuesta)) == esperados(reglas, respuesta)
+
+
+def test_indices_aleatorios_igual_que_evaluar_condicion():
+    rnd = random.Random(2024)
+    for _ in range(100):
+        reglas = reglas_aleatorias(rnd, rnd.randint(0, 120))
+        indice = IndiceNumerico(reglas)
+        for _ in range(30):
+            respuesta = respuesta_aleatoria(rnd)
+            assert indice.hechos_que_cumplen(parsear_respuesta(respuesta)) == esperados(reglas, respuesta), respuesta
+
+
+def test_arbol_rangos_igual_que_recorrido_lineal():
+    rnd = random.Random(7)
+    for n in (0, 1, 2, 3, 5, 8, 13, 64, 100):
+        rangos = []
+        for _ in range(n):
+            bajo = rnd.randint(0, 50)
+            rangos.append((bajo, bajo + rnd.randint(0, 20), rnd.randint(1, 30)))
+        arbol = ArbolRangos(rangos)
+        for x in range(-1, 72):
+            assert sorted(arbol.desde_bajo(x)) == sorted(h for b, _, h in rangos if b <= x)
+            assert sorted(arbol.hasta_alto(x)) == sorted(h for _, a, h in rangos if a >= x)
+            for y in range(x, x + 25, 3):
+                assert sorted(arbol.contienen(x, y)) == sorted(h for b, a, h in rangos if b <= x and a >= y), (n, x, y)
@@ -0,0 +1,56 @@
+# ------------------------------------------------------------------------------
+# MatrizReglas (puntaje con NumPy) contra el recorrido lineal con
+# evaluar_condicion() y contra IndiceBits: el ranking de /api/recomendar tiene
+# que ser el mismo con MOTOR_RECOMENDACION=numpy que con el motor de bits,
+# incluido el orden de los empates.
+# ------------------------------------------------------------------------------
+import random
+
+import pytest
+
+import aleatorias
+from motor.base_reglas import BaseReglas, Condicion, FactorInfo, HechoInfo
+from motor.condiciones import parsear_respuesta
+
+pytest.importorskip("numpy")
+
+
+def test_igual_que_recorrido_lineal():
+    for semilla in range(15):
+        rnd = random.Random(semilla)
+        base = aleatorias.base_aleatoria(rnd)
+        for _ in range(40):
+            respuestas = aleatorias.respuestas_aleatorias(rnd)
+            parseadas = aleatorias.parseadas(respuestas)
+            conteos = aleatorias.conteos(base, respuestas)
+            limite = rnd.choice([1, 5, 1000])
+            assert base.matriz.ranking(parseadas, limite) == aleatorias.ranking(conteos, limite), respuestas
+            assert base.matriz.ranking(parseadas, limite) == base.bits.ranking(parseadas, limite), respuestas
+
+
+def test_porcentajes_de_cada_hecho():
+    rnd = random.Random(3)
+    base = aleatorias.base_aleatoria(rnd)
+    for _ in range(40):
+        respuestas = aleatorias.respuestas_aleatorias(rnd)
+        esperados = {h: int(c * 100 / t) for h, c, t in aleatorias.conteos(base, respuestas)}
+        porcentajes = base.matriz.porcentajes(aleatorias.parseadas(respuestas))
+        assert {h: int(p) for h, p in zip(base.matriz.orden, porcentajes) if p} == esperados, respuestas
+
+
+def test_cotas_fuera_de_int64_y_hechos_sin_condiciones():
+    grande = "9" * 25
+    factores = [FactorInfo(1, "Altitud", "x")]
+    hechos = [HechoInfo(i, f"h{i}") for i in range(1, 6)]
+    condiciones = [
+        Condicion(1, 1, 1, ">=", grande, ""),
+        Condicion(2, 1, 2, "<=", grande, ""),
+        Condicion(3, 1, 3, "=", f"1-{grande}", ""),
+        Condicion(4, 1, 4, "=", "²-5", ""),
+        Condicion(5, 2, 4, "=", "x", ""),  # factor que no existe: cuenta en el total, nunca se cumple
+    ]
+    base = BaseReglas(factores, hechos, condiciones)
+    for respuesta in ["1500", grande, f">={grande}", f"<={grande}", "1-2", "²", ""]:
+        parseadas = {"altitud": parsear_respuesta(respuesta)}
+        conteos = aleatorias.conteos(base, {"altitud": respuesta})
+        assert base.matriz.ranking(parseadas, 5) == aleatorias.ranking(conteos, 5), respuesta
@@ -3,10 +3,15 @@ const vacio = document.getElementById('vacio');
 const contenedorTabla = document.getElementById('contenedorTabla');
 const tbody = document.getElementById('tbodyReglas');
 const filtro = document.getElementById('filtro');
+const btnMas = document.getElementById('btnMas');
 
-let reglas = [];   // cache local para filtrar
-let mapFactores = {};
-let mapHechos = {};
+const TAMANO_PAGINA = 200;
+let reglas = [];   // páginas ya cargadas con el filtro actual
+let cursor = null; // X-Siguiente-Cursor de la última página, null si no hay más
+let filtroActual = new URLSearchParams(); // filtros de /reglas/expanded del cuadro de búsqueda
+let consulta = 0;  // descarta respuestas de búsquedas que ya se reemplazaron
+let mapFactores = null;  // se cargan solo al abrir el formulario de crear/editar
+let mapHechos = null;
 
 function renderTabla(data) {
     tbody.innerHTML = '';
@@ -27,66 +32,133 @@ function renderTabla(data) {
     });
 }
 
-function aplicarFiltro() {
-    const q = filtro.value.trim().toLowerCase();
-    if (!q) { renderTabla(reglas); return; }
-    const filtradas = reglas.filter(r => {
-    return (
-        String(r.id).includes(q) ||
-        String(r.factor_id).includes(q) ||
-        String(r.hecho_id).includes(q) ||
-        (r.factor || '').toLowerCase().includes(q) ||
-        (r.hecho || '').toLowerCase().includes(q) ||
-        (r.operador || '').toLowerCase().includes(q) ||
-        String(r.valor).toLowerCase().includes(q)
-    );
-    });
-    renderTabla(filtradas);
+// El filtro se aplica en el servidor, sobre todas las reglas y no solo las
+// páginas cargadas: "factor:<id o nombre>" y "hecho:<id>" filtran por factor o
+// hecho; el resto del texto es el prefijo del valor (sin mayúsculas).
+async function filtroDesdeTexto(texto) {
+    const params = new URLSearchParams();
+    const libre = [];
+    for (const parte of texto.trim().split(/\s+/).filter(Boolean)) {
+        const [campo, ...resto] = parte.split(':');
+        const valor = resto.join(':');
+        if (campo.toLowerCase() === 'hecho' && /^\d+$/.test(valor)) {
+            params.set('hecho_id', valor);
+        } else if (campo.toLowerCase() === 'factor' && valor) {
+            if (/^\d+$/.test(valor)) {
+                params.set('factor_id', valor);
+            } else {
+                await cargarCatalogos();
+                const id = Object.keys(mapFactores).find(k => mapFactores[k] === valor.toLowerCase());
+                params.set('factor_id', id ?? '0');  // factor inexistente: sin resultados
+            }
+        } else {
+            libre.push(parte);
+        }
+    }
+    if (libre.length) params.set('valor', libre.join(' '));
+    return params;
 }
 
-filtro.addEventListener('input', aplicarFiltro);
+// lo mismo que filtrar_reglas en el servidor, para reglas creadas o editadas aquí
+function cumpleFiltro(r) {
+    const factorId = filtroActual.get('factor_id');
+    const hechoId = filtroActual.get('hecho_id');
+    const operador = filtroActual.get('operador');
+    const valor = filtroActual.get('valor');
+    return (factorId === null || String(r.factor_id) === factorId)
+        && (hechoId === null || String(r.hecho_id) === hechoId)
+        && (operador === null || r.operador === operador)
+        && (valor === null || (r.valor || '').toLowerCase().startsWith(valor.toLowerCase()));
+}
 
-async function cargarReglas() {
-    try {
-        const [respReglas, respFactores, respHechos] = await Promise.all([
-            fetch('/reglas'),
-            fetch('/factores'),
-            fetch('/hechos')
-        ]);
-        if (!respReglas.ok) throw new Error('Error al cargar reglas');
-
-        const dataReglas = await respReglas.json();
-        const dataFactores = respFactores.ok ? await respFactores.json() : [];
-        const dataHechos = respHechos.ok ? await respHechos.json() : [];
-
-        mapFactores = {};
-        dataFactores.forEach(f => { mapFactores[f.id] = f.nombre; });
-        mapHechos = {};
-        dataHechos.forEach(h => { mapHechos[h.id] = h.descripcion; });
-
-        reglas = (Array.isArray(dataReglas) ? dataReglas : []).map(r => ({
+let esperaFiltro = null;
+filtro.addEventListener('input', () => {
+    clearTimeout(esperaFiltro);
+    esperaFiltro = setTimeout(async () => {
+        filtroActual = await filtroDesdeTexto(filtro.value);
+        cargarReglas();
+    }, 300);
+});
+
+async function pedirPagina(despuesDe) {
+    const params = new URLSearchParams(filtroActual);
+    params.set('limit', TAMANO_PAGINA);
+    if (despuesDe) params.set('despues_de', despuesDe);
+    const resp = await fetch(`/reglas/expanded?${params}`);
+    if (!resp.ok) throw new Error('Error al cargar reglas');
+    const data = await resp.json();
+    return {
+        siguiente: resp.headers.get('X-Siguiente-Cursor'),
+        filas: (Array.isArray(data) ? data : []).map(r => ({
             ...r,
-            factor: mapFactores[r.factor_id] || 'N/A',
-            hecho: mapHechos[r.hecho_id] || 'N/A'
-        }));
+            factor: r.factor_nombre || 'N/A',
+            hecho: r.hecho_descripcion || 'N/A'
+        }))
+    };
+}
 
-        if (reglas.length === 0) {
-            vacio.classList.remove('d-none');
-            contenedorTabla.classList.add('d-none');
-        } else {
-            renderTabla(reglas);
-            contenedorTabla.classList.remove('d-none');
-            vacio.classList.add('d-none');
-        }
+function mostrarReglas() {
+    if (reglas.length === 0) {
+        vacio.classList.remove('d-none');
+        contenedorTabla.classList.add('d-none');
+    } else {
+        renderTabla(reglas);
+        contenedorTabla.classList.remove('d-none');
+        vacio.classList.add('d-none');
+    }
+    btnMas.classList.toggle('d-none', !cursor);
+}
+
+// primera página con el filtro actual (la paginación vuelve a empezar)
+async function cargarReglas() {
+    const esta = ++consulta;
+    try {
+        const pagina = await pedirPagina(null);
+        if (esta !== consulta) return;
+        reglas = pagina.filas;
+        cursor = pagina.siguiente;
+        mostrarReglas();
     } catch (e) {
         estado.className = 'alert alert-danger';
         estado.textContent = 'No se pudieron cargar las reglas. Verifica la API.';
         return;
     } finally {
-        estado.classList.add('d-none');
+        if (esta === consulta) estado.classList.add('d-none');
+    }
+}
+
+async function cargarMas() {
+    if (!cursor) return;
+    btnMas.disabled = true;
+    const esta = consulta;
+    try {
+        const pagina = await pedirPagina(cursor);
+        if (esta !== consulta) return;  // cambió el filtro mientras tanto
+        reglas = reglas.concat(pagina.filas);
+        cursor = pagina.siguiente;
+        mostrarReglas();
+    } catch (e) {
+        Swal.fire('Error', 'No se pudieron cargar más reglas', 'error');
+    } finally {
+        btnMas.disabled = false;
     }
 }
 
+async function cargarCatalogos() {
+    if (mapFactores && mapHechos) return;
+    const [respFactores, respHechos] = await Promise.all([
+        fetch('/factores/'),
+        fetch('/hechos/')
+    ]);
+    const dataFactores = respFactores.ok ? await respFactores.json() : [];
+    const dataHechos = respHechos.ok ? await respHechos.json() : [];
+
+    mapFactores = {};
+    dataFactores.forEach(f => { mapFactores[f.id] = f.nombre; });
+    mapHechos = {};
+    dataHechos.forEach(h => { mapHechos[h.id] = h.descripcion; });
+}
+
 async function eliminarRegla(id) {
     const regla = reglas.find(r => r.id === id);
     if (!regla) return;
@@ -121,14 +193,18 @@ async function eliminarRegla(id) {
     if (result.isConfirmed && result.value) {
         // Actualiza estado local y UI
         reglas = reglas.filter(r => r.id !== id);
-        // Si usas cargarReglas() en otros lados, podrías llamarla en lugar de aplicarFiltro()
-        aplicarFiltro();
+        mostrarReglas();
         Swal.fire('Eliminado', 'La regla fue eliminada correctamente.', 'success');
     }
 }
 
 
-cargarReglas();
+// regla devuelta por POST/PUT /reglas/ con los nombres de los catálogos, como las de /reglas/expanded
+function conNombres(r) {
+    const factor = mapFactores[r.factor_id];
+    const hecho = mapHechos[r.hecho_id];
+    return { ...r, factor_nombre: factor, hecho_descripcion: hecho, factor: factor || 'N/A', hecho: hecho || 'N/A' };
+}
 
 function buildOptions(map) {
     const entries = Object.entries(map).sort((a, b) => a[1].localeCompare(b[1]));
@@ -136,6 +212,7 @@ function buildOptions(map) {
 }
 
 async function crearRegla() {
+    await cargarCatalogos();
     await Swal.fire({
         title: 'Nueva regla',
         html: `
@@ -167,7 +244,13 @@ async function crearRegla() {
                 body: JSON.stringify(res.value)
             });
             if (!resp.ok) throw new Error('Error al crear regla');
-            await cargarReglas();
+            // la nueva tiene el id más alto: va al final del listado, se muestra
+            // ya si cumple el filtro y no quedan páginas por cargar (si no, al llegar a ella)
+            const nueva = conNombres(await resp.json());
+            if (!cursor && cumpleFiltro(nueva)) {
+                reglas.push(nueva);
+                mostrarReglas();
+            }
             Swal.fire('Listo', 'Regla creada', 'success');
         } catch (e) {
             Swal.fire('Error', 'No se pudo crear la regla', 'error');
@@ -178,6 +261,7 @@ async function crearRegla() {
 async function editarRegla(id) {
     const regla = reglas.find(r => r.id === id);
     if (!regla) return;
+    await cargarCatalogos();
     await Swal.fire({
         title: `Editar regla #${id}`,
         html: `
@@ -213,7 +297,13 @@ async function editarRegla(id) {
                 body: JSON.stringify(res.value)
             });
             if (!resp.ok) throw new Error('Error al actualizar');
-            await cargarReglas();
+            // se reemplaza la fila en su lugar, sin volver a la primera página
+            // (y se quita si ya no cumple el filtro)
+            const actualizada = conNombres(await resp.json());
+            reglas = cumpleFiltro(actualizada)
+                ? reglas.map(r => (r.id === id ? actualizada : r))
+                : reglas.filter(r => r.id !== id);
+            mostrarReglas();
             Swal.fire('Listo', 'Regla actualizada', 'success');
         } catch (e) {
             Swal.fire('Error', 'No se pudo actualizar la regla', 'error');
@@ -9,6 +9,7 @@ const resultadoEl = document.getElementById("resultado");
 let respuestas = {};
 let historial = [];
 let preguntaActual = null;
+let sesion = null;   // token del servidor: solo se aplican las respuestas nuevas
 
 function renderPregunta(pregunta) {
 preguntaActual = pregunta;
@@ -55,13 +56,15 @@ btnBack.disabled = historial.length === 0 && !respuestas[pregunta.id];
 
 async function cargarSiguientePregunta() {
 try {
-    const resp = await fetch("/api/pregunta-siguiente", {
+    const url = "/api/pregunta-siguiente" + (sesion ? "?sesion=" + encodeURIComponent(sesion) : "");
+    const resp = await fetch(url, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(respuestas)
     });
     if (!resp.ok) throw new Error("No se pudieron obtener preguntas");
     const data = await resp.json();
+    sesion = data.sesion || null;
     renderPregunta(data.pregunta);
 } catch (err) {
     console.error("API pregunta-siguiente error:", err);